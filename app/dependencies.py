@@ -1,49 +1,163 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from . import models, database, auth_utils
+from .cache import TTLCache
 from .config import settings
-from .database import SessionLocal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+# توکن -> شناسه کاربر؛ امضای یک توکن فقط یک بار بررسی می‌شود و نتیجه تا انقضای خود توکن
+# (حداکثر AUTH_TOKEN_CACHE_TTL) معتبر است. توکن نامعتبر هیچ‌وقت کش نمی‌شود.
+_token_cache = TTLCache(ttl=settings.AUTH_TOKEN_CACHE_TTL, maxsize=100_000)
+
+
+def _decode_user_id(token: str) -> int:
+    user_id = _token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
     try:
         payload = jwt.decode(token, auth_utils.SECRET_KEY, algorithms=[auth_utils.ALGORITHM])
         user_id: str = payload.get("sub")
         token_type: str = payload.get("type")
 
         if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+            raise _credentials_exception()
+        user_id = int(user_id)
+    except (JWTError, ValueError):
+        raise _credentials_exception()
+
+    expires_at = payload.get("exp")
+    ttl = settings.AUTH_TOKEN_CACHE_TTL if expires_at is None \
+        else min(settings.AUTH_TOKEN_CACHE_TTL, expires_at - time.time())
+    if ttl > 0:
+        _token_cache.set(token, user_id, ttl=ttl)
+    return user_id
 
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    user_id = _decode_user_id(token)
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+
+async def get_current_user_async(
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(database.get_async_db)
+):
+    """نسخه async برای روترهای async؛ کاربر در همان AsyncSession درخواست بارگذاری می‌شود"""
+    user_id = _decode_user_id(token)
+    user = await db.get(models.User, user_id)
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
 
-async def get_current_user_from_token(token: str):
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    اطلاعات حداقلی کاربر برای احراز هویت بدون ردیف ORM (هندشیک وب‌سوکت و get_current_user_id)؛
+    به Session وابسته نیست و می‌تواند کش شود. با تغییر پروفایل، سکه یا اعتبار کاربر باید باطل شود.
+    """
+    id: int
+    username: Optional[str]
+    display_name: Optional[str]
+    reputation: Optional[int]
+    coins: Optional[int]
+
+
+# تغییرات همین پردازه فوراً باطل می‌شوند و بقیه Workerها حداکثر AUTH_USER_CACHE_TTL ثانیه قدیمی می‌مانند
+_user_cache = TTLCache(ttl=settings.AUTH_USER_CACHE_TTL, maxsize=100_000)
+_user_lookups: Dict[int, asyncio.Future] = {}
+
+
+async def _load_user_snapshot(user_id: int) -> Optional[UserSnapshot]:
+    user = models.User
+    async with database.AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(user.id, user.username, user.display_name, user.reputation, user.coins)
+            .where(user.id == user_id)
+        )).first()
+    return UserSnapshot(*row) if row else None
+
+
+async def get_current_user_from_token(token: str) -> Optional[UserSnapshot]:
+    """
+    احراز هویت هندشیک وب‌سوکت بدون بلاک کردن Event Loop.
+    کاربر از کش خوانده می‌شود و در صورت نبودن با AsyncSession بارگذاری می‌شود؛ هندشیک‌های همزمان
+    یک کاربر (مثلاً چند دستگاه بعد از دیپلوی) فقط یک کوئری می‌زنند.
+    """
     try:
-        # ۱. رمزگشایی توکن
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
+        user_id = _decode_user_id(token)
+    except HTTPException:
+        return None
+    return await get_user_snapshot(user_id)
 
-        # ۲. چک کردن در دیتابیس
-        db = SessionLocal()
-        user = db.query(models.User).filter(models.User.id == int(user_id)).first()
-        db.close()
 
-        return user
-    except (JWTError, ValueError):
-        return None
\ No newline at end of file
+async def get_user_snapshot(user_id: int) -> Optional[UserSnapshot]:
+    """خواندن کاربر از کش با یک کوئری مشترک برای درخواست‌های همزمان؛ اگر کاربر نباشد None"""
+    snapshot = _user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    pending = _user_lookups.get(user_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.get_running_loop().create_future()
+    _user_lookups[user_id] = pending
+    try:
+        snapshot = await _load_user_snapshot(user_id)
+        if snapshot is not None:
+            _user_cache.set(user_id, snapshot)
+        pending.set_result(snapshot)
+    except Exception as exc:
+        pending.set_exception(exc)
+        pending.exception()  # منتظرهای احتمالی خطا را می‌گیرند؛ اینجا فقط «دیده شده» علامت می‌خورد
+        raise
+    finally:
+        _user_lookups.pop(user_id, None)
+    return snapshot
+
+
+def invalidate_user_snapshot(user_id: int):
+    """بعد از commit تغییر پروفایل، سکه یا اعتبار کاربر صدا زده می‌شود تا درخواست بعدی اطلاعات تازه را بخواند"""
+    _user_cache.pop(user_id)
+
+
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    """
+    فقط شناسه کاربر برای روت‌هایی که به ردیف ORM نیاز ندارند؛ نه Session باز می‌کند و نه در حالت گرم کوئری می‌زند.
+    وجود کاربر از کش UserSnapshot بررسی می‌شود.
+    """
+    user_id = _decode_user_id(token)
+    if await get_user_snapshot(user_id) is None:
+        raise _credentials_exception()
+    return user_id
+
+
+async def get_admin_user(current_user_id: int = Depends(get_current_user_id)) -> UserSnapshot:
+    """فقط کاربرانی که شناسه‌شان در ADMIN_USER_IDS است"""
+    if current_user_id not in settings.ADMIN_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="فقط مدیران به این بخش دسترسی دارند")
+    return await get_user_snapshot(current_user_id)
@@ -1,17 +1,44 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .config import settings
 from .database import engine
 from . import models
 from .routers import auth, promises, users, notifications, websocket, messages, store
+from .services import message_search
+from .services.direct_messages import writer as message_writer
+from .services.deadline_scheduler import scheduler
+from .services.notification_coalescer import coalescer as notification_coalescer
+from .managers.notifications_manager import manager
 
 # ۱. ایجاد جداول دیتابیس (اگر از Alembic استفاده نمی‌کنی)
 models.Base.metadata.create_all(bind=engine)
+# جدول ایندکس متن کامل پیام‌ها (FTS5 / tsvector) خارج از متادیتای ORM ساخته می‌شود
+message_search.ensure_schema(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # کارهای پس‌زمینه که همراه سرور بالا و پایین می‌آیند
+    await manager.start()  # Subscribe به Pub/Sub برای تحویل پیام‌های وب‌سوکت سایر پردازه‌ها
+    await message_writer.start()  # ذخیره دسته‌ای پیام‌های مستقیم وب‌سوکت
+    await notification_coalescer.start()  # ادغام و ارسال دوره‌ای نوتیفیکیشن‌های تایید و اقتباس
+    if settings.DEADLINE_SCHEDULER_ENABLED:
+        await scheduler.start()
+    yield
+    await scheduler.stop()
+    await message_writer.stop()  # پیام‌های منتظر قبل از بستن سوکت‌ها نوشته و تایید می‌شوند
+    await notification_coalescer.stop()
+    await manager.stop()
+
 
 app = FastAPI(
     title="VaqtGhol API",
     description="Backend for the social habit-tracking app",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # ۲. تنظیمات CORS
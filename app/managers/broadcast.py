@@ -0,0 +1,120 @@
+import asyncio
+import json
+import uuid
+from typing import AsyncIterator, Iterable, Optional, Set, Tuple
+
+# لایه Pub/Sub بین پردازه‌ها برای ارسال آنی وب‌سوکت
+#
+# هر پردازه فقط در کانال کاربرانی Subscribe می‌کند که سوکتشان روی همان پردازه باز است
+# (جدول مسیریابی همان لیست Subscriptionهای هر پردازه در سرور Pub/Sub است)؛ بنابراین یک پیام فقط به
+# پردازه‌ای می‌رسد که سوکت کاربر را نگه داشته و بقیه Workerها اصلاً آن را نمی‌بینند.
+#   - memory: داخل همین پردازه (توسعه و یک Worker)
+#   - redis: PUBLISH/SUBSCRIBE ردیس (یا هر سرور سازگار با پروتکل ردیس) برای چند Worker و چند سرور
+
+
+def user_channel(user_id: int) -> str:
+    return f"ws:user:{user_id}"
+
+
+class BroadcastBackend:
+    """رابط مشترک Backendها؛ پیام‌ها dict هستند و به صورت JSON منتقل می‌شوند"""
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def disconnect(self):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+    async def publish_many(self, messages: Iterable[Tuple[str, dict]]):
+        """انتشار تعداد زیادی پیام (مثلاً ارسال گروهی)؛ Backendها می‌توانند آن را در یک رفت‌وبرگشت بفرستند"""
+        for channel, message in messages:
+            await self.publish(channel, message)
+
+    def listen(self) -> AsyncIterator[Tuple[str, dict]]:
+        raise NotImplementedError
+
+
+class InMemoryBroadcast(BroadcastBackend):
+    def __init__(self):
+        self._channels: Set[str] = set()
+        self._queue: Optional[asyncio.Queue] = None
+
+    async def connect(self):
+        self._queue = asyncio.Queue()
+
+    async def disconnect(self):
+        self._queue = None
+        self._channels.clear()
+
+    async def subscribe(self, channel: str):
+        self._channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self._channels.discard(channel)
+
+    async def publish(self, channel: str, message: dict):
+        # مثل ردیس سریال‌سازی می‌کنیم تا پیام غیرقابل ارسال در توسعه هم همان‌جا خطا بدهد
+        data = json.dumps(message)
+        if self._queue is not None and channel in self._channels:
+            self._queue.put_nowait((channel, data))
+
+    async def listen(self) -> AsyncIterator[Tuple[str, dict]]:
+        while self._queue is not None:
+            channel, data = await self._queue.get()
+            yield channel, json.loads(data)
+
+
+class RedisBroadcast(BroadcastBackend):
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._pubsub = None
+        # کانال مخصوص همین پردازه؛ هم برای پیام‌های کنترلی و هم تا PubSub هیچ‌وقت بدون Subscription نماند
+        self.node_channel = f"ws:node:{uuid.uuid4().hex}"
+
+    async def connect(self):
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.node_channel)
+
+    async def disconnect(self):
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self._redis.aclose()
+
+    async def subscribe(self, channel: str):
+        await self._pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str):
+        await self._pubsub.unsubscribe(channel)
+
+    async def publish(self, channel: str, message: dict):
+        await self._redis.publish(channel, json.dumps(message))
+
+    async def publish_many(self, messages: Iterable[Tuple[str, dict]]):
+        # همه PUBLISHها در یک Pipeline بدون تراکنش: یک رفت‌وبرگشت به ازای هر دسته
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for channel, message in messages:
+                pipe.publish(channel, json.dumps(message))
+            await pipe.execute()
+
+    async def listen(self) -> AsyncIterator[Tuple[str, dict]]:
+        async for item in self._pubsub.listen():
+            if item["type"] == "message":
+                yield item["channel"], json.loads(item["data"])
+
+
+def create_backend(name: str, redis_url: str) -> BroadcastBackend:
+    if name == "redis":
+        return RedisBroadcast(redis_url)
+    return InMemoryBroadcast()
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict, deque
+from itertools import count
+from typing import Awaitable, Callable, Optional, Sequence
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# سیاست‌های پر شدن صف ارسال هر اتصال
+DROP_OLDEST = "drop_oldest"  # قدیمی‌ترین پیام در صف دور ریخته می‌شود
+COALESCE = "coalesce"  # پیام هم‌کلید (type + link_id) جایگزین پیام قبلی در صف می‌شود، وگرنه مثل drop_oldest
+DISCONNECT = "disconnect"  # کلاینت کند قطع می‌شود تا دوباره وصل شود و عقب‌افتادگی را از API بخواند
+OVERFLOW_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+
+class SendMetrics:
+    """شمارنده‌های مشترک همه اتصالات یک پردازه"""
+
+    def __init__(self, window: int = 1024):
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_disconnects = 0
+        self.send_errors = 0
+        self.idle_evictions = 0  # سوکت‌هایی که به PING جواب ندادند (اتصال نیمه‌باز)
+        self.limit_evictions = 0  # قدیمی‌ترین سوکت کاربری که از سقف اتصال هر کاربر گذشت
+        self.rejected_connections = 0  # اتصال‌های ردشده به خاطر سقف کل اتصالات
+        self._latencies = deque(maxlen=window)  # زمان از ورود به صف تا پایان ارسال (ثانیه)
+
+    def observe(self, latency: float):
+        self.sent += 1
+        self._latencies.append(latency)
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "slow_disconnects": self.slow_disconnects,
+            "send_errors": self.send_errors,
+            "idle_evictions": self.idle_evictions,
+            "limit_evictions": self.limit_evictions,
+            "rejected_connections": self.rejected_connections,
+            "send_latency_p50_ms": percentile(0.50),
+            "send_latency_p95_ms": percentile(0.95),
+            "send_latency_p99_ms": percentile(0.99),
+        }
+
+
+class ClientConnection:
+    """
+    یک سوکت باز با صف خروجی محدود و Task نویسنده مخصوص خودش.
+    enqueue هیچ‌وقت منتظر شبکه نمی‌ماند، پس یک کلاینت کند فقط صف خودش را پر می‌کند
+    و تحویل به بقیه دستگاه‌های کاربر یا بقیه کاربران را کند نمی‌کند.
+    """
+
+    def __init__(self, user_id: int, websocket: WebSocket, max_queue: int, policy: str, send_timeout: float,
+                 metrics: SendMetrics, on_close: Callable[["ClientConnection"], Awaitable[None]]):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {policy}")
+        self.user_id = user_id
+        self.websocket = websocket
+        self._max_queue = max_queue
+        self._policy = policy
+        self._send_timeout = send_timeout
+        self._metrics = metrics
+        self._on_close = on_close
+        self._queue: "OrderedDict[object, tuple]" = OrderedDict()  # key -> (message, enqueued_at)
+        self._sequence = count()
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._close_task: Optional[asyncio.Task] = None
+        self.closed = False
+        # آخرین باری که چیزی از کلاینت رسید و آخرین PINGی که برایش فرستاده شد (time.monotonic)
+        self.last_seen = time.monotonic()
+        self.pinged_at = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def touch(self):
+        """بعد از هر فریم دریافتی (پیام، PONG یا هر چیز دیگر) صدا زده می‌شود"""
+        self.last_seen = time.monotonic()
+
+    def ping(self, now: float):
+        self.pinged_at = now
+        self.enqueue({"type": "PING"})
+
+    def approximate_memory(self) -> int:
+        """تخمین سطحی حافظه این اتصال (شیء، سوکت، صف و پیام‌های منتظر) برای گزارش؛ دقیق نیست ولی روند را نشان می‌دهد"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__) + sys.getsizeof(self._queue)
+        size += sys.getsizeof(self.websocket) + sys.getsizeof(getattr(self.websocket, "__dict__", {}))
+        size += sum(sys.getsizeof(message) for message, _ in self._queue.values())
+        if self._writer is not None:
+            size += sys.getsizeof(self._writer)
+        return size
+
+    def start(self, backlog: Sequence[dict] = ()):
+        """
+        شروع Task نویسنده. backlog (نوتیفیکیشن‌های بازپخش‌شده) جلوتر از پیام‌های زنده‌ای فرستاده می‌شود
+        که از لحظه ثبت اتصال تا اینجا در صف جمع شده‌اند. در تکرار، نسخه زنده می‌ماند و نسخه بازپخش حذف می‌شود،
+        چون ممکن است بعد از کوئری بازپخش ساخته شده باشد (مثلاً نوتیفیکیشن ادغام‌شده‌ای که replaces_id دارد).
+        """
+        if backlog:
+            live = list(self._queue.items())
+            superseded = set()
+            for _, (message, _) in live:
+                superseded.update(message.get(field) for field in ("id", "replaces_id"))
+            superseded.discard(None)
+            now = time.perf_counter()
+            self._queue = OrderedDict(
+                (("replay", index), (message, now)) for index, message in enumerate(backlog)
+                if message.get("id") not in superseded
+            )
+            self._queue.update(live)
+            self._ready.set()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def _key(self, message: dict):
+        # فقط رویدادهایی که به یک موضوع مشخص اشاره می‌کنند (link_id) قابل ادغام‌اند؛ پیام‌های چت هیچ‌وقت ادغام نمی‌شوند
+        if self._policy == COALESCE and message.get("link_id") is not None:
+            return "coalesce", message.get("type"), message.get("link_id")
+        return next(self._sequence)
+
+    def enqueue(self, message: dict):
+        if self.closed:
+            return
+        key = self._key(message)
+        if key in self._queue:
+            # نسخه جدیدتر همان رویداد جایگزین نسخه منتظر می‌شود (جایش در صف حفظ می‌شود)
+            self._queue[key] = (message, self._queue[key][1])
+            self._metrics.coalesced += 1
+            return
+
+        if len(self._queue) >= self._max_queue:
+            if self._policy == DISCONNECT:
+                self._metrics.slow_disconnects += 1
+                self._schedule_close()
+                return
+            self._queue.popitem(last=False)
+            self._metrics.dropped += 1
+
+        self._queue[key] = (message, time.perf_counter())
+        self._ready.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    _, (message, enqueued_at) = self._queue.popitem(last=False)
+                    await asyncio.wait_for(self.websocket.send_json(message), self._send_timeout)
+                    self._metrics.observe(time.perf_counter() - enqueued_at)
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # سوکت مرده یا ارسال بیش از send_timeout طول کشید؛ اتصال جمع می‌شود
+            self._metrics.send_errors += 1
+            logger.info("closing broken websocket of user %s", self.user_id, exc_info=True)
+            self._schedule_close()
+
+    def _schedule_close(self):
+        if self._close_task is None:
+            self._close_task = asyncio.create_task(self.close())
+
+    async def close(self):
+        """بستن سوکت و حذف از Manager؛ چند بار صدا زدن بی‌خطر است"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+        await self._on_close(self)
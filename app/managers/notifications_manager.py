@@ -1,26 +1,225 @@
-from fastapi import WebSocket
-from typing import Dict, List
+import asyncio
+import logging
+import time
+from fastapi import WebSocket, status
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config import settings
+from .broadcast import BroadcastBackend, create_backend, user_channel
+from .connection import ClientConnection, SendMetrics
+
+logger = logging.getLogger(__name__)
+
 
 class ConnectionManager:
-    def __init__(self):
-        # ذخیره اتصالات فعال: {user_id: [websocket1, websocket2]}
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+    def __init__(self, backend: Optional[BroadcastBackend] = None):
+        # ذخیره اتصالات فعال همین پردازه: {user_id: [connection1, connection2]}
+        # هر اتصال صف خروجی و Task نویسنده خودش را دارد (app/managers/connection.py)
+        self.active_connections: Dict[int, List[ClientConnection]] = {}
+        self.backend = backend or create_backend(settings.BROADCAST_BACKEND, settings.REDIS_URL)
+        self.metrics = SendMetrics()
+        self._subscribed: Set[int] = set()
+        self._subscription_lock: Optional[asyncio.Lock] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._sweeper: Optional[asyncio.Task] = None
+        # کانال‌های مشترک همه پردازه‌ها (مثل تغییرات کاتالوگ) -> تابع async که پیام را پردازش می‌کند
+        self._handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self._handler_tasks: Set[asyncio.Task] = set()
+        self.connection_count = 0
+
+    async def start(self):
+        """اتصال به Backend و شروع دریافت پیام‌ها و پاکسازی اتصالات مرده (در lifespan اپلیکیشن)"""
+        self._subscription_lock = asyncio.Lock()
+        await self.backend.connect()
+        for channel in self._handlers:
+            await self.backend.subscribe(channel)
+        self._listener = asyncio.create_task(self._listen())
+        self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                await connection.close()
+        for task in (self._listener, self._sweeper):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._listener = self._sweeper = None
+        await self.backend.disconnect()
+        self._subscribed.clear()
 
-    async def connect(self, user_id: int, websocket: WebSocket):
-        await websocket.accept()
+    def add_handler(self, channel: str, handler: Callable[[dict], Awaitable[None]]):
+        """
+        ثبت یک کانال که همه پردازه‌ها در آن Subscribe می‌کنند (قبل از start، معمولاً هنگام import ماژول).
+        هر پیام در یک Task جدا پردازش می‌شود تا تحویل پیام‌های وب‌سوکت پشت آن منتظر نماند.
+        """
+        self._handlers[channel] = handler
+
+    async def publish(self, channel: str, message: dict):
+        """انتشار روی یکی از کانال‌های add_handler برای همه پردازه‌ها (از جمله همین پردازه)"""
+        await self.backend.publish(channel, message)
+
+    async def connect(self, user_id: int, websocket: WebSocket, start: bool = True) -> Optional[ClientConnection]:
+        """
+        پذیرفتن سوکت و ثبت آن؛ اگر سقف کل اتصالات پر باشد سوکت رد می‌شود و None برمی‌گردد
+        (کلاینت با تاخیر دوباره تلاش می‌کند یا Load Balancer آن را به پردازه دیگری می‌فرستد).
+        با start=False پیام‌های زنده فقط در صف جمع می‌شوند تا فراخواننده بعد از بازپخش connection.start را صدا بزند.
+        """
+        if self.connection_count >= settings.WS_MAX_CONNECTIONS:
+            self.metrics.rejected_connections += 1
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+            return None
+        # جای اتصال قبل از اولین await رزرو می‌شود تا اتصال‌های همزمان نتوانند با هم از سقف رد شوند
+        self.connection_count += 1
+
+        try:
+            # اتصال اضافه کاربر جای قدیمی‌ترین سوکتش را می‌گیرد (معمولاً همان اتصال نیمه‌باز قبل از قطعی شبکه)
+            existing = self.active_connections.get(user_id, ())
+            overflow = len(existing) - settings.WS_MAX_CONNECTIONS_PER_USER + 1
+            for oldest in list(existing)[:max(overflow, 0)]:
+                self.metrics.limit_evictions += 1
+                await oldest.close()
+
+            await websocket.accept()
+            connection = ClientConnection(
+                user_id, websocket,
+                max_queue=settings.WS_SEND_QUEUE_SIZE,
+                policy=settings.WS_OVERFLOW_POLICY,
+                send_timeout=settings.WS_SEND_TIMEOUT,
+                metrics=self.metrics,
+                on_close=self._remove
+            )
+        except BaseException:
+            # دست‌دادن ناموفق (یا لغو شده)؛ جای رزروشده آزاد می‌شود
+            self.connection_count -= 1
+            raise
+        if start:
+            connection.start()
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+        self.active_connections[user_id].append(connection)
+        await self._sync_subscription(user_id)
+        return connection
+
+    async def disconnect(self, user_id: int, websocket: WebSocket):
+        for connection in list(self.active_connections.get(user_id, ())):
+            if connection.websocket is websocket:
+                await connection.close()
 
-    def disconnect(self, user_id: int, websocket: WebSocket):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
+    async def _remove(self, connection: ClientConnection):
+        # بعد از بسته شدن اتصال (قطع توسط کلاینت، خطای ارسال یا کندی بیش از حد) صدا زده می‌شود
+        connections = self.active_connections.get(connection.user_id)
+        if connections is not None:
+            if connection in connections:
+                connections.remove(connection)
+                self.connection_count -= 1
+            if not connections:
+                del self.active_connections[connection.user_id]
+        await self._sync_subscription(connection.user_id)
+
+    def stats(self, memory_sample: int = 200) -> dict:
+        connections = [c for user_connections in self.active_connections.values() for c in user_connections]
+        depths = [c.queue_depth for c in connections]
+        # حافظه هر اتصال از روی یک نمونه محدود تخمین زده می‌شود تا گزارش با تعداد اتصالات کند نشود
+        sample = connections[:memory_sample]
+        per_connection = sum(c.approximate_memory() for c in sample) // len(sample) if sample else 0
+        return {
+            "users": len(self.active_connections),
+            "connections": len(connections),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "memory_per_connection_bytes": per_connection,
+            "connections_memory_bytes": per_connection * len(connections),
+            **self.metrics.snapshot(),
+        }
+
+    async def sweep(self) -> int:
+        """
+        یک دور پاکسازی: به سوکت‌های ساکت PING می‌فرستد و سوکت‌هایی که تا WS_PONG_TIMEOUT بعد از PING
+        جوابی نداده‌اند یکجا می‌بندد. تعداد اتصالات بسته‌شده را برمی‌گرداند.
+        مهلت از لحظه واقعی ارسال PING (pinged_at) حساب می‌شود، نه از آخرین فریم، چون PING ممکن است
+        تا WS_SWEEP_INTERVAL دیرتر از WS_PING_INTERVAL فرستاده شود.
+        """
+        now = time.monotonic()
+        stale = []
+        for user_connections in self.active_connections.values():
+            for connection in user_connections:
+                if connection.pinged_at >= connection.last_seen:
+                    # PING فرستاده شده و بعد از آن هیچ فریمی نرسیده
+                    if now - connection.pinged_at > settings.WS_PONG_TIMEOUT:
+                        stale.append(connection)
+                elif now - connection.last_seen >= settings.WS_PING_INTERVAL:
+                    connection.ping(now)
+        if stale:
+            self.metrics.idle_evictions += len(stale)
+            await asyncio.gather(*(connection.close() for connection in stale), return_exceptions=True)
+        return len(stale)
+
+    async def _sweep_loop(self):
+        # یک Task برای همه اتصالات به جای یک تایمر برای هر سوکت
+        while True:
+            await asyncio.sleep(settings.WS_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("websocket sweep failed")
 
     async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                await connection.send_json(message)
+        # پیام به کانال کاربر منتشر می‌شود و فقط پردازه‌ای که سوکت او را دارد آن را دریافت می‌کند
+        await self.backend.publish(user_channel(user_id), message)
+
+    async def send_many(self, messages: Iterable[Tuple[int, dict]]):
+        """انتشار دسته‌ای (user_id, message)؛ کاربران آفلاین Subscriber ندارند و پیامشان جایی نمی‌رود"""
+        await self.backend.publish_many((user_channel(user_id), message) for user_id, message in messages)
+
+    async def _sync_subscription(self, user_id: int):
+        """
+        Subscription کانال کاربر را با وضعیت فعلی اتصالات او هماهنگ می‌کند.
+        تصمیم داخل قفل و بر اساس وضعیت همان لحظه گرفته می‌شود تا قطع و وصل سریع پشت سر هم
+        کاربر متصل را Unsubscribe نکند.
+        """
+        if self._subscription_lock is None:
+            return
+        async with self._subscription_lock:
+            wanted = user_id in self.active_connections
+            if wanted and user_id not in self._subscribed:
+                await self.backend.subscribe(user_channel(user_id))
+                self._subscribed.add(user_id)
+            elif not wanted and user_id in self._subscribed:
+                await self.backend.unsubscribe(user_channel(user_id))
+                self._subscribed.discard(user_id)
+
+    def _deliver(self, user_id: int, message: dict):
+        # فقط قرار دادن در صف هر اتصال (O(1))؛ ارسال واقعی در Task نویسنده همان اتصال انجام می‌شود
+        for connection in self.active_connections.get(user_id, ()):
+            connection.enqueue(message)
+
+    async def _handle(self, channel: str, message: dict):
+        try:
+            await self._handlers[channel](message)
+        except Exception:
+            logger.exception("handler for %s failed", channel)
+
+    async def _listen(self):
+        while True:
+            try:
+                async for channel, message in self.backend.listen():
+                    if channel.startswith("ws:user:"):
+                        self._deliver(int(channel.rsplit(":", 1)[1]), message)
+                    elif channel in self._handlers:
+                        task = asyncio.create_task(self._handle(channel, message))
+                        self._handler_tasks.add(task)
+                        task.add_done_callback(self._handler_tasks.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # قطع ارتباط با سرور Pub/Sub؛ کلاینت ردیس در تلاش بعدی دوباره وصل و Subscribe می‌شود
+                logger.exception("broadcast listener failed, retrying")
+            await asyncio.sleep(1)
+
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 import enum
@@ -55,11 +55,16 @@ class User(Base):
     bio = Column(String, nullable=True)
     is_onboarded = Column(Boolean, default=False)  # آیا مراحل اولیه را تکمیل کرده؟
 
-    reputation = Column(Integer, default=10)
+    reputation = Column(Integer, default=10, index=True)
     coins = Column(Integer, default=100)
     total_completed = Column(Integer, default=0)
     total_failed = Column(Integer, default=0)
 
+    # تعداد نوتیفیکیشن‌های خوانده‌نشده (Denormalized) برای Badge؛ با هر درج و خواندن نوتیفیکیشن به‌روز می‌شود
+    unread_notifications = Column(Integer, default=0, server_default="0", nullable=False)
+    # حالت خلاصه روزانه: رویدادهای ادغام‌پذیر (تایید، اقتباس) به جای نوتیفیکیشن آنی روزی یک بار خلاصه می‌شوند
+    notification_digest = Column(Boolean, default=False, server_default="0", nullable=False)
+
     reputation_multiplier = Column(Float, default=1.0)
     multiplier_expiry = Column(DateTime, nullable=True)
 
@@ -85,6 +90,11 @@ class Promise(Base):
     parent_id = Column(Integer, ForeignKey("promises.id"), nullable=True)
     visibility = Column(String, default="private")
 
+    # شمارنده‌های تعامل (Denormalized) - در همان تراکنش vouch/adopt به‌روز می‌شوند
+    # برای بازسازی: python -m app.services.counters
+    vouch_count = Column(Integer, default=0, server_default="0", nullable=False, index=True)
+    adoptions_count = Column(Integer, default=0, server_default="0", nullable=False)
+
     owner = relationship("User", back_populates="promises")
     validations = relationship("Validation", back_populates="promise", cascade="all, delete-orphan")
 
@@ -94,6 +104,26 @@ class Promise(Base):
     # همچنین اگر رابطه با لایک‌ها (Vouches) را هم تعریف نکردی، اضافه کن:
     vouches = relationship("Vouch", back_populates="promise", cascade="all, delete-orphan")
 
+    # ایندکس ترکیبی برای صفحه‌بندی Keyset فید (ORDER BY created_at DESC, id DESC)
+    __table_args__ = (
+        Index("ix_promises_created_at_id", "created_at", "id"),
+        # ترندینگ فقط روی قول‌های اصلی (parent_id IS NULL) و بر اساس تعداد اقتباس مرتب می‌شود
+        Index("ix_promises_parent_adoptions", "parent_id", "adoptions_count"),
+        # پیدا کردن قول‌های عقب‌افتاده: WHERE status = 'PENDING' AND deadline < now
+        Index("ix_promises_status_deadline", "status", "deadline"),
+        # قول‌های یک کاربر در پروفایل (آمار و صفحه‌بندی)
+        Index("ix_promises_user_created_at_id", "user_id", "created_at", "id"),
+    )
+
+
+class TrendingScore(Base):
+    # امتیاز ترند هر قول اصلی با کاهش نمایی (Forward Decay)
+    # مقدار به صورت لگاریتمی ذخیره می‌شود تا مقایسه امتیازها در هر زمانی معتبر بماند
+    __tablename__ = "trending_scores"
+    promise_id = Column(Integer, ForeignKey("promises.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False, index=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
 
 class Validation(Base):
     __tablename__ = "validations"
@@ -104,6 +134,11 @@ class Validation(Base):
 
     promise = relationship("Promise", back_populates="validations")
 
+    # هر کاربر فقط یک رای برای هر قول؛ ایندکس این قید جستجو بر اساس promise_id را هم پوشش می‌دهد
+    __table_args__ = (
+        UniqueConstraint("promise_id", "validator_id", name="uq_validations_promise_validator"),
+    )
+
 
 class NotificationType(str, enum.Enum):
     VOUCH_RECEIVED = "vouch_received"  # وقتی کسی قولت رو تایید می‌کنه
@@ -111,6 +146,7 @@ class NotificationType(str, enum.Enum):
     PROMISE_FAILED = "promise_failed"  # وقتی زمان قول تموم می‌شه و شکست می‌خوری
     SYSTEM_MESSAGE = "system_message"  # پیام‌های مدیر یا جوایز خاص
     REMINDER = "reminder"  # یادآوری برای ارسال گزارش
+    PROMISE_ADOPTED = "promise_adopted"  # وقتی کسی قولت رو برای خودش برمی‌داره (در PostgreSQL: ALTER TYPE ... ADD VALUE)
 
 
 class Notification(Base):
@@ -127,9 +163,71 @@ class Notification(Base):
 
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # تعداد رویدادهای ادغام‌شده در این نوتیفیکیشن (services/notification_coalescer.py)؛ برای بقیه ۱ است
+    event_count = Column(Integer, default=1, server_default="1", nullable=False)
 
     user = relationship("User", back_populates="notifications")
 
+    __table_args__ = (
+        # بازپخش بعد از اتصال دوباره وب‌سوکت: WHERE user_id = ? AND id > last_seen_id
+        Index("ix_notifications_user_id_id", "user_id", "id"),
+        # فید نوتیفیکیشن‌ها: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_notifications_user_id_created_at", "user_id", "created_at"),
+        # فقط نخوانده‌ها و «خواندن همه»: WHERE user_id = ? AND is_read = false
+        Index("ix_notifications_user_id_is_read", "user_id", "is_read"),
+        # ادغام، ردیف جدیدترین شناسه را حذف و دوباره می‌سازد؛ بدون AUTOINCREMENT در SQLite همان شناسه دوباره
+        # داده می‌شود و بازپخش (id > last_seen_id) نسخه ادغام‌شده را نمی‌بیند
+        {"sqlite_autoincrement": True},
+    )
+
+
+class NotificationArchive(Base):
+    # نوتیفیکیشن‌های خوانده‌شده قدیمی که کار نگهداری (services/retention.py) از جدول اصلی منتقل کرده است
+    __tablename__ = "notifications_archive"
+    id = Column(Integer, primary_key=True)  # همان شناسه ردیف اصلی
+    user_id = Column(Integer, index=True)
+    type = Column(Enum(NotificationType))
+    title = Column(String)
+    content = Column(String)
+    link_id = Column(Integer, nullable=True)
+    is_read = Column(Boolean, default=True)
+    created_at = Column(DateTime)
+    event_count = Column(Integer, default=1)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class NotificationDigestItem(Base):
+    # رویدادهای جمع‌شده کاربران حالت خلاصه روزانه تا ارسال خلاصه بعدی؛ برای هر (نوع، موضوع) یک ردیف شمارنده
+    __tablename__ = "notification_digest_items"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    type = Column(Enum(NotificationType), nullable=False)
+    link_id = Column(Integer, nullable=False)
+    subject = Column(String)  # عنوان موضوع (مثلاً عنوان قول) برای متن خلاصه
+    event_count = Column(Integer, default=0, nullable=False)
+    first_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "type", "link_id", name="uq_notification_digest_items_key"),
+    )
+
+
+class NotificationJob(Base):
+    # وضعیت و پیشرفت ارسال گروهی نوتیفیکیشن (services/bulk_notifications.py)؛
+    # در دیتابیس است تا از هر Worker قابل پیگیری باشد
+    __tablename__ = "notification_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    title = Column(String)
+    status = Column(String, default="pending")  # pending / running / done / failed
+    total = Column(Integer, default=0)  # تعداد گیرندگان
+    inserted = Column(Integer, default=0)  # نوتیفیکیشن‌های ذخیره‌شده تا این لحظه
+    pushed = Column(Integer, default=0)  # پیام‌های منتشرشده برای ارسال آنی
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
 
 
 class Comment(Base):
@@ -161,6 +259,12 @@ class Conversation(Base):
     last_message = Column(String)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow) # برای مرتب‌سازی لیست چت‌ها
 
+    # کلید یکتای هر جفت کاربر به شکل (کوچک‌تر، بزرگ‌تر) ذخیره می‌شود: user1_id < user2_id
+    # تا پیدا کردن گفتگو یک جستجوی مستقیم روی همین ایندکس باشد و دو Worker نتوانند گفتگوی تکراری بسازند
+    __table_args__ = (
+        UniqueConstraint("user1_id", "user2_id", name="uq_conversations_user_pair"),
+    )
+
 
 class DirectMessage(Base):
     __tablename__ = "direct_messages"
@@ -168,7 +272,7 @@ class DirectMessage(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
     sender_id = Column(Integer, ForeignKey("users.id"))
     content = Column(String)
-    is_read = Column(Boolean, default=False)
+    # وضعیت خوانده‌شدن دیگر به ازای هر پیام ذخیره نمی‌شود؛ ConversationParticipant.last_read_message_id را ببینید
 
     # فیلدهای جدید برای حرفه‌ای شدن
     is_edited = Column(Boolean, default=False)
@@ -177,6 +281,39 @@ class DirectMessage(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, onupdate=datetime.datetime.utcnow)
 
+    # کلید یکتایی ارسال (client_id پیام وب‌سوکت): پیامی که کلاینت بعد از قطع شدن بدون تایید دوباره بفرستد
+    # دوباره ذخیره نمی‌شود و همان ردیف قبلی تایید می‌شود (services/direct_messages.py)
+    client_id = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        # صفحه‌بندی Keyset تاریخچه: WHERE conversation_id = ? AND id < ? ORDER BY id DESC
+        Index("ix_direct_messages_conversation_id_id", "conversation_id", "id"),
+        UniqueConstraint("sender_id", "client_id", name="uq_direct_messages_sender_client"),
+    )
+
+
+class ConversationParticipant(Base):
+    # عضویت هر کاربر در یک گفتگو به همراه نشانگر خواندن (Watermark):
+    # همه پیام‌های با id <= last_read_message_id برای این کاربر خوانده شده‌اند
+    __tablename__ = "conversation_participants"
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    last_read_message_id = Column(Integer, default=0, server_default="0", nullable=False)
+
+    # اطلاعات اینباکس (Denormalized) - با هر دسته پیام جدید در chat.record_messages به‌روز می‌شوند
+    other_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    unread_count = Column(Integer, default=0, server_default="0", nullable=False)
+    last_message_id = Column(Integer, nullable=True)
+    last_message_preview = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("conversation_id", "user_id", name="uq_conversation_participants_conversation_user"),
+        # اینباکس: WHERE user_id = ? ORDER BY updated_at DESC
+        Index("ix_conversation_participants_user_updated_at", "user_id", "updated_at"),
+    )
+
 
 class StoreItem(Base):
     __tablename__ = "store_items"
@@ -0,0 +1,53 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+# ابزار صفحه‌بندی Keyset (Cursor-based)
+# کرسر برای کلاینت یک رشته مبهم است؛ داخلش فقط مقادیر ستون‌های مرتب‌سازی آخرین ردیف صفحه قرار دارد
+
+
+def encode_cursor(*values) -> str:
+    """تبدیل مقادیر کلید مرتب‌سازی (مثلاً created_at و id) به یک رشته امن برای URL"""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """بازگرداندن مقادیر داخل کرسر؛ در صورت دستکاری یا خراب بودن، خطای ۴۰۰ برمی‌گرداند"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError
+        return values
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="کرسر صفحه‌بندی نامعتبر است")
+
+
+def decode_time_cursor(cursor: str):
+    """کرسرهای (created_at, id) که در فیدها استفاده می‌شوند"""
+    created_at, row_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="کرسر صفحه‌بندی نامعتبر است")
+
+
+def decode_score_cursor(cursor: str):
+    """کرسرهای (score, id) نتایج رتبه‌بندی‌شده، مثلاً جستجوی پیام‌ها"""
+    score, row_id = decode_cursor(cursor, 2)
+    try:
+        return float(score), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="کرسر صفحه‌بندی نامعتبر است")
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """کرسرهای تک‌ستونی (id)، مثلاً برای تاریخچه پیام‌های یک گفتگو"""
+    row_id, = decode_cursor(cursor, 1)
+    if not isinstance(row_id, int):
+        raise HTTPException(status_code=400, detail="کرسر صفحه‌بندی نامعتبر است")
+    return row_id
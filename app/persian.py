@@ -0,0 +1,32 @@
+import re
+
+# یکسان‌سازی متن فارسی برای جستجو
+# کیبوردهای عربی «ي» و «ك» می‌فرستند، نیم‌فاصله گاهی هست و گاهی نیست و اعراب/کشیده در متن کاربر پیدا می‌شود؛
+# بدون یکسان‌سازی «کتاب‌ها» و «كتابها» دو کلمه متفاوت حساب می‌شوند.
+
+_CHAR_MAP = str.maketrans({
+    "ي": "ی", "ى": "ی", "ئ": "ی",
+    "ك": "ک",
+    "ة": "ه", "ۀ": "ه",
+    "أ": "ا", "إ": "ا", "ٱ": "ا",
+    "ؤ": "و",
+    "‌": "", "‍": "", "‎": "", "‏": "",  # نیم‌فاصله و نویسه‌های کنترلی جهت
+    "ـ": "",  # کشیده
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+
+# اعراب (فتحه، کسره، تنوین، تشدید، سکون و ...)
+_DIACRITICS = re.compile("[ً-ٰٟ]")
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """نسخه یکسان‌شده متن؛ هم هنگام ساخت ایندکس و هم روی عبارت جستجو اعمال می‌شود"""
+    if not text:
+        return ""
+    return _DIACRITICS.sub("", text.translate(_CHAR_MAP)).lower()
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(normalize(text))
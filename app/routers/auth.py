@@ -3,9 +3,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from ..database import get_db
 from .. import models, auth_utils, schemas
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, invalidate_user_snapshot
 from ..models import OTPCode, User, OTPType
 from ..services.notifier import Notifier
+from ..services import leaderboard
 
 router = APIRouter()
 
@@ -102,6 +103,7 @@ def verify_otp(identifier: str, code: str, db: Session = Depends(get_db)):
         db.add(user)
         db.commit()
         db.refresh(user)
+        leaderboard.sync_users(db, [user.id])
 
     db.delete(db_otp)
     db.commit()
@@ -137,4 +139,5 @@ def complete_onboarding(
     current_user.coins += 50
 
     db.commit()
+    invalidate_user_snapshot(current_user.id)
     return {"status": "success", "message": "ثبت‌نام شما با موفقیت تکمیل شد."}
\ No newline at end of file
@@ -1,82 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from ..database import get_async_db
 from .. import models, schemas
-from ..dependencies import get_current_user
-from ..models import User
+from ..dependencies import get_current_user_id
+from ..services import chat, message_search
 
 router = APIRouter()
 
 
-# ۱. دریافت لیست گفتگوها (اینباکس)
-@router.get("/inbox", response_model=List[schemas.ConversationResponse])
-def get_inbox(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    conversations = db.query(models.Conversation).filter(
-        (models.Conversation.user1_id == current_user.id) |
-        (models.Conversation.user2_id == current_user.id)
-    ).order_by(models.Conversation.updated_at.desc()).all()
-    return conversations
+# ۱. دریافت لیست گفتگوها (اینباکس) - جدیدترین گفتگوها اول، همراه با تعداد نخوانده‌ها
+@router.get("/inbox", response_model=schemas.InboxPage)
+async def get_inbox(
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_db),
+        current_user_id: int = Depends(get_current_user_id)
+):
+    return await db.run_sync(chat.get_inbox, current_user_id, cursor, limit)
 
 
-# ۲. دریافت تاریخچه پیام‌های یک گفتگوی خاص
-@router.get("/history/{conversation_id}", response_model=List[schemas.MessageResponse])
-def get_chat_history(
+# ۲. دریافت تاریخچه پیام‌های یک گفتگوی خاص (صفحه‌بندی Keyset روی id پیام)
+@router.get("/history/{conversation_id}", response_model=schemas.MessageHistoryPage)
+async def get_chat_history(
         conversation_id: int,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = Query(50, ge=1, le=200),
+        db: AsyncSession = Depends(get_async_db),
+        current_user_id: int = Depends(get_current_user_id)
 ):
-    # اول چک می‌کنیم که این گفتگو متعلق به این کاربر هست یا نه (امنیت)
-    conv = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
-    if not conv or (conv.user1_id != current_user.id and conv.user2_id != current_user.id):
-        raise HTTPException(status_code=403, detail="عدم دسترسی به این گفتگو")
-
-    messages = db.query(models.DirectMessage).filter(
-        models.DirectMessage.conversation_id == conversation_id
-    ).order_by(models.DirectMessage.created_at.asc()).all()
-
-    # علامت‌گذاری پیام‌ها به عنوان خوانده شده
-    db.query(models.DirectMessage).filter(
-        models.DirectMessage.conversation_id == conversation_id,
-        models.DirectMessage.sender_id != current_user.id
-    ).update({"is_read": True})
-    db.commit()
-
-    return messages
+    # بررسی عضویت، خواندن یک صفحه و جلو بردن Watermark خواندن در سرویس chat
+    return await db.run_sync(chat.get_history, conversation_id, current_user_id, before, after, limit)
 
 
 # ویرایش پیام
 @router.patch("/edit/{message_id}")
-def edit_message(message_id: int, new_content: str, current_user: User = Depends(get_current_user),
-                 db: Session = Depends(get_db)):
-    msg = db.query(models.DirectMessage).filter(models.DirectMessage.id == message_id).first()
-    if not msg or msg.sender_id != current_user.id:
+async def edit_message(message_id: int, new_content: str, current_user_id: int = Depends(get_current_user_id),
+                       db: AsyncSession = Depends(get_async_db)):
+    msg = await db.get(models.DirectMessage, message_id)
+    if not msg or msg.sender_id != current_user_id:
         raise HTTPException(status_code=403, detail="اجازه ویرایش ندارید")
 
     msg.content = new_content
     msg.is_edited = True
-    db.commit()
+    await db.run_sync(chat.update_preview, msg, new_content)
+    await db.run_sync(message_search.index_message, msg)
+    await db.commit()
     return {"status": "edited"}
 
 
 # حذف پیام (Soft Delete)
 @router.delete("/delete/{message_id}")
-def delete_message(message_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    msg = db.query(models.DirectMessage).filter(models.DirectMessage.id == message_id).first()
-    if not msg or msg.sender_id != current_user.id:
+async def delete_message(message_id: int, current_user_id: int = Depends(get_current_user_id),
+                         db: AsyncSession = Depends(get_async_db)):
+    msg = await db.get(models.DirectMessage, message_id)
+    if not msg or msg.sender_id != current_user_id:
         raise HTTPException(status_code=403, detail="اجازه حذف ندارید")
 
     msg.is_deleted = True  # متن پیام را نگه می‌داریم ولی نمایش نمی‌دهیم
-    db.commit()
+    await db.run_sync(chat.update_preview, msg, None)
+    await db.run_sync(message_search.remove_message, msg.id)
+    await db.commit()
     return {"status": "deleted"}
 
 
-# جستجو در پیام‌های یک گفتگو
-@router.get("/search/{conversation_id}")
-def search_messages(conversation_id: int, query: str, db: Session = Depends(get_db)):
-    results = db.query(models.DirectMessage).filter(
-        models.DirectMessage.conversation_id == conversation_id,
-        models.DirectMessage.content.contains(query),
-        models.DirectMessage.is_deleted == False
-    ).all()
-    return results
\ No newline at end of file
+# جستجو در پیام‌ها (ایندکس متن کامل، مرتب شده بر اساس میزان ارتباط)
+@router.get("/search", response_model=schemas.MessageSearchPage)
+async def search_all_messages(
+        query: str = Query(..., min_length=1),
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db)
+):
+    # فقط در گفتگوهایی که کاربر عضو آن‌هاست
+    return await db.run_sync(message_search.search_messages, current_user_id, query, None, cursor, limit)
+
+
+@router.get("/search/{conversation_id}", response_model=schemas.MessageSearchPage)
+async def search_messages(
+        conversation_id: int,
+        query: str = Query(..., min_length=1),
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db)
+):
+    return await db.run_sync(message_search.search_messages, current_user_id, query, conversation_id, cursor, limit)
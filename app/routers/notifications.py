@@ -1,32 +1,81 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
-from ..dependencies import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from ..database import get_async_db
+from ..dependencies import UserSnapshot, get_admin_user, get_current_user_id
 from .. import models, schemas
+from ..services import bulk_notifications, notification_service
 
 # این خط دقیقاً همان چیزی است که Uvicorn دنبالش می‌گردد:
 router = APIRouter()
 
 
-@router.get("/", response_model=List[schemas.NotificationResponse])
-def get_notifications(
-        current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db),
-        unread_only: bool = False
+# فید نوتیفیکیشن‌ها - جدیدترین اول با صفحه‌بندی Keyset
+@router.get("/", response_model=schemas.NotificationPage)
+async def get_notifications(
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db),
+        unread_only: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100)
 ):
-    query = db.query(models.Notification).filter(models.Notification.user_id == current_user.id)
-    if unread_only:
-        query = query.filter(models.Notification.is_read == False)
+    return await notification_service.get_feed(db, current_user_id, unread_only, cursor, limit)
 
-    return query.order_by(models.Notification.created_at.desc()).limit(50).all()
+
+# تعداد نخوانده‌ها برای Badge؛ از کش یا یک ستون ردیف کاربر، بدون شمردن نوتیفیکیشن‌ها
+@router.get("/unread-count", response_model=schemas.UnreadCount)
+async def get_unread_count(
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db)
+):
+    return {"unread": await notification_service.get_unread_count(db, current_user_id)}
 
 
 @router.post("/mark-all-read")
-def mark_all_as_read(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).update({"is_read": True})
-    db.commit()
-    return {"message": "تمام اعلان‌ها خوانده شد"}
\ No newline at end of file
+async def mark_all_as_read(
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db)
+):
+    await notification_service.mark_all_read(db, current_user_id)
+    return {"message": "تمام اعلان‌ها خوانده شد"}
+
+
+@router.post("/{notification_id}/read")
+async def mark_as_read(
+        notification_id: int,
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db)
+):
+    if not await notification_service.mark_read(db, current_user_id, notification_id):
+        raise HTTPException(status_code=404, detail="اعلان خوانده‌نشده‌ای با این شناسه پیدا نشد")
+    return {"message": "اعلان خوانده شد"}
+
+
+# ارسال گروهی (اطلاعیه سیستمی) - فقط مدیران؛ کار در پس‌زمینه اجرا می‌شود و پیشرفتش از روت بعدی خوانده می‌شود
+@router.post("/bulk", response_model=schemas.NotificationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_bulk_notification(
+        request: schemas.BulkNotificationCreate,
+        admin: UserSnapshot = Depends(get_admin_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    if (request.user_ids is None) == (request.audience is None):
+        raise HTTPException(status_code=400, detail="دقیقاً یکی از user_ids یا audience را بفرستید")
+
+    job = models.NotificationJob(created_by=admin.id, title=request.title, status="pending",
+                                 total=0, inserted=0, pushed=0)
+    db.add(job)
+    await db.commit()
+    bulk_notifications.start_job(job.id, request)
+    return job
+
+
+@router.get("/bulk/{job_id}", response_model=schemas.NotificationJobResponse)
+async def get_bulk_notification_job(
+        job_id: int,
+        admin: UserSnapshot = Depends(get_admin_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    job = await db.get(models.NotificationJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="کار ارسال گروهی پیدا نشد")
+    return job
@@ -1,80 +1,77 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
-from ..database import get_db
-from ..dependencies import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_, and_
+from typing import List, Optional
+from ..database import get_async_db
+from ..dependencies import get_current_user_id, invalidate_user_snapshot
+from ..pagination import encode_cursor, decode_time_cursor
 from .. import models, schemas, config
+from ..services import trending, leaderboard, vouching, profiles, notification_service
+from ..services.deadline_scheduler import scheduler
+from ..services.notification_coalescer import coalescer
 
 router = APIRouter()
 
 
-# ۱. دریافت لیست تمام قول‌ها (برای فید اصلی)
-@router.get("/", response_model=List[schemas.PromiseResponse])
-def get_promises(db: Session = Depends(get_db)):
-    # محاسبه تعداد تاییدها برای هر قول به صورت داینامیک
-    promises = db.query(models.Promise).all()
-    for p in promises:
-        p.vouch_count = db.query(models.Validation).filter(models.Validation.promise_id == p.id).count()
-    return promises
+# ۱. دریافت فید قول‌ها با صفحه‌بندی Keyset (جدیدترین‌ها اول)
+@router.get("/", response_model=schemas.PromiseFeedResponse)
+async def get_promises(
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_db)
+):
+    # تعداد تاییدها از ستون شمارنده خوانده می‌شود (بدون COUNT روی validations)
+    query = select(models.Promise)
+
+    if cursor:
+        last_created_at, last_id = decode_time_cursor(cursor)
+        query = query.where(or_(
+            models.Promise.created_at < last_created_at,
+            and_(models.Promise.created_at == last_created_at, models.Promise.id < last_id)
+        ))
+
+    # یک ردیف اضافه می‌خوانیم تا بفهمیم صفحه بعدی وجود دارد یا نه
+    rows = (await db.execute(
+        query.order_by(models.Promise.created_at.desc(), models.Promise.id.desc()).limit(limit + 1)
+    )).scalars().all()
+
+    items = rows[:limit]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return {"items": items, "next_cursor": next_cursor}
 
 
 # ۲. ثبت قول جدید
 @router.post("/", response_model=schemas.PromiseResponse)
-def create_promise(promise: schemas.PromiseCreate, current_user: models.User = Depends(get_current_user),
-                   db: Session = Depends(get_db)):
+async def create_promise(promise: schemas.PromiseCreate, current_user_id: int = Depends(get_current_user_id),
+                         db: AsyncSession = Depends(get_async_db)):
     new_promise = models.Promise(
         **promise.model_dump(),
-        user_id=current_user.id,
+        user_id=current_user_id,
         status=models.PromiseStatus.PENDING
     )
     db.add(new_promise)
-    db.commit()
-    db.refresh(new_promise)
+    await db.commit()
+    await db.refresh(new_promise)
+    scheduler.schedule(new_promise.id, new_promise.deadline)
+    profiles.invalidate_user_profile([current_user_id])
     return new_promise
 
 
-from sqlalchemy import func
-
-# app/routers/promises.py
-from sqlalchemy import func
-
-
 @router.get("/trending", response_model=List[schemas.TrendingPromiseResponse])
-def get_trending_promises(limit: int = 10, db: Session = Depends(get_db)):
-    # ۱. شمارش فرزندان برای هر پدر
-    subquery = db.query(
-        models.Promise.parent_id,
-        func.count(models.Promise.id).label("count")
-    ).filter(models.Promise.parent_id != None) \
-        .group_by(models.Promise.parent_id).subquery()
-
-    # ۲. گرفتن قول‌های اصلی (آن‌هایی که خودشان کپی نیستند) و اتصال به شمارشگر
-    query = db.query(
-        models.Promise,
-        func.coalesce(subquery.c.count, 0).label("adoptions_count")
-    ).outerjoin(
-        subquery, models.Promise.id == subquery.c.parent_id
-    ).filter(models.Promise.parent_id == None) \
-        .order_by(func.coalesce(subquery.c.count, 0).desc()) \
-        .limit(limit)
-
-    results = query.all()
-
-    # ۳. آماده‌سازی خروجی
-    output = []
-    for promise, count in results:
-        # اضافه کردن فیلد adoptions_count به شیء promise قبل از بازگشت
-        promise.adoptions_count = count
-        output.append(promise)
-
-    return output
+async def get_trending_promises(limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_async_db)):
+    # امتیازها از قبل و به صورت افزایشی محاسبه شده‌اند؛ اینجا فقط limit ردیف اول خوانده می‌شود
+    return await db.run_sync(trending.get_trending, limit)
 
 
 @router.get("/{promise_id}", response_model=schemas.PromiseDetailResponse)
-def get_promise_detail(promise_id: int, db: Session = Depends(get_db)):
+async def get_promise_detail(promise_id: int, db: AsyncSession = Depends(get_async_db)):
     # ۱. جستجوی قول
-    promise = db.query(models.Promise).filter(models.Promise.id == promise_id).first()
+    promise = await db.get(models.Promise, promise_id)
 
     if not promise:
         raise HTTPException(status_code=404, detail="این قول پیدا نشد یا حذف شده است")
@@ -89,15 +86,15 @@ from fastapi import APIRouter, Depends, HTTPException, status
 # ... سایر ایمپورت‌ها
 
 @router.patch("/{promise_id}")
-def update_promise(
+async def update_promise(
         promise_id: int,
         obj_in: schemas.PromiseUpdate,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_async_db),
+        current_user_id: int = Depends(get_current_user_id)
 ):
-    promise = db.query(models.Promise).filter(models.Promise.id == promise_id).first()
+    promise = await db.get(models.Promise, promise_id)
 
-    if not promise or promise.user_id != current_user.id:
+    if not promise or promise.user_id != current_user_id:
         raise HTTPException(status_code=403, detail="شما اجازه ویرایش این قول را ندارید")
 
     # قانون بیزینسی: اگر قول منقضی شده یا باخته شده، نباید ویرایش شود
@@ -105,46 +102,55 @@ def update_promise(
         raise HTTPException(status_code=400, detail="زمان این قول به پایان رسیده و قابل ویرایش نیست")
 
     # اعمال تغییرات
-    for field, value in obj_in.dict(exclude_unset=True).items():
+    changes = obj_in.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(promise, field, value)
 
-    db.commit()
+    await db.commit()
+
+    if "deadline" in changes and promise.status == models.PromiseStatus.PENDING:
+        scheduler.schedule(promise.id, promise.deadline)
+    profiles.invalidate_user_profile([current_user_id])
     return {"message": "قول شما با موفقیت به‌روزرسانی شد"}
 
 
 @router.delete("/{promise_id}")
-def delete_promise(
+async def delete_promise(
         promise_id: int,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_async_db),
+        current_user_id: int = Depends(get_current_user_id)
 ):
-    promise = db.query(models.Promise).filter(models.Promise.id == promise_id).first()
+    promise = await db.get(models.Promise, promise_id)
 
-    if not promise or promise.user_id != current_user.id:
+    if not promise or promise.user_id != current_user_id:
         raise HTTPException(status_code=403, detail="شما اجازه حذف این قول را ندارید")
 
     # قانون بیزینسی: اگر کسی برای این قول Vouch (تایید) گذاشته، دیگر نباید حذف شود (برای حفظ اعتبار شبکه)
-    vouch_exists = db.query(models.Vouch).filter(models.Vouch.promise_id == promise_id).first()
+    vouch_exists = (await db.execute(
+        select(models.Vouch.id).where(models.Vouch.promise_id == promise_id).limit(1)
+    )).first()
     if vouch_exists:
         raise HTTPException(status_code=400, detail="به دلیل وجود تاییدیه (Vouch) از سمت دیگران، این قول قابل حذف نیست")
 
-    db.delete(promise)
-    db.commit()
+    await db.delete(promise)
+    await db.commit()
+    scheduler.cancel(promise_id)
+    profiles.invalidate_user_profile([current_user_id])
     return {"message": "قول با موفقیت حذف شد"}
 
 
 # ۳. ارسال گزارش انجام قول (Text Evidence)
 @router.post("/{promise_id}/complete")
-def complete_promise(
+async def complete_promise(
         promise_id: int,
         report: str = "finish",
-        current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    promise = db.query(models.Promise).filter(
+    promise = (await db.execute(select(models.Promise).where(
         models.Promise.id == promise_id,
-        models.Promise.user_id == current_user.id
-    ).first()
+        models.Promise.user_id == current_user_id
+    ))).scalar_one_or_none()
 
     if not promise:
         raise HTTPException(status_code=404, detail="قولی پیدا نشد")
@@ -154,91 +160,64 @@ def complete_promise(
 
     promise.evidence_text = report
     promise.status = models.PromiseStatus.PENDING_APPROVAL
-    db.commit()
+    await db.commit()
+    scheduler.cancel(promise_id)
+    profiles.invalidate_user_profile([current_user_id])
     return {"message": "گزارش ثبت شد. منتظر تایید دوستان باش!"}
 
 
 # ۴. منطق تایید قول توسط دیگران (Vouch)
 @router.post("/{promise_id}/vouch")
-def vouch_promise(
+async def vouch_promise(
         promise_id: int,
-        current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    promise = db.query(models.Promise).filter(models.Promise.id == promise_id).first()
-
-    if not promise:
-        raise HTTPException(status_code=404, detail="قول پیدا نشد")
+    # منطق تراکنشی رای در سرویس sync نوشته شده و با run_sync روی همین AsyncSession اجرا می‌شود
+    result = await db.run_sync(vouching.cast_vouch, promise_id, current_user_id)
+    # نوتیفیکیشن تایید با بقیه تاییدهای همین قول ادغام و با تاخیر چندثانیه‌ای نوشته و ارسال می‌شود
+    coalescer.add(result.owner_id, models.NotificationType.VOUCH_RECEIVED, promise_id, result.title)
 
-    if promise.user_id == current_user.id:
-        raise HTTPException(status_code=400, detail="نمی‌تونی به قول خودت رای بدی!")
-
-    # چک کردن رای تکراری
-    existing_vouch = db.query(models.Validation).filter(
-        models.Validation.promise_id == promise_id,
-        models.Validation.validator_id == current_user.id
-    ).first()
-
-    if existing_vouch:
-        raise HTTPException(status_code=400, detail="قبلاً به این قول رای دادی")
-
-    # ثبت تایید جدید
-    new_vouch = models.Validation(promise_id=promise_id, validator_id=current_user.id)
-    db.add(new_vouch)
-
-    # شمارش تاییدها
-    total_vouches = db.query(models.Validation).filter(models.Validation.promise_id == promise_id).count()
-
-    # اگر تاییدها به حد نصاب (مثلاً ۳ نفر) رسید:
-    if total_vouches >= config.settings.VOUCH_THRESHOLD and promise.status == models.PromiseStatus.PENDING_APPROVAL:
-        promise.status = models.PromiseStatus.COMPLETED
-        # پاداش به صاحب قول
-        promise.owner.reputation += 10
-        promise.owner.coins += 50
-        promise.owner.total_completed += 1
-
-        # اطلاع‌رسانی به صاحب قول
-        notification = models.Notification(
-            user_id=promise.user_id,
-            content=f"تبریک! قول '{promise.title}' تایید نهایی شد و جایزه گرفتی.",
-            promise_id=promise.id
-        )
-        db.add(notification)
-
-    db.commit()
-    return {"message": "رای تایید شما ثبت شد", "current_vouches": total_vouches}
+    if result.completed:
+        await db.run_sync(leaderboard.sync_users, [result.owner_id])
+        profiles.invalidate_user_profile([result.owner_id])
+        invalidate_user_snapshot(result.owner_id)  # پاداش سکه و اعتبار
+        notification_service.invalidate_unread_counts([result.owner_id])
+    return {"message": "رای تایید شما ثبت شد", "current_vouches": result.vouch_count}
 
 
 @router.post("/{promise_id}/adopt")
-def adopt_promise(
+async def adopt_promise(
         promise_id: int,
         adoption_data: schemas.PromiseCreate,  # شامل ددلاین، پاداش و تنبیه جدید
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_async_db),
+        current_user_id: int = Depends(get_current_user_id)
 ):
     # ۱. پیدا کردن قول مرجع
-    original_promise = db.query(models.Promise).filter(models.Promise.id == promise_id).first()
+    original_promise = await db.get(models.Promise, promise_id)
     if not original_promise:
         raise HTTPException(status_code=404, detail="قول اصلی پیدا نشد")
 
-    # ۲. بررسی اینکه کاربر سکه کافی برای تنبیه (Stake) انتخابی دارد یا نه
-    # فرض می‌کنیم تنبیه را در قالب سکه (coin_stake) در مدل داریم
-    if current_user.coins < adoption_data.coin_stake:
-        raise HTTPException(status_code=400, detail="سکه کافی برای تعیین این تنبیه ندارید")
-
-    # ۳. ساخت قول جدید (کلون شده)
+    # ۲. ساخت قول جدید (کلون شده) با ددلاین، پاداش و تنبیه انتخابی کاربر
     new_promise = models.Promise(
-        user_id=current_user.id,
+        **adoption_data.model_dump(exclude={"title", "description"}),
+        user_id=current_user_id,
         parent_id=original_promise.id,  # ارجاع به قول اصلی
         title=original_promise.title,
         description=original_promise.description,
-        target_date=adoption_data.target_date,  # ددلاین جدید
-        reward_description=adoption_data.reward_description,  # پاداش جدید
-        coin_stake=adoption_data.coin_stake,  # تنبیه مالی جدید
-        status="active"
+        status=models.PromiseStatus.PENDING
     )
-
     db.add(new_promise)
-    db.commit()
 
-    return {"message": "چالش با موفقیت برای شما فعال شد!"}
\ No newline at end of file
+    # ۳. افزایش شمارنده اقتباس قول مرجع در همان تراکنش
+    original_promise.adoptions_count = models.Promise.adoptions_count + 1
+    await db.run_sync(trending.record_adoption, original_promise)
+
+    owner_id, title = original_promise.user_id, original_promise.title
+    await db.commit()
+    scheduler.schedule(new_promise.id, new_promise.deadline)
+    profiles.invalidate_user_profile([current_user_id])
+    if owner_id != current_user_id:
+        coalescer.add(owner_id, models.NotificationType.PROMISE_ADOPTED, promise_id, title)
+
+    return {"message": "چالش با موفقیت برای شما فعال شد!"}
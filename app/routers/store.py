@@ -2,32 +2,25 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..database import get_db
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, get_current_user_id, invalidate_user_snapshot
 from .. import models, schemas
+from ..services import catalog
 
 router = APIRouter()
 
 
-# ۱. لیست محصولات با قابلیت فیلتر بر اساس دسته و جستجوی متنی
-@router.get("/items", response_model=List[schemas.StoreItemResponse])
+# ۱. لیست محصولات با فیلتر دسته و جستجوی پیشوندی (Typeahead) از روی ایندکس کاتالوگ در حافظه
+@router.get("/items", response_model=schemas.StoreItemPage)
 def list_items(
         category: Optional[str] = None,
-        search: Optional[str] = Query(None, min_length=2),
+        search: Optional[str] = Query(None, min_length=1),
+        in_stock: bool = True,
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
         db: Session = Depends(get_db)
 ):
-    query = db.query(models.StoreItem).filter(models.StoreItem.stock > 0)
-
-    if category:
-        query = query.filter(models.StoreItem.category == category)
-
-    if search:
-        # جستجو در نام یا توضیحات
-        query = query.filter(
-            (models.StoreItem.name.contains(search)) |
-            (models.StoreItem.description.contains(search))
-        )
-
-    return query.all()
+    # با search مرتب بر اساس میزان تطابق، بدون آن بر اساس نام
+    return catalog.search_items(db, search, category, in_stock, cursor, limit)
 
 
 # ۲. خرید محصول
@@ -49,19 +42,27 @@ def buy_item(item_id: int, db: Session = Depends(get_db), current_user: models.U
     new_purchase = models.Purchase(
         user_id=current_user.id,
         item_id=item.id,
-        final_price=item.price,
         revealed_code=item.discount_code
     )
 
     db.add(new_purchase)
     db.commit()
     db.refresh(new_purchase)
+    invalidate_user_snapshot(current_user.id)
+
+    # موجودی جدید در ایندکس جستجوی همه Workerها (مثلاً حذف از نتایج «فقط موجودها» وقتی تمام شد)
+    catalog.items_changed(db, [item.id])
 
-    return new_purchase
+    return {
+        "id": new_purchase.id,
+        "item_name": item.name,
+        "purchased_at": new_purchase.purchased_at,
+        "revealed_code": new_purchase.revealed_code
+    }
 
 
 # ۳. تاریخچه خریدهای من
 @router.get("/my-purchases", response_model=List[schemas.PurchaseResponse])
-def get_purchase_history(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(models.Purchase).filter(models.Purchase.user_id == current_user.id).order_by(
+def get_purchase_history(current_user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    return db.query(models.Purchase).filter(models.Purchase.user_id == current_user_id).order_by(
         models.Purchase.purchased_at.desc()).all()
\ No newline at end of file
@@ -1,30 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from ..database import SessionLocal, get_async_db
 from .. import models, schemas
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user_async, get_current_user_id, invalidate_user_snapshot
+from ..services import leaderboard, profiles
 
 router = APIRouter()
 
 
 # --- ۱. دریافت اطلاعات پروفایل من ---
 @router.get("/me", response_model=schemas.UserFullProfile)
-def get_my_full_profile(current_user: models.User = Depends(get_current_user)):
+async def get_my_full_profile(current_user: models.User = Depends(get_current_user_async)):
     """مشاهده پروفایل کامل توسط خود کاربر (شامل اطلاعات حساس)"""
     return current_user
 
 
 @router.patch("/me")
-def update_my_profile(
+async def update_my_profile(
         obj_in: schemas.UserUpdate,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_async_db),
+        current_user: models.User = Depends(get_current_user_async)
 ):
     """ویرایش اطلاعات توسط کاربر"""
     # بررسی تکراری نبودن یوزرنیم جدید (اگر کاربر بخواهد یوزرنیم را عوض کند)
     if obj_in.username:
-        existing_user = db.query(models.User).filter(models.User.username == obj_in.username).first()
+        existing_user = (await db.execute(
+            select(models.User).where(models.User.username == obj_in.username)
+        )).scalar_one_or_none()
         if existing_user and existing_user.id != current_user.id:
             raise HTTPException(status_code=400, detail="این نام کاربری قبلاً رزرو شده است")
 
@@ -32,40 +38,61 @@ def update_my_profile(
     for field, value in obj_in.dict(exclude_unset=True).items():
         setattr(current_user, field, value)
 
-    db.commit()
+    await db.commit()
+    profiles.invalidate_user_profile([current_user.id])
+    invalidate_user_snapshot(current_user.id)
     return {"message": "پروفایل با موفقیت به‌روزرسانی شد"}
 
 
 # --- ۲. دریافت لیست برترین‌ها ---
+async def _with_usernames(db: AsyncSession, entries):
+    """تبدیل (rank, user_id, score) به خروجی نهایی با یک کوئری IN برای یوزرنیم‌ها"""
+    ids = [user_id for _, user_id, _ in entries]
+    names = dict((await db.execute(
+        select(models.User.id, models.User.username).where(models.User.id.in_(ids))
+    )).all())
+    return [
+        {"id": user_id, "rank": rank, "username": names[user_id], "reputation": score}
+        for rank, user_id, score in entries if user_id in names
+    ]
+
+
+def _read_board(read):
+    """
+    داخل Thread اجرا می‌شود: با Backend ردیس هر فراخوانی جدول (و بررسی بارگذاری) یک رفت‌وبرگشت شبکه
+    با کلاینت همزمان redis است و نباید حلقه رویداد را قفل کند. Session فقط در بارگذاری اولیه به دیتابیس وصل می‌شود.
+    """
+    db = SessionLocal()
+    try:
+        return read(leaderboard.ensure_loaded(db))
+    finally:
+        db.close()
+
+
 @router.get("/leaderboard", response_model=List[schemas.UserLeaderboard])
-def get_leaderboard(db: Session = Depends(get_db)):
-    return db.query(models.User).order_by(models.User.reputation.desc()).limit(10).all()
+async def get_leaderboard(limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_async_db)):
+    entries = await asyncio.to_thread(_read_board, lambda board: board.top(limit))
+    return await _with_usernames(db, entries)
+
+
+@router.get("/leaderboard/me", response_model=schemas.LeaderboardPosition)
+async def get_my_rank(
+        radius: int = Query(5, ge=0, le=50),
+        db: AsyncSession = Depends(get_async_db),
+        current_user_id: int = Depends(get_current_user_id)
+):
+    """رتبه من و چند کاربر بالا و پایین من در جدول"""
+    rank, total, around = await asyncio.to_thread(_read_board, lambda board: (
+        board.rank(current_user_id), board.total(), board.around(current_user_id, radius)
+    ))
+    return {"rank": rank, "total": total, "around": await _with_usernames(db, around)}
 
 
 @router.get("/profile/{username}", response_model=schemas.UserProfilePublic)
-def get_user_public_profile(username: str, db: Session = Depends(get_db)):
-    # ۱. پیدا کردن کاربر بر اساس یوزرنیم
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="کاربر مورد نظر پیدا نشد")
-
-    # ۲. واکشی قول‌های عمومی این کاربر (مثلاً فقط قول‌هایی که حذف نشده‌اند)
-    user_promises = db.query(models.Promise).filter(
-        models.Promise.user_id == user.id
-    ).order_by(models.Promise.created_at.desc()).all()
-
-    # ۳. آماده‌سازی خروجی
-    return {
-        "id": user.id,
-        "username": user.username,
-        "display_name": user.display_name,
-        "bio": user.bio, # اگر در مدل یوزر فیلد بیو داری
-        "coins": user.coins,
-        "reputation": user.reputation,
-        "promises": user_promises,
-        "stats": {
-            "total_promises": len(user_promises),
-            "completed": len([p for p in user_promises if p.status == "completed"]),
-            "failed": len([p for p in user_promises if p.status == "failed"])
-        }
-    }
\ No newline at end of file
+async def get_user_public_profile(
+        username: str,
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_db)
+):
+    return await db.run_sync(profiles.get_public_profile, username, cursor, limit)
@@ -1,12 +1,31 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
-from ..dependencies import get_current_user_from_token
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
+from ..config import settings
+from ..dependencies import UserSnapshot, get_admin_user, get_current_user_from_token, get_user_snapshot
+from ..services import notification_service
+from ..services.direct_messages import writer as message_writer
+from app.managers.connection import ClientConnection
 from app.managers.notifications_manager import manager
 
 router = APIRouter()
 
 
+async def _resume(connection: ClientConnection, last_seen_id: Optional[int]):
+    """
+    شروع ارسال روی اتصال تازه. با last_seen_id اول نوتیفیکیشن‌های جامانده بازپخش می‌شوند:
+    اتصال قبل از کوئری در Manager ثبت و Subscribe شده، پس هر نوتیفیکیشنی که در نتیجه کوئری نباشد
+    به صورت زنده در صف جمع شده است (بدون فاصله) و موارد مشترک با شناسه حذف می‌شوند (بدون تکرار).
+    """
+    if last_seen_id is None:
+        return
+    connection.start(await notification_service.missed_notifications(connection.user_id, last_seen_id))
+
+
 @router.websocket("/notifications/{token}")
-async def notification_websocket(websocket: WebSocket, token: str):
+async def notification_websocket(websocket: WebSocket, token: str, last_seen_id: Optional[int] = None):
     # تایید هویت کاربر
     user = await get_current_user_from_token(token)
 
@@ -14,13 +33,92 @@ async def notification_websocket(websocket: WebSocket, token: str):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
 
-    # اتصال به مدیر نوتیفیکیشن
-    await manager.connect(user.id, websocket)
+    # اتصال به مدیر نوتیفیکیشن (اگر سقف اتصالات پر باشد سوکت همان‌جا رد شده است)
+    connection = await manager.connect(user.id, websocket, start=last_seen_id is None)
+    if connection is None:
+        return
 
     try:
-        # حلقه باز نگه داشتن اتصال
+        await _resume(connection, last_seen_id)
+        # حلقه باز نگه داشتن اتصال؛ هر فریم دریافتی (از جمله PONG در جواب PING سرور) یعنی کلاینت زنده است
         while True:
-            # منتظر پیام (اختیاری) - مثلا برای Heartbeat
             await websocket.receive_text()
+            connection.touch()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # اگر سوکت از سمت سرور بسته شده باشد (خطای ارسال یا کلاینت کند) این فراخوانی کاری نمی‌کند
+        await manager.disconnect(user.id, websocket)
+
+
+def _message_error(client_id, detail: str) -> dict:
+    return {"type": "MESSAGE_ERROR", "client_id": client_id, "detail": detail}
+
+
+def _acknowledge(connection: ClientConnection, client_id, future: asyncio.Future):
+    # بعد از commit دسته‌ای که پیام در آن بوده صدا زده می‌شود؛ پاسخ هم از صف همان سوکت فرستاده می‌شود
+    if future.cancelled() or future.exception() is not None:
+        connection.enqueue(_message_error(client_id, "ذخیره پیام ناموفق بود، دوباره بفرستید"))
+    else:
+        connection.enqueue({"type": "MESSAGE_ACK", "client_id": client_id, "message": future.result()})
+
+
+@router.websocket("/messages/{token}")
+async def direct_message_websocket(websocket: WebSocket, token: str, last_seen_id: Optional[int] = None):
+    """
+    چت آنی: کلاینت {"to": user_id, "text": "...", "client_id": "..."} می‌فرستد.
+    فرستنده بعد از ذخیره شدن پیام MESSAGE_ACK (با همان client_id و شناسه پیام) می‌گیرد و گیرنده NEW_MESSAGE.
+    client_id (حداکثر ۶۴ نویسه) کلید یکتایی ارسال است: پیام بی‌تایید را بعد از اتصال دوباره با همان client_id بفرستید.
+    نوتیفیکیشن‌ها هم روی همین سوکت می‌آیند (با همان بازپخش last_seen_id)، پس کلاینت چت به سوکت جداگانه نیاز ندارد.
+    """
+    user = await get_current_user_from_token(token)
+
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    connection = await manager.connect(user.id, websocket, start=last_seen_id is None)
+    if connection is None:
+        return
+
+    try:
+        await _resume(connection, last_seen_id)
+        while True:
+            raw = await websocket.receive_text()
+            connection.touch()
+            try:
+                data = json.loads(raw)
+                if data.get("type") == "PONG":
+                    continue
+                client_id = data.get("client_id")
+                receiver_id = int(data["to"])
+                text = data["text"]
+            except (ValueError, TypeError, KeyError, AttributeError):
+                connection.enqueue(_message_error(None, "قالب پیام نامعتبر است"))
+                continue
+
+            if not isinstance(text, str) or not text.strip() or len(text) > settings.DM_MAX_LENGTH:
+                connection.enqueue(_message_error(client_id, "متن پیام خالی یا بیش از حد طولانی است"))
+                continue
+            if client_id is not None and (not isinstance(client_id, (str, int)) or len(str(client_id)) > 64):
+                connection.enqueue(_message_error(None, "client_id نامعتبر است"))
+                continue
+            if receiver_id == user.id or await get_user_snapshot(receiver_id) is None:
+                connection.enqueue(_message_error(client_id, "گیرنده نامعتبر است"))
+                continue
+
+            # حلقه دریافت منتظر ذخیره نمی‌ماند؛ تایید بعد از commit دسته از طریق callback فرستاده می‌شود.
+            # ارسال دوباره با همان client_id ذخیره نمی‌شود و همان پیام قبلی را تایید می‌گیرد
+            future = await message_writer.submit(user.id, receiver_id, text,
+                                                 None if client_id is None else str(client_id))
+            future.add_done_callback(lambda f, client_id=client_id: _acknowledge(connection, client_id, f))
     except WebSocketDisconnect:
-        manager.disconnect(user.id, websocket)
\ No newline at end of file
+        pass
+    finally:
+        await manager.disconnect(user.id, websocket)
+
+
+# وضعیت اتصالات وب‌سوکت همین پردازه: تعداد، عمق صف‌ها و زمان ارسال، و وضعیت ذخیره پیام‌های مستقیم (فقط مدیران)
+@router.get("/metrics")
+def websocket_metrics(admin: UserSnapshot = Depends(get_admin_user)):
+    return {**manager.stats(), "direct_messages": message_writer.stats()}
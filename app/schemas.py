@@ -1,9 +1,9 @@
 from enum import Enum
 
 from pydantic import BaseModel, Field, field_validator, EmailStr, constr
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, List
-from .models import PromiseStatus, PromiseStatus  # وارد کردن Enum از مدل
+from .models import NotificationType, PromiseStatus, PromiseStatus  # وارد کردن Enum از مدل
 
 # --- User Schemas ---
 class UserBase(BaseModel):
@@ -47,6 +47,13 @@ class UserMinimalResponse(BaseModel):
         from_attributes = True
 
 # --- Promise Schemas ---
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """ددلاین‌ها در دیتابیس و زمان‌بند به صورت UTC بدون tzinfo نگه داشته می‌شوند؛ ورودی دارای منطقه زمانی تبدیل می‌شود"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 class PromiseBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -60,6 +67,11 @@ class PromiseBase(BaseModel):
     def uppercase_visibility(cls, v: str) -> str:
         return v.upper()
 
+    @field_validator("deadline")
+    @classmethod
+    def deadline_naive_utc(cls, v: datetime) -> datetime:
+        return naive_utc(v)
+
 
 class PromiseDetailResponse(BaseModel):
     id: int
@@ -86,7 +98,12 @@ class PromiseCreate(PromiseBase):
 class PromiseUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
-    target_date: Optional[datetime] = None
+    deadline: Optional[datetime] = None
+
+    @field_validator("deadline")
+    @classmethod
+    def deadline_naive_utc(cls, v: Optional[datetime]) -> Optional[datetime]:
+        return naive_utc(v)
 
 class PromiseResponse(PromiseBase):
     id: int
@@ -99,6 +116,11 @@ class PromiseResponse(PromiseBase):
     class Config:
         from_attributes = True
 
+class PromiseFeedResponse(BaseModel):
+    items: List[PromiseResponse]
+    next_cursor: Optional[str] = None  # برای دریافت صفحه بعد همین مقدار را به عنوان cursor بفرستید
+
+
 class UserProfilePublic(BaseModel):
     id: int
     username: str
@@ -106,7 +128,8 @@ class UserProfilePublic(BaseModel):
     bio: Optional[str]
     coins: int
     reputation: int
-    promises: List[PromiseResponse] # لیست قول‌های او
+    promises: List[PromiseResponse] # یک صفحه از قول‌های او
+    next_cursor: Optional[str] = None  # برای صفحه بعدی قول‌ها
     stats: dict # آمار کلی (تعداد موفق/شکست)
 
     class Config:
@@ -129,18 +152,68 @@ class NotificationResponse(BaseModel):
     link_id: Optional[int]
     is_read: bool
     created_at: datetime
+    event_count: int = 1  # تعداد رویدادهای ادغام‌شده (مثلاً تعداد تاییدها)
 
     class Config:
         from_attributes = True
 
+
+class NotificationPage(BaseModel):
+    items: List[NotificationResponse]  # جدیدترین اول
+    next_cursor: Optional[str] = None  # برای صفحه بعد همین مقدار را به عنوان cursor بفرستید
+
+
+class UnreadCount(BaseModel):
+    unread: int
+
+
+class RecipientQuery(BaseModel):
+    # گیرندگان بر اساس شرط؛ بدون هیچ شرطی یعنی همه کاربران
+    active_only: bool = False
+    min_reputation: Optional[int] = None
+    max_reputation: Optional[int] = None
+
+
+class BulkNotificationCreate(BaseModel):
+    title: str
+    content: str
+    type: NotificationType = NotificationType.SYSTEM_MESSAGE
+    link_id: Optional[int] = None
+    # دقیقاً یکی از این دو: لیست شناسه کاربران یا شرط انتخاب گیرندگان
+    user_ids: Optional[List[int]] = None
+    audience: Optional[RecipientQuery] = None
+
+
+class NotificationJobResponse(BaseModel):
+    id: int
+    title: Optional[str]
+    status: str
+    total: int
+    inserted: int
+    pushed: int
+    error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
 # --- Leaderboard & Store ---
 class UserLeaderboard(BaseModel):
+    id: int
+    rank: int
     username: str
     reputation: int
 
     class Config:
         from_attributes = True
 
+class LeaderboardPosition(BaseModel):
+    rank: Optional[int]  # اگر کاربر هنوز در جدول نباشد None است
+    total: int
+    around: List[UserLeaderboard]  # کاربران بالا و پایین من
+
 class ProfileComplete(BaseModel):
     username: str
     password: str
@@ -163,7 +236,7 @@ class MessageResponse(BaseModel):
     conversation_id: int
     sender_id: int
     content: str
-    is_read: bool
+    is_read: bool = False  # از روی Watermark عضو گفتگو محاسبه می‌شود
     is_edited: bool
     is_deleted: bool  # اگر True بود، فرانت‌ا‌ند متن را نشان نمی‌دهد (مثلاً می‌نویسد: این پیام حذف شده است)
     created_at: datetime
@@ -173,6 +246,12 @@ class MessageResponse(BaseModel):
         from_attributes = True
 
 
+class MessageHistoryPage(BaseModel):
+    items: List[MessageResponse]  # به ترتیب زمانی (قدیمی به جدید)
+    before_cursor: Optional[str] = None  # برای پیام‌های قدیمی‌تر این مقدار را به عنوان before بفرستید
+    after_cursor: Optional[str] = None  # برای پیام‌های جدیدتر این مقدار را به عنوان after بفرستید
+
+
 class ConversationResponse(BaseModel):
     id: int
     user1_id: int
@@ -181,6 +260,7 @@ class ConversationResponse(BaseModel):
     updated_at: datetime
 
     # اطلاعات اضافی که معمولاً با Join در بک‌ا‌ند پر می‌کنیم تا فرانت‌ا‌ند راحت باشد
+    other_user_id: Optional[int] = None
     other_user_username: Optional[str] = None
     other_user_display_name: Optional[str] = None
     unread_count: int = 0  # تعداد پیام‌های خوانده نشده برای کاربر فعلی
@@ -188,6 +268,16 @@ class ConversationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class MessageSearchPage(BaseModel):
+    items: List[MessageResponse]  # مرتبط‌ترین پیام‌ها اول
+    next_cursor: Optional[str] = None
+
+
+class InboxPage(BaseModel):
+    items: List[ConversationResponse]
+    next_cursor: Optional[str] = None  # برای صفحه بعد اینباکس همین مقدار را به عنوان cursor بفرستید
+
+
 class MessageUpdate(BaseModel):
     content: str # متن جدید پیام
 
@@ -210,6 +300,7 @@ class UserFullProfile(BaseModel):
     reputation: int
     is_onboarded: bool
     signup_at: datetime
+    notification_digest: bool = False
 
     class Config:
         from_attributes = True
@@ -220,6 +311,8 @@ class UserUpdate(BaseModel):
     username: Optional[str] = None
     # اینجا کاربر می‌تواند ایمیلش را هم اضافه یا ویرایش کند
     email: Optional[str] = None
+    # خلاصه روزانه به جای نوتیفیکیشن آنی برای تاییدها و اقتباس‌ها
+    notification_digest: Optional[bool] = None
 
 class StoreItemResponse(BaseModel):
     id: int
@@ -230,6 +323,11 @@ class StoreItemResponse(BaseModel):
     stock: int
     image_url: Optional[str]
 
+class StoreItemPage(BaseModel):
+    items: List[StoreItemResponse]
+    next_cursor: Optional[str] = None
+
+
 class PurchaseResponse(BaseModel):
     id: int
     item_name: str
@@ -0,0 +1,172 @@
+# app/services/bulk_notifications.py
+# ارسال گروهی نوتیفیکیشن (اطلاعیه سیستمی به همه یا بخشی از کاربران)
+#
+# گیرندگان دسته به دسته (NOTIFICATION_BULK_CHUNK_SIZE) با صفحه‌بندی Keyset روی users.id خوانده می‌شوند و
+# نوتیفیکیشن‌های هر دسته با یک INSERT چندردیفی (executemany + RETURNING) در یک تراکنش ذخیره می‌شوند.
+# بعد از commit هر دسته، پیام‌های آنی آن با ConnectionManager.send_many یکجا منتشر می‌شوند و همزمان
+# دسته بعدی در Thread جدا نوشته می‌شود. پیشرفت کار در جدول notification_jobs ثبت می‌شود.
+#
+# کار در پس‌زمینه همان پردازه‌ای اجرا می‌شود که درخواست را گرفته؛ اگر پردازه وسط کار خاموش شود
+# وضعیت کار running می‌ماند و نوتیفیکیشن‌های ذخیره‌شده تا همان دسته باقی می‌مانند.
+import asyncio
+import bisect
+import datetime
+import logging
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert, select, update
+
+from .. import models, schemas
+from ..config import settings
+from ..database import SessionLocal
+from .notification_service import add_unread, invalidate_unread_counts, notification_payload
+from ..managers.notifications_manager import manager
+
+logger = logging.getLogger(__name__)
+
+# ارجاع به Taskهای در حال اجرا تا وسط کار جمع‌آوری (GC) نشوند
+_running: Set[asyncio.Task] = set()
+
+
+def _audience_filters(audience: schemas.RecipientQuery) -> list:
+    user = models.User
+    filters = []
+    if audience.active_only:
+        filters.append(user.is_active == True)
+    if audience.min_reputation is not None:
+        filters.append(user.reputation >= audience.min_reputation)
+    if audience.max_reputation is not None:
+        filters.append(user.reputation <= audience.max_reputation)
+    return filters
+
+
+def _count_recipients(request: schemas.BulkNotificationCreate, user_ids: Optional[List[int]]) -> int:
+    db = SessionLocal()
+    try:
+        if user_ids is not None:
+            return len(user_ids)
+        return db.execute(
+            select(func.count(models.User.id)).where(*_audience_filters(request.audience))
+        ).scalar_one()
+    finally:
+        db.close()
+
+
+def _update_job(job_id: int, **values):
+    db = SessionLocal()
+    try:
+        db.execute(update(models.NotificationJob).where(models.NotificationJob.id == job_id).values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _write_chunk(job_id: int, request: schemas.BulkNotificationCreate, user_ids: Optional[List[int]],
+                 after: int, created_at: datetime.datetime, pushed: int) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """
+    ذخیره نوتیفیکیشن دسته بعدی گیرندگان (شناسه بزرگ‌تر از after) و ثبت پیشرفت در همان تراکنش.
+    (user_id, notification_id) ردیف‌های ساخته‌شده و کرسر دسته بعد را برمی‌گرداند؛ کرسر None یعنی کار تمام است.
+    """
+    size = settings.NOTIFICATION_BULK_CHUNK_SIZE
+    user = models.User
+    db = SessionLocal()
+    try:
+        query = select(user.id).where(user.id > after).order_by(user.id).limit(size)
+        if user_ids is not None:
+            # لیست مرتب شناسه‌ها تکه تکه با کاربران موجود مقایسه می‌شود تا شناسه نامعتبر ردیف یتیم نسازد
+            start = bisect.bisect_right(user_ids, after)
+            window = user_ids[start:start + size]
+            if not window:
+                return [], None
+            recipients = db.execute(query.where(user.id.in_(window))).scalars().all()
+            next_after = window[-1]
+        else:
+            recipients = db.execute(query.where(*_audience_filters(request.audience))).scalars().all()
+            if not recipients:
+                return [], None
+            next_after = recipients[-1]
+
+        created = []
+        if recipients:
+            notification = models.Notification
+            created = db.execute(
+                insert(notification).returning(notification.user_id, notification.id),
+                [
+                    {"user_id": user_id, "type": request.type, "title": request.title, "content": request.content,
+                     "link_id": request.link_id, "is_read": False, "created_at": created_at}
+                    for user_id in recipients
+                ]
+            ).all()
+            add_unread(db, [user_id for user_id, _ in created])
+
+        job = models.NotificationJob
+        db.execute(
+            update(job).where(job.id == job_id).values(inserted=job.inserted + len(created), pushed=pushed)
+        )
+        db.commit()
+        invalidate_unread_counts(user_id for user_id, _ in created)
+        return [tuple(row) for row in created], next_after
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _push(created: List[Tuple[int, int]], base: dict) -> int:
+    try:
+        await manager.send_many((user_id, {**base, "id": notification_id}) for user_id, notification_id in created)
+    except Exception:
+        # نوتیفیکیشن‌ها ذخیره شده‌اند و کاربر آنلاین با بازپخش last_seen_id یا API آن‌ها را می‌گیرد
+        logger.exception("bulk notification push failed for %s recipients", len(created))
+        return 0
+    return len(created)
+
+
+async def run_job(job_id: int, request: schemas.BulkNotificationCreate):
+    user_ids = sorted(set(request.user_ids)) if request.user_ids is not None else None
+    created_at = datetime.datetime.utcnow()
+    # همه ردیف‌ها جز شناسه و گیرنده یکسان‌اند، پس payload یک بار ساخته می‌شود
+    base = notification_payload(models.Notification(
+        type=request.type, title=request.title, content=request.content,
+        link_id=request.link_id, created_at=created_at
+    ))
+    pushed = 0
+    push: Optional[asyncio.Task] = None
+    try:
+        total = await asyncio.to_thread(_count_recipients, request, user_ids)
+        await asyncio.to_thread(_update_job, job_id, status="running", total=total)
+
+        after: Optional[int] = 0
+        while after is not None:
+            created, after = await asyncio.to_thread(
+                _write_chunk, job_id, request, user_ids, after, created_at, pushed
+            )
+            # ارسال دسته قبلی همزمان با نوشتن این دسته انجام شده است
+            if push is not None:
+                pushed += await push
+                push = None
+            if created:
+                push = asyncio.create_task(_push(created, base))
+
+        if push is not None:
+            pushed += await push
+        await asyncio.to_thread(
+            _update_job, job_id, status="done", pushed=pushed, finished_at=datetime.datetime.utcnow()
+        )
+    except Exception as exc:
+        logger.exception("bulk notification job %s failed", job_id)
+        if push is not None:
+            pushed += await push
+        await asyncio.to_thread(
+            _update_job, job_id, status="failed", pushed=pushed, error=str(exc)[:500],
+            finished_at=datetime.datetime.utcnow()
+        )
+
+
+def start_job(job_id: int, request: schemas.BulkNotificationCreate) -> asyncio.Task:
+    """اجرای کار در پس‌زمینه Event Loop تا درخواست HTTP بلافاصله برگردد"""
+    task = asyncio.create_task(run_job(job_id, request))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return task
@@ -0,0 +1,232 @@
+# app/services/catalog.py
+# ایندکس جستجوی فروشگاه در حافظه: کلمات یکسان‌شده نام و توضیحات محصولات در یک لیست مرتب نگه داشته می‌شوند
+# تا جستجوی پیشوندی (Typeahead) با دو جستجوی دودویی انجام شود و نتیجه بدون رفتن به دیتابیس برگردد.
+#
+# کاتالوگ کوچک است و کم تغییر می‌کند: یک بار کامل از دیتابیس خوانده می‌شود و بعد از هر خرید/تغییر
+# محصولات مربوطه دوباره خوانده می‌شوند؛ در همین پردازه فوراً و در بقیه Workerها با پیامی روی کانال
+# CATALOG_CHANNEL از لایه Pub/Sub وب‌سوکت (managers/broadcast.py). بارگذاری کامل هر CATALOG_REFRESH_SECONDS
+# فقط پشتیبان است (پیام گم‌شده در قطعی ردیس یا تغییری که بیرون از API انجام شده).
+import asyncio
+import bisect
+import heapq
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..config import settings
+from ..database import SessionLocal
+from ..managers.notifications_manager import manager
+from ..pagination import decode_cursor, encode_cursor
+from ..persian import normalize, tokenize
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CHANNEL = "catalog:items"
+# پیام‌های همین پردازه (که ایندکسش را قبلاً تازه کرده) از روی این شناسه کنار گذاشته می‌شوند
+_node_id = uuid.uuid4().hex
+
+# وزن هر فیلد در رتبه‌بندی: تطابق در نام مهم‌تر از توضیحات است و تطابق کامل کلمه مهم‌تر از پیشوند
+NAME_WEIGHT = 4
+DESCRIPTION_WEIGHT = 1
+EXACT_BONUS = 1
+NAME_PREFIX_BONUS = 3  # وقتی نام محصول با خود عبارت جستجو شروع شود
+
+
+class CatalogIndex:
+    def __init__(self):
+        self._items: Dict[int, schemas.StoreItemResponse] = {}
+        self._names: Dict[int, str] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}  # token -> {item_id: weight}
+        self._tokens: List[str] = []  # همه کلمات به ترتیب الفبا برای جستجوی پیشوندی
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    def _index_tokens(self, item: schemas.StoreItemResponse) -> Dict[str, int]:
+        weights: Dict[str, int] = {}
+        for token in tokenize(item.description):
+            weights[token] = max(weights.get(token, 0), DESCRIPTION_WEIGHT)
+        for token in tokenize(item.name):
+            weights[token] = max(weights.get(token, 0), NAME_WEIGHT)
+        return weights
+
+    def _remove_locked(self, item_id: int):
+        item = self._items.pop(item_id, None)
+        self._names.pop(item_id, None)
+        if item is None:
+            return
+        for token in self._index_tokens(item):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(item_id, None)
+            if not posting:
+                del self._postings[token]
+                index = bisect.bisect_left(self._tokens, token)
+                if index < len(self._tokens) and self._tokens[index] == token:
+                    self._tokens.pop(index)
+
+    def _add_locked(self, item: schemas.StoreItemResponse):
+        self._items[item.id] = item
+        self._names[item.id] = normalize(item.name)
+        for token, weight in self._index_tokens(item).items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                bisect.insort(self._tokens, token)
+            posting[item.id] = weight
+
+    def upsert(self, items: Iterable[schemas.StoreItemResponse]):
+        with self._lock:
+            for item in items:
+                self._remove_locked(item.id)
+                self._add_locked(item)
+
+    def remove(self, item_ids: Iterable[int]):
+        with self._lock:
+            for item_id in item_ids:
+                self._remove_locked(item_id)
+
+    def replace_all(self, items: Iterable[schemas.StoreItemResponse]):
+        items = list(items)
+        with self._lock:
+            self._items, self._names, self._postings, self._tokens = {}, {}, {}, []
+            for item in items:
+                self._add_locked(item)
+            self.loaded_at = time.monotonic()
+
+    def _prefix_matches(self, prefix: str) -> Dict[int, int]:
+        """بهترین وزن هر محصول بین همه کلماتی که با prefix شروع می‌شوند"""
+        matches: Dict[int, int] = {}
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + "\U0010ffff")
+        for token in self._tokens[start:end]:
+            bonus = EXACT_BONUS if token == prefix else 0
+            for item_id, weight in self._postings[token].items():
+                score = weight + bonus
+                if score > matches.get(item_id, 0):
+                    matches[item_id] = score
+        return matches
+
+    def search(self, query: Optional[str], category: Optional[str], in_stock: bool,
+               cursor: Optional[str], limit: int) -> Tuple[List[schemas.StoreItemResponse], Optional[str]]:
+        with self._lock:
+            tokens = tokenize(query) if query else []
+            if tokens:
+                # همه کلمات باید (پیشوندی) پیدا شوند؛ از طولانی‌ترین کلمه (معمولاً کم‌تکرارترین) شروع می‌کنیم
+                scores: Optional[Dict[int, int]] = None
+                for token in sorted(set(tokens), key=len, reverse=True):
+                    matches = self._prefix_matches(token)
+                    if scores is None:
+                        scores = matches
+                    else:
+                        scores = {item_id: score + matches[item_id]
+                                  for item_id, score in scores.items() if item_id in matches}
+                    if not scores:
+                        break
+                scores = scores or {}
+                phrase = " ".join(tokens)
+                candidates = (
+                    (-(score + (NAME_PREFIX_BONUS if self._names[item_id].startswith(phrase) else 0)),
+                     self._names[item_id], item_id)
+                    for item_id, score in scores.items()
+                )
+            else:
+                candidates = ((0, name, item_id) for item_id, name in self._names.items())
+
+            last_key = None
+            if cursor:
+                last_key = tuple(decode_cursor(cursor, 3))
+            try:
+                # فقط limit + 1 بهترین نتیجه بعد از کرسر لازم است؛ nsmallest از مرتب کردن کل نتایج ارزان‌تر است
+                page = heapq.nsmallest(limit + 1, (
+                    key for key in candidates
+                    if (last_key is None or key > last_key)
+                    and (not category or self._items[key[2]].category == category)
+                    and (not in_stock or self._items[key[2]].stock > 0)
+                ))
+            except TypeError:
+                raise HTTPException(status_code=400, detail="کرسر صفحه‌بندی نامعتبر است")
+            items = [self._items[key[2]] for key in page[:limit]]
+
+        next_cursor = encode_cursor(*page[limit - 1]) if len(page) > limit else None
+        return items, next_cursor
+
+
+_catalog = CatalogIndex()
+
+
+def _to_entry(item: models.StoreItem) -> schemas.StoreItemResponse:
+    return schemas.StoreItemResponse(
+        id=item.id,
+        name=item.name or "",
+        description=item.description or "",
+        price=item.price or 0,
+        category=item.category or "",
+        stock=item.stock or 0,
+        image_url=item.image_url
+    )
+
+
+def ensure_loaded(db: Session) -> CatalogIndex:
+    """بارگذاری کامل در اولین استفاده و بعد از گذشت CATALOG_REFRESH_SECONDS"""
+    loaded_at = _catalog.loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at > settings.CATALOG_REFRESH_SECONDS:
+        _catalog.replace_all(_to_entry(item) for item in db.query(models.StoreItem).yield_per(1000))
+    return _catalog
+
+
+def refresh_items(db: Session, item_ids: Iterable[int]):
+    """
+    بعد از ساخت/ویرایش/حذف محصول یا تغییر موجودی (مثلاً خرید) و پس از commit صدا زده می‌شود
+    تا همان محصولات از دیتابیس خوانده و در ایندکس جایگزین شوند.
+    """
+    item_ids = set(item_ids)
+    if not item_ids or _catalog.loaded_at is None:
+        return
+    items = db.query(models.StoreItem).filter(models.StoreItem.id.in_(item_ids)).all()
+    _catalog.upsert(_to_entry(item) for item in items)
+    _catalog.remove(item_ids - {item.id for item in items})
+
+
+def items_changed(db: Session, item_ids: Iterable[int]):
+    """
+    بعد از commit تغییر محصول یا موجودی (مثلاً خرید) از روت‌های همزمان (Thread پول FastAPI) صدا زده می‌شود:
+    ایندکس همین پردازه فوراً و ایندکس بقیه Workerها با یک پیام Pub/Sub تازه می‌شود.
+    """
+    item_ids = sorted(set(item_ids))
+    refresh_items(db, item_ids)
+    try:
+        anyio.from_thread.run(manager.publish, CATALOG_CHANNEL, {"node": _node_id, "item_ids": item_ids})
+    except Exception:
+        # بقیه Workerها در بارگذاری کامل بعدی به‌روز می‌شوند
+        logger.exception("failed to publish catalog change for items %s", item_ids)
+
+
+def _reload_items(item_ids: List[int]):
+    db = SessionLocal()
+    try:
+        refresh_items(db, item_ids)
+    finally:
+        db.close()
+
+
+async def _on_items_changed(message: dict):
+    if message.get("node") == _node_id or _catalog.loaded_at is None:
+        return
+    await asyncio.to_thread(_reload_items, [int(item_id) for item_id in message.get("item_ids", ())])
+
+
+manager.add_handler(CATALOG_CHANNEL, _on_items_changed)
+
+
+def search_items(db: Session, query: Optional[str], category: Optional[str], in_stock: bool,
+                 cursor: Optional[str], limit: int) -> dict:
+    items, next_cursor = ensure_loaded(db).search(query, category, in_stock, cursor, limit)
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,368 @@
+# app/services/chat.py
+# عضویت در گفتگوها، وضعیت خوانده‌شدن پیام‌ها با یک Watermark به ازای هر عضو
+# و اینباکس از روی همین ردیف‌های عضویت (پیش‌نمایش آخرین پیام و تعداد نخوانده‌ها)
+# بازسازی عضویت و اطلاعات اینباکس گفتگوهای قدیمی: python -m app.services.chat
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import (and_, bindparam, case, func, insert, inspect, literal, literal_column, or_, select, true,
+                        update)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..pagination import decode_id_cursor, decode_time_cursor, encode_cursor
+
+PREVIEW_LENGTH = 100
+
+_INSERT = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def _preview(text: Optional[str]) -> Optional[str]:
+    return text[:PREVIEW_LENGTH] if text else text
+
+
+def _unread_after(conversation_id, user_id, message_id):
+    """تعداد پیام‌های طرف مقابل بعد از Watermark (روی ایندکس conversation_id, id)"""
+    return select(func.count(models.DirectMessage.id)).where(
+        models.DirectMessage.conversation_id == conversation_id,
+        models.DirectMessage.sender_id != user_id,
+        models.DirectMessage.id > message_id
+    ).scalar_subquery()
+
+
+def add_participants(db: Session, conversation: models.Conversation):
+    """
+    ساخت ردیف عضویت هر دو طرف (commit بر عهده فراخواننده است). با ON CONFLICT DO NOTHING، پس دو درخواست همزمان
+    که اولین بار یک گفتگوی قدیمی را باز می‌کنند روی کلید یکتای (conversation_id, user_id) خطا نمی‌گیرند.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in _INSERT:
+        raise RuntimeError(f"Direct messages are not supported on {dialect}")
+    members = {conversation.user1_id, conversation.user2_id}
+    db.execute(
+        _INSERT[dialect](models.ConversationParticipant)
+        .on_conflict_do_nothing(index_elements=["conversation_id", "user_id"]),
+        [
+            {
+                "conversation_id": conversation.id,
+                "user_id": user_id,
+                "other_user_id": next(iter(members - {user_id}), user_id),
+                "last_message_preview": _preview(conversation.last_message),
+                "updated_at": conversation.updated_at or datetime.datetime.utcnow(),
+            }
+            for user_id in members
+        ]
+    )
+
+
+def get_participants(db: Session, conversation_id: int, user_id: int) -> Dict[int, models.ConversationParticipant]:
+    """
+    ردیف‌های عضویت گفتگو با کلید user_id؛ اگر کاربر عضو نباشد ۴۰۳ برمی‌گرداند.
+    گفتگوهایی که قبل از این جدول ساخته شده‌اند همین‌جا عضویتشان ساخته و دوباره خوانده می‌شود.
+    """
+    participants = {
+        p.user_id: p for p in db.execute(
+            select(models.ConversationParticipant)
+            .where(models.ConversationParticipant.conversation_id == conversation_id)
+            .execution_options(populate_existing=True)
+        ).scalars()
+    }
+    if user_id not in participants:
+        conversation = db.get(models.Conversation, conversation_id)
+        if conversation and user_id in (conversation.user1_id, conversation.user2_id):
+            add_participants(db, conversation)
+            refresh_inbox_state(db, conversation_id)
+            db.commit()
+            return get_participants(db, conversation_id, user_id)
+
+    if user_id not in participants:
+        raise HTTPException(status_code=403, detail="عدم دسترسی به این گفتگو")
+    return participants
+
+
+def mark_read(db: Session, conversation_id: int, user_id: int, message_id: int) -> bool:
+    """
+    جلو بردن Watermark خواندن؛ هیچ‌وقت عقب نمی‌رود و اگر تغییری نباشد چیزی نوشته نمی‌شود.
+    commit بر عهده فراخواننده است.
+    """
+    result = db.execute(
+        update(models.ConversationParticipant)
+        .where(
+            models.ConversationParticipant.conversation_id == conversation_id,
+            models.ConversationParticipant.user_id == user_id,
+            models.ConversationParticipant.last_read_message_id < message_id
+        )
+        .values(
+            last_read_message_id=message_id,
+            unread_count=_unread_after(conversation_id, user_id, message_id)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def canonical_pair(user_a: int, user_b: int) -> Tuple[int, int]:
+    """کلید یکتای گفتگوی دو نفره: (user1_id, user2_id) همیشه به ترتیب صعودی ذخیره می‌شود"""
+    return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+
+def record_messages(db: Session, messages: Iterable[models.DirectMessage]):
+    """
+    به‌روزرسانی گفتگوها و ردیف‌های عضویت بعد از ذخیره یک دسته پیام (commit بر عهده فراخواننده است).
+    فرستنده پیام‌های قبل از پیام خودش را خوانده حساب می‌شود و برای بقیه اعضا پیام‌های دسته نخوانده اضافه می‌شوند.
+    برای هر گفتگو فقط آخرین وضعیت نوشته می‌شود و همه UPDATEها با executemany فرستاده می‌شوند،
+    پس هزینه یک دسته به تعداد گفتگوها بستگی دارد و نه تعداد پیام‌ها.
+    """
+    by_conversation: Dict[int, List[models.DirectMessage]] = {}
+    for message in sorted(messages, key=lambda m: m.id):
+        by_conversation.setdefault(message.conversation_id, []).append(message)
+    if not by_conversation:
+        return
+
+    conversation_rows, sender_rows, receiver_rows = [], [], []
+    for conversation_id, batch in by_conversation.items():
+        last = batch[-1]
+        inbox_values = {
+            "b_last_message_id": last.id,
+            "b_preview": _preview(last.content),
+            "b_updated_at": last.created_at or datetime.datetime.utcnow(),
+        }
+        conversation_rows.append({"id": conversation_id, "last_message": last.content,
+                                  "updated_at": inbox_values["b_updated_at"]})
+
+        last_sent: Dict[int, int] = {}
+        for message in batch:
+            last_sent[message.sender_id] = message.id
+        for sender_id, watermark in last_sent.items():
+            unread = sum(1 for m in batch if m.id > watermark and m.sender_id != sender_id)
+            sender_rows.append({"b_conversation_id": conversation_id, "b_user_id": sender_id,
+                                "b_watermark": watermark, "b_unread": unread, **inbox_values})
+        # گفتگوها دو نفره‌اند: اگر هر دو طرف در این دسته پیام داده باشند عضو بی‌پیامی باقی نمی‌ماند
+        if len(last_sent) == 1:
+            receiver_rows.append({"b_conversation_id": conversation_id, "b_sender_id": batch[0].sender_id,
+                                  "b_added": len(batch), **inbox_values})
+
+    participant = models.ConversationParticipant
+    inbox_columns = {
+        "last_message_id": bindparam("b_last_message_id"),
+        "last_message_preview": bindparam("b_preview"),
+        "updated_at": bindparam("b_updated_at"),
+    }
+    db.execute(update(models.Conversation), conversation_rows)
+    conn = db.connection()
+    conn.execute(
+        update(participant)
+        .where(participant.conversation_id == bindparam("b_conversation_id"),
+               participant.user_id == bindparam("b_user_id"))
+        .values(last_read_message_id=bindparam("b_watermark"), unread_count=bindparam("b_unread"), **inbox_columns),
+        sender_rows
+    )
+    if receiver_rows:
+        conn.execute(
+            update(participant)
+            .where(participant.conversation_id == bindparam("b_conversation_id"),
+                   participant.user_id != bindparam("b_sender_id"))
+            .values(unread_count=participant.unread_count + bindparam("b_added"), **inbox_columns),
+            receiver_rows
+        )
+
+
+def update_preview(db: Session, message: models.DirectMessage, preview: Optional[str]):
+    """اگر پیام ویرایش/حذف شده آخرین پیام گفتگو باشد، پیش‌نمایش اینباکس هم عوض می‌شود"""
+    participant = models.ConversationParticipant
+    db.execute(
+        update(participant)
+        .where(participant.conversation_id == message.conversation_id, participant.last_message_id == message.id)
+        .values(last_message_preview=_preview(preview))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def get_inbox(db: Session, user_id: int, cursor: Optional[str], limit: int) -> dict:
+    """
+    اینباکس با یک اسکن بازه‌ای روی ایندکس (user_id, updated_at) و صفحه‌بندی Keyset؛
+    نام طرف مقابل و شناسه‌های گفتگو با Join روی کلید اصلی در همان کوئری خوانده می‌شوند.
+    """
+    participant = models.ConversationParticipant
+    query = select(participant, models.Conversation, models.User) \
+        .join(models.Conversation, models.Conversation.id == participant.conversation_id) \
+        .outerjoin(models.User, models.User.id == participant.other_user_id) \
+        .where(participant.user_id == user_id)
+
+    if cursor:
+        last_updated_at, last_id = decode_time_cursor(cursor)
+        query = query.where(or_(
+            participant.updated_at < last_updated_at,
+            and_(participant.updated_at == last_updated_at, participant.id < last_id)
+        ))
+
+    rows = db.execute(
+        query.order_by(participant.updated_at.desc(), participant.id.desc()).limit(limit + 1)
+    ).all()
+
+    items = [
+        schemas.ConversationResponse(
+            id=conversation.id,
+            user1_id=conversation.user1_id,
+            user2_id=conversation.user2_id,
+            last_message=member.last_message_preview,
+            updated_at=member.updated_at,
+            other_user_id=member.other_user_id,
+            other_user_username=other.username if other else None,
+            other_user_display_name=other.display_name if other else None,
+            unread_count=member.unread_count
+        )
+        for member, conversation, other in rows[:limit]
+    ]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = encode_cursor(last.updated_at, last.id)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def get_history(db: Session, conversation_id: int, user_id: int, before: Optional[str],
+                after: Optional[str], limit: int) -> dict:
+    """
+    یک صفحه از تاریخچه روی ایندکس (conversation_id, id).
+    بدون کرسر: جدیدترین پیام‌ها. before: پیام‌های قدیمی‌تر. after: پیام‌های جدیدتر.
+    after_cursor در آخرین صفحه هم برمی‌گردد تا کلاینتی که در انتهای گفتگوست پیام‌های بعدی را بخواند
+    (صفحه خالی after همان کرسر ورودی را پس می‌دهد).
+    پیام‌ها همیشه به ترتیب زمانی (صعودی) برگردانده می‌شوند.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="فقط یکی از before یا after را بفرستید")
+
+    participants = get_participants(db, conversation_id, user_id)
+    message = models.DirectMessage
+    query = select(message).where(message.conversation_id == conversation_id)
+
+    if after:
+        rows = db.execute(
+            query.where(message.id > decode_id_cursor(after)).order_by(message.id.asc()).limit(limit + 1)
+        ).scalars().all()
+        has_older = True
+        page = rows[:limit]
+    else:
+        if before:
+            query = query.where(message.id < decode_id_cursor(before))
+        rows = db.execute(query.order_by(message.id.desc()).limit(limit + 1)).scalars().all()
+        has_older = len(rows) > limit
+        page = list(reversed(rows[:limit]))
+
+    # وضعیت خوانده‌شدن از روی Watermark طرف مقابل (برای پیام‌های من) یا خودم (برای پیام‌های دریافتی)
+    my_watermark = participants[user_id].last_read_message_id
+    other_watermark = max(
+        (p.last_read_message_id for uid, p in participants.items() if uid != user_id), default=0
+    )
+    items = []
+    for msg in page:
+        watermark = other_watermark if msg.sender_id == user_id else my_watermark
+        item = schemas.MessageResponse.model_validate(msg)
+        item.is_read = msg.id <= watermark
+        items.append(item)
+
+    # باز کردن گفتگو یعنی خواندن پیام‌های این صفحه: فقط یک UPDATE کوچک روی ردیف عضویت
+    if page and page[-1].id > my_watermark:
+        mark_read(db, conversation_id, user_id, page[-1].id)
+        db.commit()
+
+    return {
+        "items": items,
+        "before_cursor": encode_cursor(page[0].id) if page and has_older else None,
+        "after_cursor": encode_cursor(page[-1].id) if page else after,
+    }
+
+
+def rebuild_participants(db: Session) -> int:
+    """
+    ساخت ردیف‌های عضویت جاافتاده با INSERT ... SELECT و بازسازی ستون‌های اینباکس همه ردیف‌ها
+    (Watermark خواندن از پرچم‌های قدیمی is_read، اگر هنوز در جدول باشند).
+    """
+    # گفتگوهای قدیمی که قبل از کلید یکتای (کوچک‌تر، بزرگ‌تر) ساخته شده‌اند به همان ترتیب درمی‌آیند
+    db.execute(
+        update(models.Conversation)
+        .where(models.Conversation.user1_id > models.Conversation.user2_id)
+        .values(user1_id=models.Conversation.user2_id, user2_id=models.Conversation.user1_id)
+        .execution_options(synchronize_session=False)
+    )
+    created = 0
+    for column in (models.Conversation.user1_id, models.Conversation.user2_id):
+        participant = models.ConversationParticipant
+        missing = select(models.Conversation.id, column, literal(0)).where(
+            column.is_not(None),
+            ~select(participant.id).where(and_(
+                participant.conversation_id == models.Conversation.id,
+                participant.user_id == column
+            )).exists()
+        )
+        result = db.execute(
+            insert(participant).from_select(["conversation_id", "user_id", "last_read_message_id"], missing)
+        )
+        created += result.rowcount
+
+    refresh_inbox_state(db)
+    db.commit()
+    return created
+
+
+def _seed_legacy_watermarks(db: Session, conversation_id: Optional[int] = None):
+    """
+    دیتابیس‌هایی که هنوز ستون قدیمی direct_messages.is_read را دارند: Watermark عضوهایی که هنوز هیچ پیامی را
+    خوانده حساب نشده‌اند از روی همان پرچم‌ها ساخته می‌شود (بزرگ‌ترین id پیام خوانده‌شده طرف مقابل)، تا پیام‌های
+    خوانده‌شده قبل از ارتقا دوباره نخوانده نشوند. ستون را فقط بعد از python -m app.services.chat حذف کنید.
+    """
+    columns = {column["name"] for column in inspect(db.connection()).get_columns(models.DirectMessage.__tablename__)}
+    if "is_read" not in columns:
+        return
+    participant = models.ConversationParticipant
+    message = models.DirectMessage
+    legacy_read = select(func.coalesce(func.max(message.id), 0)).where(
+        message.conversation_id == participant.conversation_id,
+        message.sender_id != participant.user_id,
+        literal_column(f"{message.__tablename__}.is_read") == true()
+    ).scalar_subquery()
+    statement = update(participant).where(participant.last_read_message_id == 0).values(last_read_message_id=legacy_read)
+    if conversation_id is not None:
+        statement = statement.where(participant.conversation_id == conversation_id)
+    db.execute(statement.execution_options(synchronize_session=False))
+
+
+def refresh_inbox_state(db: Session, conversation_id: Optional[int] = None):
+    """محاسبه دوباره ستون‌های اینباکس ردیف‌های عضویت از روی جداول اصلی (همه یا یک گفتگو)"""
+    _seed_legacy_watermarks(db, conversation_id)
+    participant = models.ConversationParticipant
+    conversation = models.Conversation
+
+    def from_conversation(column):
+        return select(column).where(conversation.id == participant.conversation_id).scalar_subquery()
+
+    statement = update(participant).values(
+        other_user_id=from_conversation(case(
+            (conversation.user1_id == participant.user_id, conversation.user2_id),
+            else_=conversation.user1_id
+        )),
+        last_message_id=select(func.max(models.DirectMessage.id))
+        .where(models.DirectMessage.conversation_id == participant.conversation_id)
+        .scalar_subquery(),
+        last_message_preview=from_conversation(func.substr(conversation.last_message, 1, PREVIEW_LENGTH)),
+        updated_at=from_conversation(conversation.updated_at),
+        unread_count=_unread_after(participant.conversation_id, participant.user_id, participant.last_read_message_id)
+    )
+    if conversation_id is not None:
+        statement = statement.where(participant.conversation_id == conversation_id)
+    db.execute(statement.execution_options(synchronize_session=False))
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"Created {rebuild_participants(session)} conversation participant rows")
+    finally:
+        session.close()
@@ -0,0 +1,57 @@
+# app/services/counters.py
+# بازسازی شمارنده‌های تعامل روی جدول promises (vouch_count / adoptions_count)
+# و شمارنده نوتیفیکیشن‌های خوانده‌نشده روی users (unread_notifications)
+# اجرا: python -m app.services.counters
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, aliased
+
+from .. import models
+
+
+def rebuild_engagement_counters(db: Session) -> int:
+    """
+    محاسبه دوباره همه شمارنده‌ها از روی جداول اصلی با یک UPDATE مجموعه‌ای.
+    برای اصلاح داده‌های قدیمی (قبل از اضافه شدن ستون‌ها) یا بعد از هر ناسازگاری استفاده می‌شود.
+    """
+    child = aliased(models.Promise)
+
+    vouches = select(func.count(models.Validation.id)) \
+        .where(models.Validation.promise_id == models.Promise.id) \
+        .scalar_subquery()
+    adoptions = select(func.count(child.id)) \
+        .where(child.parent_id == models.Promise.id) \
+        .scalar_subquery()
+
+    result = db.execute(
+        update(models.Promise).values(
+            vouch_count=vouches,
+            adoptions_count=adoptions,
+        ).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def rebuild_unread_notifications(db: Session) -> int:
+    """شمارش دوباره نوتیفیکیشن‌های خوانده‌نشده هر کاربر (روی ایندکس user_id, is_read)"""
+    unread = select(func.count(models.Notification.id)) \
+        .where(models.Notification.user_id == models.User.id, models.Notification.is_read == False) \
+        .scalar_subquery()
+    result = db.execute(
+        update(models.User).values(unread_notifications=unread).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        updated = rebuild_engagement_counters(session)
+        print(f"Rebuilt engagement counters for {updated} promises")
+        updated = rebuild_unread_notifications(session)
+        print(f"Rebuilt unread notification counters for {updated} users")
+    finally:
+        session.close()
@@ -0,0 +1,150 @@
+# app/services/deadline_scheduler.py
+# زمان‌بند رویدادمحور ددلاین‌ها (به جای اسکن جدول promises در هر دقیقه)
+#
+# ددلاین‌های نزدیک (تا DEADLINE_WINDOW_MINUTES آینده) در یک Min-Heap نگه داشته می‌شوند.
+# حلقه زمان‌بند دقیقاً تا رسیدن نزدیک‌ترین ددلاین می‌خوابد، آن را FAILED می‌کند و
+# نوتیفیکیشن PROMISE_FAILED می‌فرستد. وقتی پنجره تمام شود، پنجره بعدی از روی ایندکس
+# (status, deadline) خوانده می‌شود؛ بعد از ری‌استارت هم فقط همین یک پنجره بارگذاری می‌شود.
+#
+# قول‌هایی که در promises.py ساخته، ویرایش، تکمیل یا حذف می‌شوند با schedule/cancel
+# بدون اسکن دوباره اضافه یا حذف می‌شوند. حذف به صورت تنبل انجام می‌شود: ورودی‌های heap
+# که با _deadlines هم‌خوانی ندارند هنگام بیرون آمدن نادیده گرفته می‌شوند.
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+from ..schemas import naive_utc
+from .expiry import fail_promises
+from ..managers.notifications_manager import manager
+
+
+class DeadlineScheduler:
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._deadlines: Dict[int, datetime] = {}  # promise_id -> ددلاین معتبر فعلی
+        self._loaded_until: Optional[datetime] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --- رابط عمومی (از هر Thread قابل صدا زدن است؛ روت‌های sync در threadpool اجرا می‌شوند) ---
+    def schedule(self, promise_id: int, deadline: datetime):
+        # heap و پنجره با زمان UTC بدون tzinfo کار می‌کنند؛ مقایسه با ددلاین دارای منطقه زمانی خطا می‌دهد
+        deadline = naive_utc(deadline)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._schedule, promise_id, deadline)
+
+    def cancel(self, promise_id: int):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deadlines.pop, promise_id, None)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._loop = None
+
+    # --- داخلی (فقط روی Event Loop) ---
+    def _schedule(self, promise_id: int, deadline: datetime):
+        self._deadlines.pop(promise_id, None)
+        # ددلاین‌های بیرون از پنجره فعلی در بارگذاری پنجره بعدی خوانده می‌شوند
+        if self._loaded_until is None or deadline >= self._loaded_until:
+            return
+        self._deadlines[promise_id] = deadline
+        heapq.heappush(self._heap, (deadline, promise_id))
+        self._wakeup.set()
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, promise_id = heapq.heappop(self._heap)
+            if self._deadlines.get(promise_id) == deadline:
+                del self._deadlines[promise_id]
+                due.append(promise_id)
+        return due
+
+    def _next_wakeup(self) -> datetime:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if self._heap:
+            return min(self._heap[0][0], self._loaded_until)
+        return self._loaded_until
+
+    async def _load_window(self, now: datetime):
+        until = now + timedelta(minutes=settings.DEADLINE_WINDOW_MINUTES)
+        rows = await asyncio.to_thread(_load_pending, until, settings.DEADLINE_WINDOW_MAX_ROWS)
+        if len(rows) >= settings.DEADLINE_WINDOW_MAX_ROWS:
+            # پنجره پر شد؛ تا آخرین ددلاین خوانده‌شده جلو می‌رویم و بقیه در دور بعد می‌آیند
+            until = rows[-1][1] + timedelta(microseconds=1)
+        self._loaded_until = until
+        for promise_id, deadline in rows:
+            self._deadlines[promise_id] = deadline
+            self._heap.append((deadline, promise_id))
+        heapq.heapify(self._heap)
+
+    async def _run(self):
+        while True:
+            try:
+                now = datetime.utcnow()
+                if self._loaded_until is None or now >= self._loaded_until:
+                    await self._load_window(now)
+
+                due = self._pop_due(now)
+                if due:
+                    pushes = await asyncio.to_thread(_fail_promises, due)
+                    for user_id, payload in pushes:
+                        await manager.send_personal_message(payload, user_id)
+                    continue
+
+                delay = (self._next_wakeup() - datetime.utcnow()).total_seconds()
+                self._wakeup.clear()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Deadline scheduler error: {e}")
+                await asyncio.sleep(1)
+
+
+def _load_pending(until: datetime, max_rows: int) -> List[Tuple[int, datetime]]:
+    db = SessionLocal()
+    try:
+        return db.query(models.Promise.id, models.Promise.deadline).filter(
+            models.Promise.status == models.PromiseStatus.PENDING,
+            models.Promise.deadline < until
+        ).order_by(models.Promise.deadline).limit(max_rows).all()
+    finally:
+        db.close()
+
+
+def _fail_promises(promise_ids: List[int]) -> List[Tuple[int, dict]]:
+    """FAILED کردن قول‌های سررسیده و ثبت نوتیفیکیشن در همان تراکنش (expiry.fail_promises)"""
+    db = SessionLocal()
+    try:
+        _, pushes = fail_promises(db, promise_ids)
+        return pushes
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+scheduler = DeadlineScheduler()
@@ -0,0 +1,286 @@
+# app/services/direct_messages.py
+# نوشتن پیام‌های مستقیم وب‌سوکت با Write-Behind
+#
+# روت وب‌سوکت پیام را فقط در صف این Writer می‌گذارد. یک Task پس‌زمینه هر DM_BATCH_INTERVAL_MS میلی‌ثانیه
+# همه پیام‌های منتظر را در یک تراکنش ذخیره می‌کند: پیدا/ساختن گفتگوها روی کلید یکتای (کوچک‌تر، بزرگ‌تر)،
+# INSERT دسته‌ای پیام‌ها، به‌روزرسانی گفتگوها و اینباکس‌ها (chat.record_messages) و ایندکس جستجو.
+# تا وقتی یک دسته در حال نوشتن است پیام‌های بعدی جمع می‌شوند، پس با بالا رفتن بار دسته‌ها بزرگ‌تر
+# می‌شوند و تعداد تراکنش‌ها تقریباً ثابت می‌ماند.
+#
+# تایید (Ack) هر پیام فقط بعد از commit فرستاده می‌شود؛ پیامی که تایید گرفته از دست نمی‌رود و کلاینت
+# پیام‌های بی‌تایید را بعد از اتصال دوباره با همان client_id می‌فرستد. کلید یکتای (sender_id, client_id) با
+# ON CONFLICT DO NOTHING جلوی ذخیره دوباره را می‌گیرد و پیام تکراری با همان ردیف قبلی تایید می‌شود (بدون ارسال
+# دوباره به گیرنده). تحویل به گیرنده هم بعد از commit و با شناسه واقعی پیام از طریق ConnectionManager انجام
+# می‌شود تا با تاریخچه (صفحه‌بندی روی id) یکی باشد.
+import asyncio
+import datetime
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..cache import TTLCache
+from ..config import settings
+from ..database import SessionLocal
+from . import chat, message_search
+from ..managers.notifications_manager import manager
+
+logger = logging.getLogger(__name__)
+
+_INSERT = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+@dataclass
+class PendingMessage:
+    sender_id: int
+    receiver_id: int
+    content: str
+    future: asyncio.Future
+    client_id: Optional[str] = None
+
+
+def message_payload(message: models.DirectMessage) -> dict:
+    return schemas.MessageResponse.model_validate(message).model_dump(mode="json")
+
+
+class DirectMessageWriter:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # (user1_id, user2_id) -> conversation_id؛ گفتگوها حذف نمی‌شوند پس کش فقط برای محدود ماندن حافظه منقضی می‌شود
+        self._conversations = TTLCache(ttl=3600, maxsize=100_000)
+        self.batches = 0
+        self.messages = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=settings.DM_WRITE_QUEUE_SIZE)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """پیام‌های باقی‌مانده در صف قبل از خاموش شدن نوشته و تایید می‌شوند"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def submit(self, sender_id: int, receiver_id: int, content: str,
+                     client_id: Optional[str] = None) -> asyncio.Future:
+        """
+        پیام را در صف نوشتن می‌گذارد و Futureی برمی‌گرداند که بعد از commit با payload پیام کامل می‌شود
+        (برای client_id تکراری، payload همان پیام ذخیره‌شده قبلی).
+        اگر صف پر باشد همین‌جا منتظر می‌ماند (Backpressure روی حلقه دریافت همان سوکت).
+        """
+        if self._queue is None:
+            raise RuntimeError("direct message writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(PendingMessage(sender_id, receiver_id, content, future, client_id))
+        return future
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "messages": self.messages,
+            "failures": self.failures,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            # چند میلی‌ثانیه صبر تا پیام‌های همزمان هم به همین دسته برسند
+            await asyncio.sleep(settings.DM_BATCH_INTERVAL_MS / 1000)
+            batch, stopping = [first], False
+            while len(batch) < settings.DM_BATCH_MAX_SIZE and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+            if stopping:
+                return
+
+    async def _write(self, batch: List[PendingMessage]):
+        started = time.perf_counter()
+        try:
+            saved = await asyncio.to_thread(self._persist, batch)
+        except Exception:
+            # یک پیام خراب نباید بقیه دسته را از بین ببرد: پیام‌ها یکی‌یکی دوباره نوشته می‌شوند
+            logger.exception("direct message batch of %s failed, retrying one by one", len(batch))
+            saved = []
+            for item in batch:
+                try:
+                    saved.extend(await asyncio.to_thread(self._persist, [item]))
+                except Exception as exc:
+                    self.failures += 1
+                    if not item.future.done():
+                        item.future.set_exception(exc)
+
+        self.batches += 1
+        self.messages += len(saved)
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        for item, payload, _ in saved:
+            if not item.future.done():
+                item.future.set_result(payload)
+        # به ترتیب ذخیره منتشر می‌شوند تا ترتیب پیام‌های هر گفتگو برای گیرنده حفظ شود؛ تکراری‌ها قبلاً رسیده‌اند
+        for item, payload, is_new in saved:
+            if not is_new:
+                continue
+            try:
+                await manager.send_personal_message({"type": "NEW_MESSAGE", "message": payload}, item.receiver_id)
+            except Exception:
+                logger.exception("failed to publish direct message %s", payload["id"])
+
+    # --- داخل Thread (Session همزمان) ---
+    def _persist(self, batch: List[PendingMessage]) -> List[Tuple[PendingMessage, dict, bool]]:
+        """
+        ذخیره یک دسته؛ خروجی (پیام، payload، تازه است؟) به ترتیب صف. پیام بدون client_id یک کلید تصادفی می‌گیرد
+        تا هر ردیف برگشتی از RETURNING با کلیدش به پیام صف وصل شود (ترتیب RETURNING تضمین‌شده نیست).
+        """
+        keys = [(item.sender_id, item.client_id or uuid.uuid4().hex) for item in batch]
+        db = SessionLocal()
+        try:
+            pairs = {chat.canonical_pair(item.sender_id, item.receiver_id) for item in batch}
+            conversation_ids, uncached = self._resolve_conversations(db, pairs)
+
+            now = datetime.datetime.utcnow()
+            message = models.DirectMessage
+            # یک INSERT چندردیفی؛ شناسه‌ها به ترتیب صف داده می‌شوند و ردیف‌های تکراری (sender_id, client_id) رد می‌شوند
+            rows = db.execute(
+                _INSERT[db.get_bind().dialect.name](message)
+                .on_conflict_do_nothing(index_elements=["sender_id", "client_id"])
+                .returning(message.id, message.conversation_id, message.sender_id, message.client_id, message.content,
+                           message.is_edited, message.is_deleted, message.created_at, message.updated_at),
+                [
+                    {"conversation_id": conversation_ids[chat.canonical_pair(item.sender_id, item.receiver_id)],
+                     "sender_id": sender_id, "client_id": client_id, "content": item.content,
+                     "is_edited": False, "is_deleted": False, "created_at": now}
+                    for item, (sender_id, client_id) in zip(batch, keys)
+                ]
+            ).all()
+            inserted = {(row.sender_id, row.client_id): models.DirectMessage(**row._mapping) for row in rows}
+            messages = sorted(inserted.values(), key=lambda m: m.id)
+            chat.record_messages(db, messages)
+            message_search.index_messages(db, messages)
+
+            # ارسال دوباره پیامی که قبلاً ذخیره شده (یا همین حالا در Worker دیگری ذخیره شد)
+            duplicates = [key for key in keys if key not in inserted]
+            if duplicates:
+                inserted.update(self._find_sent(db, duplicates))
+            payloads = {key: message_payload(m) for key, m in inserted.items()}
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        # گفتگوهای تازه فقط بعد از commit کش می‌شوند
+        for pair in uncached:
+            self._conversations.set(pair, conversation_ids[pair])
+        # اگر یک client_id دو بار در همین دسته آمده باشد فقط اولی تازه حساب می‌شود
+        fresh = {m.id for m in messages}
+        saved = []
+        for item, key in zip(batch, keys):
+            payload = payloads[key]
+            saved.append((item, payload, payload["id"] in fresh))
+            fresh.discard(payload["id"])
+        return saved
+
+    @staticmethod
+    def _find_sent(db: Session, keys: List[Tuple[int, str]]) -> Dict[Tuple[int, str], models.DirectMessage]:
+        message = models.DirectMessage
+        return {
+            (m.sender_id, m.client_id): m for m in db.execute(
+                select(message).where(tuple_(message.sender_id, message.client_id).in_(set(keys)))
+            ).scalars()
+        }
+
+    def _resolve_conversations(self, db: Session, pairs: Set[Tuple[int, int]]) -> Tuple[Dict[Tuple[int, int], int], List]:
+        """
+        شناسه گفتگوی هر جفت؛ گفتگوهای جدید با ON CONFLICT DO NOTHING ساخته می‌شوند تا Workerها تکراری نسازند.
+        ردیف‌های عضویت گفتگوهای تازه و گفتگوهای قدیمی‌ای که عضویت (کامل) ندارند هم همین‌جا ساخته می‌شوند،
+        وگرنه UPDATEهای chat.record_messages به هیچ ردیفی نمی‌خورند و گفتگو در اینباکس دیده نمی‌شود.
+        """
+        ids: Dict[Tuple[int, int], int] = {}
+        for pair in pairs:
+            conversation_id = self._conversations.get(pair)
+            if conversation_id is not None:
+                ids[pair] = conversation_id
+        missing = [pair for pair in pairs if pair not in ids]
+        if not missing:
+            return ids, []
+
+        insert = _INSERT.get(db.get_bind().dialect.name)
+        if insert is None:
+            raise RuntimeError(f"Direct messages are not supported on {db.get_bind().dialect.name}")
+        now = datetime.datetime.utcnow()
+        ids.update(self._lookup(db, missing))
+        absent = [pair for pair in missing if pair not in ids]
+        orphans = self._without_participants(db, [ids[pair] for pair in missing if pair in ids])
+        if absent:
+            db.execute(
+                insert(models.Conversation).on_conflict_do_nothing(index_elements=["user1_id", "user2_id"]),
+                [{"user1_id": user1_id, "user2_id": user2_id, "updated_at": now} for user1_id, user2_id in absent]
+            )
+            ids.update(self._lookup(db, absent))
+        unjoined = absent + [pair for pair in missing if ids[pair] in orphans]
+        if unjoined:
+            db.execute(
+                insert(models.ConversationParticipant)
+                .on_conflict_do_nothing(index_elements=["conversation_id", "user_id"]),
+                [
+                    {"conversation_id": ids[(user1_id, user2_id)], "user_id": user_id, "other_user_id": other_id,
+                     "updated_at": now}
+                    for user1_id, user2_id in unjoined
+                    for user_id, other_id in {(user1_id, user2_id), (user2_id, user1_id)}
+                ]
+            )
+        # عضویت تازه گفتگوی قدیمی باید پیش‌نمایش و نخوانده‌های پیام‌های قبلی را داشته باشد
+        for conversation_id in orphans:
+            chat.refresh_inbox_state(db, conversation_id)
+        return ids, missing
+
+    @staticmethod
+    def _without_participants(db: Session, conversation_ids: List[int]) -> Set[int]:
+        """گفتگوهایی از این لیست که کمتر از دو ردیف عضویت دارند (ساخته‌شده قبل از جدول عضویت)"""
+        if not conversation_ids:
+            return set()
+        participant = models.ConversationParticipant
+        joined = db.execute(
+            select(participant.conversation_id)
+            .where(participant.conversation_id.in_(conversation_ids))
+            .group_by(participant.conversation_id)
+            .having(func.count(participant.id) >= 2)
+        ).scalars()
+        return set(conversation_ids) - set(joined)
+
+    @staticmethod
+    def _lookup(db: Session, pairs: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], int]:
+        conversation = models.Conversation
+        rows = db.execute(
+            select(conversation.id, conversation.user1_id, conversation.user2_id)
+            .where(tuple_(conversation.user1_id, conversation.user2_id).in_(list(pairs)))
+        ).all()
+        return {(user1_id, user2_id): conversation_id for conversation_id, user1_id, user2_id in rows}
+
+
+writer = DirectMessageWriter()
@@ -0,0 +1,135 @@
+# app/services/expiry.py
+# موتور منقضی کردن قول‌هایی که ددلاینشان گذشته و هنوز PENDING هستند
+#
+# کار در دسته‌های کوچک (chunk) انجام می‌شود و هر دسته تراکنش خودش را دارد،
+# پس حتی با یک میلیون قول عقب‌افتاده دیتابیس برای مدت طولانی قفل نمی‌ماند.
+# هر دسته فقط سه دستور دارد: خواندن شناسه‌ها روی ایندکس (status, deadline)،
+# یک UPDATE مجموعه‌ای برای وضعیت و یک UPDATE تجمیعی برای جریمه کاربران، و بعد درج دسته‌ای نوتیفیکیشن‌های
+# PROMISE_FAILED. زمان‌بند داخل API (deadline_scheduler.py) و اسکن پشتیبان Celery هر دو از fail_promises استفاده می‌کنند.
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..dependencies import invalidate_user_snapshot
+from . import leaderboard, profiles
+from .notification_service import add_unread, invalidate_unread_counts, notification_payload
+
+
+@dataclass
+class ExpiryReport:
+    processed: int = 0
+    user_updates: int = 0  # مجموع ردیف‌های users که در دسته‌ها جریمه شدند
+    chunk_seconds: List[float] = field(default_factory=list)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.chunk_seconds)
+
+
+def expire_promises(db: Session, promise_ids: Iterable[int]) -> List[Tuple[int, int]]:
+    """
+    تغییر وضعیت قول‌های داده‌شده به FAILED و اعمال جریمه صاحبانشان.
+    فقط قول‌هایی که هنوز PENDING هستند تغییر می‌کنند (اجرای همزمان دو Worker جریمه تکراری نمی‌دهد).
+    commit بر عهده فراخواننده است. خروجی: لیست (promise_id, user_id) قول‌های منقضی شده.
+    """
+    promise_ids = list(promise_ids)
+    if not promise_ids:
+        return []
+
+    failed = db.execute(
+        update(models.Promise)
+        .where(models.Promise.id.in_(promise_ids), models.Promise.status == models.PromiseStatus.PENDING)
+        .values(status=models.PromiseStatus.FAILED)
+        .returning(models.Promise.id, models.Promise.user_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    # جریمه هر کاربر به اندازه تعداد قول‌های شکست‌خورده‌اش، در یک UPDATE
+    failures_per_user = Counter(user_id for _, user_id in failed if user_id is not None)
+    if failures_per_user:
+        failures = case(failures_per_user, value=models.User.id, else_=0)
+        db.execute(
+            update(models.User)
+            .where(models.User.id.in_(failures_per_user.keys()))
+            .values(
+                reputation=func.coalesce(models.User.reputation, 0) + failures * settings.PENALTY_OFFSET,
+                total_failed=func.coalesce(models.User.total_failed, 0) + failures,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    return [(promise_id, user_id) for promise_id, user_id in failed]
+
+
+def fail_promises(db: Session, promise_ids: Iterable[int]) -> Tuple[List[Tuple[int, int]], List[Tuple[int, dict]]]:
+    """
+    FAILED کردن قول‌ها، جریمه صاحبانشان و ثبت نوتیفیکیشن PROMISE_FAILED (با شمارنده نخوانده‌ها) در یک تراکنش،
+    و بعد از commit به‌روزرسانی کش‌ها و رتبه‌بندی.
+    خروجی: (promise_id, user_id) قول‌های منقضی‌شده و (user_id, payload) برای ارسال آنی؛ ارسال بر عهده فراخواننده‌ای
+    است که به ConnectionManager دسترسی دارد (در Celery نوتیفیکیشن از فید و بازپخش اتصال خوانده می‌شود).
+    """
+    failed = expire_promises(db, promise_ids)
+    if not failed:
+        db.rollback()
+        return [], []
+
+    titles = dict(db.query(models.Promise.id, models.Promise.title)
+                  .filter(models.Promise.id.in_([promise_id for promise_id, _ in failed])).all())
+    notifications = [
+        models.Notification(
+            user_id=user_id,
+            type=models.NotificationType.PROMISE_FAILED,
+            title="زمان قول تمام شد",
+            content=f"مهلت قول '{titles.get(promise_id, '')}' به پایان رسید و از اعتبارت کم شد.",
+            link_id=promise_id
+        )
+        for promise_id, user_id in failed if user_id is not None
+    ]
+    db.add_all(notifications)
+    add_unread(db, [notif.user_id for notif in notifications])
+    db.flush()
+    pushes = [(notif.user_id, notification_payload(notif)) for notif in notifications]
+    db.commit()
+
+    owners = {user_id for _, user_id in failed if user_id is not None}
+    leaderboard.sync_users(db, owners)
+    profiles.invalidate_user_profile(owners)
+    invalidate_unread_counts(owners)
+    for user_id in owners:
+        invalidate_user_snapshot(user_id)  # جریمه اعتبار
+    return failed, pushes
+
+
+def expire_overdue_promises(
+        db: Session,
+        now: Optional[datetime] = None,
+        chunk_size: Optional[int] = None,
+) -> ExpiryReport:
+    now = now or datetime.utcnow()
+    chunk_size = chunk_size or settings.EXPIRY_CHUNK_SIZE
+    report = ExpiryReport()
+
+    while True:
+        started = time.perf_counter()
+        ids = db.query(models.Promise.id).filter(
+            models.Promise.status == models.PromiseStatus.PENDING,
+            models.Promise.deadline < now
+        ).order_by(models.Promise.deadline).limit(chunk_size).all()
+        if not ids:
+            break
+
+        failed, _ = fail_promises(db, [promise_id for promise_id, in ids])
+        penalized = {user_id for _, user_id in failed if user_id is not None}
+
+        report.processed += len(failed)
+        report.user_updates += len(penalized)
+        report.chunk_seconds.append(time.perf_counter() - started)
+
+    return report
@@ -0,0 +1,301 @@
+# app/services/leaderboard.py
+# جدول رتبه‌بندی کاربران بر اساس اعتبار (reputation)
+#
+# دو Backend داریم با یک رابط مشترک:
+#   - memory: یک Skip List اندیس‌دار داخل همین پردازه (مناسب توسعه و یک Worker)؛ تغییرات اعتباری که
+#     در پردازه‌های دیگر (Celery یا Workerهای دیگر) انجام شوند فقط با بارگذاری کامل دوره‌ای هر
+#     LEADERBOARD_REFRESH_SECONDS به این پردازه می‌رسند، پس رتبه‌ها تا آن زمان ممکن است کهنه باشند
+#   - redis: Sorted Set ردیس (ZADD / ZREVRANK / ZREVRANGE) که بین همه Workerها مشترک است
+# هر سه عملیات top / rank / around در زمان لگاریتمی (به‌علاوه اندازه خروجی) انجام می‌شوند.
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+
+LEADERBOARD_KEY = "leaderboard:reputation"
+
+_MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class _IndexableSkipList:
+    """
+    Skip List مرتب که طول هر پرش را نگه می‌دارد؛ بنابراین علاوه بر درج و حذف،
+    پیدا کردن جایگاه (rank) یک کلید و دسترسی به عنصر i-ام هم O(log n) است.
+    """
+
+    def __init__(self):
+        self.head = _Node(None, _MAX_LEVEL)
+        self.size = 0
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < _MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def insert(self, key):
+        chain = [None] * _MAX_LEVEL
+        steps_at_level = [0] * _MAX_LEVEL
+        node = self.head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        depth = self._random_level()
+        new_node = _Node(key, depth)
+        steps = 0
+        for level in range(depth):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(depth, _MAX_LEVEL):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * _MAX_LEVEL
+        node = self.head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), _MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def index_of(self, key) -> int:
+        """جایگاه صفر-مبنای کلید در ترتیب صعودی"""
+        position = 0
+        node = self.head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        if node.next[0] is None or node.next[0].key != key:
+            raise KeyError(key)
+        return position
+
+    def slice(self, start: int, count: int) -> list:
+        """count کلید پشت سر هم از جایگاه start"""
+        if start >= self.size or count <= 0:
+            return []
+        remaining = start + 1
+        node = self.head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class InMemoryLeaderboard:
+    def __init__(self):
+        self._scores: Dict[int, int] = {}
+        self._index = _IndexableSkipList()
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    @property
+    def stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > settings.LEADERBOARD_REFRESH_SECONDS
+
+    # کلید مرتب‌سازی: اعتبار بیشتر اول، در تساوی شناسه کوچک‌تر اول
+    @staticmethod
+    def _key(user_id: int, score: int):
+        return -score, user_id
+
+    def set_score(self, user_id: int, score: int):
+        with self._lock:
+            old = self._scores.get(user_id)
+            if old == score:
+                return
+            if old is not None:
+                self._index.remove(self._key(user_id, old))
+            self._scores[user_id] = score
+            self._index.insert(self._key(user_id, score))
+
+    def set_many(self, pairs: Iterable[Tuple[int, int]]):
+        for user_id, score in pairs:
+            self.set_score(user_id, score)
+
+    def replace_all(self, pairs: Iterable[Tuple[int, int]]):
+        """ساخت دوباره کل جدول از روی امتیازهای دیتابیس (کاربران حذف‌شده هم کنار می‌روند)"""
+        scores = dict(pairs)
+        index = _IndexableSkipList()
+        for user_id, score in scores.items():
+            index.insert(self._key(user_id, score))
+        with self._lock:
+            self._scores, self._index = scores, index
+            self.loaded_at = time.monotonic()
+
+    def remove(self, user_id: int):
+        with self._lock:
+            old = self._scores.pop(user_id, None)
+            if old is not None:
+                self._index.remove(self._key(user_id, old))
+
+    def top(self, count: int) -> List[Tuple[int, int, int]]:
+        return self.range(0, count)
+
+    def range(self, start: int, count: int) -> List[Tuple[int, int, int]]:
+        """خروجی: لیست (rank, user_id, score) با rank یک-مبنا"""
+        with self._lock:
+            keys = self._index.slice(start, count)
+        return [(start + i + 1, user_id, -neg_score) for i, (neg_score, user_id) in enumerate(keys)]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            return self._index.index_of(self._key(user_id, score)) + 1
+
+    def around(self, user_id: int, radius: int) -> List[Tuple[int, int, int]]:
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - 1 - radius)
+        return self.range(start, rank - start + radius)
+
+    def total(self) -> int:
+        return self._index.size
+
+
+class RedisLeaderboard:
+    def __init__(self, url: str, key: str = LEADERBOARD_KEY):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._key = key
+
+    @property
+    def loaded(self) -> bool:
+        return self._redis.exists(self._key) > 0
+
+    def set_score(self, user_id: int, score: int):
+        self._redis.zadd(self._key, {str(user_id): score})
+
+    def set_many(self, pairs: Iterable[Tuple[int, int]]):
+        pipe = self._redis.pipeline(transaction=False)
+        for user_id, score in pairs:
+            pipe.zadd(self._key, {str(user_id): score})
+        pipe.execute()
+
+    def remove(self, user_id: int):
+        self._redis.zrem(self._key, str(user_id))
+
+    def top(self, count: int) -> List[Tuple[int, int, int]]:
+        return self.range(0, count)
+
+    def range(self, start: int, count: int) -> List[Tuple[int, int, int]]:
+        if count <= 0:
+            return []
+        rows = self._redis.zrevrange(self._key, start, start + count - 1, withscores=True)
+        return [(start + i + 1, int(member), int(score)) for i, (member, score) in enumerate(rows)]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        rank = self._redis.zrevrank(self._key, str(user_id))
+        return None if rank is None else rank + 1
+
+    def around(self, user_id: int, radius: int) -> List[Tuple[int, int, int]]:
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - 1 - radius)
+        return self.range(start, rank - start + radius)
+
+    def total(self) -> int:
+        return self._redis.zcard(self._key)
+
+
+_board = None
+_board_lock = threading.Lock()
+
+
+def get_board():
+    global _board
+    if _board is None:
+        with _board_lock:
+            if _board is None:
+                if settings.LEADERBOARD_BACKEND == "redis":
+                    _board = RedisLeaderboard(settings.REDIS_URL)
+                else:
+                    _board = InMemoryLeaderboard()
+    return _board
+
+
+def ensure_loaded(db: Session):
+    """
+    بارگذاری اولیه از جدول users (یک بار در هر پردازه یا وقتی Sorted Set خالی است)؛
+    Backend حافظه‌ای علاوه بر این هر LEADERBOARD_REFRESH_SECONDS یک بار کامل از دیتابیس تازه می‌شود.
+    """
+    board = get_board()
+    if isinstance(board, InMemoryLeaderboard):
+        if not board.stale:
+            return board
+    elif board.loaded:
+        return board
+    # کوئری بیرون از قفل اجرا می‌شود تا درخواست‌های همزمان (هر کدام در Thread خودش، routers/users.py)
+    # پشت یک بارگذاری کند منتظر نمانند.
+    # بارگذاری تکراری بی‌خطر است چون set_many / replace_all امتیاز را جایگزین می‌کنند.
+    rows = db.query(models.User.id, models.User.reputation).all()
+    with _board_lock:
+        if isinstance(board, InMemoryLeaderboard):
+            if board.stale:
+                board.replace_all((user_id, reputation or 0) for user_id, reputation in rows)
+        elif not board.loaded:
+            board.set_many((user_id, reputation or 0) for user_id, reputation in rows)
+    return board
+
+
+def sync_users(db: Session, user_ids: Iterable[int]):
+    """
+    بعد از هر تغییر اعتبار (پاداش، جریمه و ...) و پس از commit صدا زده می‌شود
+    تا امتیاز این کاربران از دیتابیس خوانده و در جدول رتبه‌بندی به‌روز شود.
+    """
+    user_ids = list(set(user_ids))
+    board = get_board()
+    if not user_ids or not board.loaded:
+        # اگر هنوز بارگذاری نشده، اولین درخواست رتبه‌بندی همه چیز را از دیتابیس می‌خواند
+        return
+    rows = db.query(models.User.id, models.User.reputation) \
+        .filter(models.User.id.in_(user_ids)).all()
+    board.set_many((user_id, reputation or 0) for user_id, reputation in rows)
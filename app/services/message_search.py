@@ -0,0 +1,206 @@
+# app/services/message_search.py
+# جستجوی متن کامل پیام‌ها: FTS5 روی SQLite و tsvector/GIN روی PostgreSQL
+# متن قبل از ایندکس شدن با app.persian یکسان‌سازی می‌شود، برای همین ایندکس در کد برنامه
+# (و نه با Trigger) همراه ساخت/ویرایش/حذف پیام به‌روز می‌شود.
+# ساخت دوباره ایندکس از روی پیام‌های موجود: python -m app.services.message_search
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..pagination import decode_score_cursor, encode_cursor
+from ..persian import normalize, tokenize
+
+SQLITE_TABLE = "direct_messages_fts"
+POSTGRES_TABLE = "direct_message_search"
+
+_DDL = {
+    "sqlite": [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5("
+        "content, conversation_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')",
+    ],
+    "postgresql": [
+        f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+        "message_id INTEGER PRIMARY KEY REFERENCES direct_messages(id) ON DELETE CASCADE, "
+        "conversation_id INTEGER NOT NULL, document TSVECTOR NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_TABLE}_document ON {POSTGRES_TABLE} USING GIN (document)",
+    ],
+}
+
+_INSERT = {
+    "sqlite": f"INSERT INTO {SQLITE_TABLE} (rowid, content, conversation_id) VALUES (:id, :content, :conversation_id)",
+    "postgresql": f"INSERT INTO {POSTGRES_TABLE} (message_id, conversation_id, document) "
+                  "VALUES (:id, :conversation_id, to_tsvector('simple', :content))",
+}
+
+
+def _dialect(bind) -> str:
+    name = bind.dialect.name
+    if name not in _DDL:
+        raise RuntimeError(f"Full-text message search is not supported on {name}")
+    return name
+
+
+def ensure_schema(bind: Engine):
+    """ساخت جدول ایندکس (اگر وجود ندارد)؛ بعد از create_all صدا زده می‌شود"""
+    with bind.begin() as conn:
+        for statement in _DDL[_dialect(conn)]:
+            conn.execute(text(statement))
+
+
+def drop_schema(bind: Engine):
+    with bind.begin() as conn:
+        table = SQLITE_TABLE if _dialect(conn) == "sqlite" else POSTGRES_TABLE
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+def _remove(conn: Connection, dialect: str, message_id: int):
+    if dialect == "sqlite":
+        conn.execute(text(f"DELETE FROM {SQLITE_TABLE} WHERE rowid = :id"), {"id": message_id})
+    else:
+        conn.execute(text(f"DELETE FROM {POSTGRES_TABLE} WHERE message_id = :id"), {"id": message_id})
+
+
+def index_message(db: Session, message: models.DirectMessage):
+    """افزودن یا جایگزینی متن یک پیام در ایندکس (در همان تراکنش فراخواننده)"""
+    conn = db.connection()
+    dialect = _dialect(conn)
+    _remove(conn, dialect, message.id)
+    if message.is_deleted:
+        return
+    conn.execute(text(_INSERT[dialect]), {
+        "id": message.id, "conversation_id": message.conversation_id, "content": normalize(message.content)
+    })
+
+
+def index_messages(db: Session, messages: Iterable[models.DirectMessage]):
+    """ایندکس یک دسته پیام تازه با یک executemany (پیام تازه هنوز در ایندکس نیست، پس حذف قبلی لازم نیست)"""
+    rows = [
+        {"id": m.id, "conversation_id": m.conversation_id, "content": normalize(m.content)}
+        for m in messages if not m.is_deleted
+    ]
+    if rows:
+        conn = db.connection()
+        conn.execute(text(_INSERT[_dialect(conn)]), rows)
+
+
+def remove_message(db: Session, message_id: int):
+    """پیام حذف‌شده (Soft Delete) دیگر در نتایج جستجو نمی‌آید"""
+    conn = db.connection()
+    _remove(conn, _dialect(conn), message_id)
+
+
+def _ranked_query(dialect: str, conversation_id: Optional[int]) -> str:
+    """
+    شناسه پیام و امتیاز مرتبط بودن (کوچک‌تر = مرتبط‌تر) فقط در گفتگوهایی که کاربر عضو آن‌هاست.
+    امتیاز در هر دو دیتابیس صعودی مرتب می‌شود تا صفحه‌بندی Keyset روی (score, id) یکسان باشد.
+    """
+    scope = "AND s.conversation_id = :conversation_id" if conversation_id is not None else ""
+    if dialect == "sqlite":
+        return (
+            f"SELECT s.rowid AS id, bm25({SQLITE_TABLE}) AS score FROM {SQLITE_TABLE} s "
+            "JOIN conversation_participants p ON p.conversation_id = s.conversation_id AND p.user_id = :user_id "
+            f"WHERE {SQLITE_TABLE} MATCH :query {scope}"
+        )
+    return (
+        "SELECT s.message_id AS id, -ts_rank_cd(s.document, q) AS score "
+        f"FROM {POSTGRES_TABLE} s CROSS JOIN to_tsquery('simple', :query) q "
+        "JOIN conversation_participants p ON p.conversation_id = s.conversation_id AND p.user_id = :user_id "
+        f"WHERE s.document @@ q {scope}"
+    )
+
+
+def _match_expression(dialect: str, tokens: list) -> str:
+    # هر کلمه به صورت پیشوندی جستجو می‌شود و همه کلمات باید در پیام باشند
+    if dialect == "sqlite":
+        return " ".join(f'"{token}"*' for token in tokens)
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def search_messages(db: Session, user_id: int, query: str, conversation_id: Optional[int],
+                    cursor: Optional[str], limit: int) -> dict:
+    tokens = tokenize(query)
+    if not tokens:
+        raise HTTPException(status_code=400, detail="عبارت جستجو معتبر نیست")
+
+    if conversation_id is not None:
+        is_member = db.execute(select(models.ConversationParticipant.id).where(
+            models.ConversationParticipant.conversation_id == conversation_id,
+            models.ConversationParticipant.user_id == user_id
+        )).first()
+        if not is_member:
+            raise HTTPException(status_code=403, detail="عدم دسترسی به این گفتگو")
+
+    conn = db.connection()
+    dialect = _dialect(conn)
+    params = {"user_id": user_id, "query": _match_expression(dialect, tokens), "limit": limit + 1}
+    if conversation_id is not None:
+        params["conversation_id"] = conversation_id
+
+    keyset = ""
+    if cursor:
+        last_score, last_id = decode_score_cursor(cursor)
+        keyset = "WHERE score > :last_score OR (score = :last_score AND id > :last_id)"
+        params.update(last_score=last_score, last_id=last_id)
+
+    rows = conn.execute(text(
+        f"SELECT id, score FROM ({_ranked_query(dialect, conversation_id)}) ranked {keyset} "
+        "ORDER BY score, id LIMIT :limit"
+    ), params).all()
+
+    page = rows[:limit]
+    messages = {}
+    if page:
+        messages = {
+            m.id: m for m in db.execute(
+                select(models.DirectMessage).where(models.DirectMessage.id.in_(bindparam("ids", expanding=True))),
+                {"ids": [row.id for row in page]}
+            ).scalars()
+        }
+
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1].score, page[-1].id)
+    return {
+        "items": [schemas.MessageResponse.model_validate(messages[row.id]) for row in page if row.id in messages],
+        "next_cursor": next_cursor,
+    }
+
+
+def rebuild_index(db: Session, batch_size: int = 5000) -> int:
+    """پاک کردن و ساختن دوباره ایندکس از روی همه پیام‌های حذف‌نشده"""
+    conn = db.connection()
+    dialect = _dialect(conn)
+    conn.execute(text(f"DELETE FROM {SQLITE_TABLE if dialect == 'sqlite' else POSTGRES_TABLE}"))
+
+    indexed, last_id = 0, 0
+    while True:
+        batch = db.execute(
+            select(models.DirectMessage.id, models.DirectMessage.conversation_id, models.DirectMessage.content)
+            .where(models.DirectMessage.id > last_id, models.DirectMessage.is_deleted.isnot(True))
+            .order_by(models.DirectMessage.id).limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        conn.execute(text(_INSERT[dialect]), [
+            {"id": row.id, "conversation_id": row.conversation_id, "content": normalize(row.content)}
+            for row in batch
+        ])
+        indexed += len(batch)
+        last_id = batch[-1].id
+    db.commit()
+    return indexed
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, engine
+
+    ensure_schema(engine)
+    session = SessionLocal()
+    try:
+        print(f"Indexed {rebuild_index(session)} messages")
+    finally:
+        session.close()
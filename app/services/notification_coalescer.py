@@ -0,0 +1,368 @@
+# app/services/notification_coalescer.py
+# ادغام نوتیفیکیشن‌های پرتکرار (تایید و اقتباس قول) و خلاصه روزانه
+#
+# روی یک قول پرطرفدار هر تایید یک ردیف Notification و یک ارسال وب‌سوکت برای صاحب قول می‌ساخت. حالا رویدادهای
+# ادغام‌پذیر (انواع داخل TEMPLATES) به جای create_notification فقط در حافظه با کلید (user_id, type, link_id)
+# شمرده می‌شوند و یک Task پس‌زمینه هر NOTIFICATION_COALESCE_INTERVAL ثانیه همه گروه‌ها را در یک تراکنش اعمال می‌کند:
+#   - اگر کاربر در NOTIFICATION_COALESCE_WINDOW_SECONDS گذشته نوتیفیکیشن نخوانده‌ای با همین کلید دارد، آن ردیف حذف
+#     و در همان تراکنش یک ردیف تازه (event_count + n و متن «n نفر ...») جایش ساخته می‌شود و شمارنده نخوانده‌ها
+#     تغییر نمی‌کند. شناسه و created_at تازه لازم است: بازپخش اتصال (id > last_seen_id) و فید (created_at, id)
+#     فقط با آن نسخه ادغام‌شده را می‌بینند؛ ارسال آنی شناسه ردیف حذف‌شده را در replaces_id می‌فرستد
+#   - وگرنه یک ردیف تازه ساخته و شمارنده نخوانده‌ها یکی زیاد می‌شود
+#   - کاربرانی که حالت خلاصه روزانه دارند فقط یک شمارنده در notification_digest_items می‌گیرند که تسک Celery
+#     روزی یک بار به یک نوتیفیکیشن خلاصه تبدیل می‌کند (send_digests)
+# ارسال آنی یک نوتیفیکیشن ادغام‌شده حداکثر هر NOTIFICATION_PUSH_MIN_INTERVAL ثانیه یک بار است؛ به‌روزرسانی‌های بین
+# دو ارسال کنار گذاشته می‌شوند و آخرین وضعیت در اولین نوبت مجاز فرستاده می‌شود (کلاینت نوتیفیکیشن replaces_id را با آن جایگزین می‌کند).
+#
+# رویدادهای جمع‌شده با خاموش شدن عادی سرور (stop) نوشته می‌شوند؛ در کرش پردازه حداکثر رویدادهای چند ثانیه آخر
+# از دست می‌رود که برای این نوع نوتیفیکیشن (برخلاف پیام مستقیم) پذیرفتنی است.
+import asyncio
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..cache import TTLCache
+from ..config import settings
+from ..database import SessionLocal
+from .notification_service import add_unread, invalidate_unread_counts, notification_payload
+from ..managers.notifications_manager import manager
+
+logger = logging.getLogger(__name__)
+
+_INSERT = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+# (user_id, type, link_id)
+Key = Tuple[int, models.NotificationType, int]
+
+
+@dataclass(frozen=True)
+class Template:
+    title: str
+    single: str  # {subject}
+    multiple: str  # {count} و {subject}
+
+    def render(self, count: int, subject: str) -> str:
+        if count == 1:
+            return self.single.format(subject=subject)
+        return self.multiple.format(count=count, subject=subject)
+
+
+TEMPLATES: Dict[models.NotificationType, Template] = {
+    models.NotificationType.VOUCH_RECEIVED: Template(
+        title="تایید جدید!",
+        single="یک نفر قول '{subject}' را تایید کرد.",
+        multiple="{count} نفر قول '{subject}' را تایید کردند.",
+    ),
+    models.NotificationType.PROMISE_ADOPTED: Template(
+        title="چالش جدید!",
+        single="یک نفر قول '{subject}' را برای خودش برداشت.",
+        multiple="{count} نفر قول '{subject}' را برای خودشان برداشتند.",
+    ),
+}
+
+_DIGEST_TITLE = "خلاصه روزانه"
+_DIGEST_MAX_LINES = 10
+
+
+@dataclass
+class _Group:
+    count: int
+    subject: str
+    first_at: datetime.datetime
+
+
+class NotificationCoalescer:
+    def __init__(self):
+        self._pending: Dict[Key, _Group] = {}
+        # کلید -> آخرین payload که به خاطر محدودیت فاصله ارسال هنوز فرستاده نشده است
+        # (کلید و نه شناسه، چون هر ادغام شناسه تازه‌ای می‌سازد)
+        self._deferred: Dict[Key, dict] = {}
+        # کلیدهایی که در NOTIFICATION_PUSH_MIN_INTERVAL گذشته ارسال شده‌اند
+        self._recently_pushed = TTLCache(ttl=settings.NOTIFICATION_PUSH_MIN_INTERVAL, maxsize=100_000)
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.events = 0
+        self.flushes = 0
+        self.inserted = 0
+        self.merged = 0
+        self.digested = 0
+        self.pushes = 0
+        self.failures = 0
+
+    async def start(self):
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """رویدادهای جمع‌شده و ارسال‌های عقب‌افتاده قبل از خاموش شدن اعمال می‌شوند"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        self._wake = None
+
+    def add(self, user_id: int, notif_type: models.NotificationType, link_id: int, subject: str):
+        """ثبت یک رویداد؛ فقط شمارنده حافظه را زیاد می‌کند و بعد از commit تراکنش اصلی صدا زده می‌شود"""
+        if notif_type not in TEMPLATES:
+            raise ValueError(f"{notif_type} notifications are not coalesced; use create_notification")
+        key = (user_id, notif_type, link_id)
+        group = self._pending.get(key)
+        if group is None:
+            self._pending[key] = _Group(1, subject, datetime.datetime.utcnow())
+        else:
+            group.count += 1
+            group.subject = subject
+        self.events += 1
+        if len(self._pending) >= settings.NOTIFICATION_COALESCE_MAX_PENDING and self._wake is not None:
+            self._wake.set()
+
+    def stats(self) -> dict:
+        return {
+            "pending_groups": len(self._pending),
+            "deferred_pushes": len(self._deferred),
+            "events": self.events,
+            "flushes": self.flushes,
+            "inserted": self.inserted,
+            "merged": self.merged,
+            "digested": self.digested,
+            "pushes": self.pushes,
+            "failures": self.failures,
+        }
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.NOTIFICATION_COALESCE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush(force_push=self._stopping)
+
+    async def flush(self, force_push: bool = False):
+        """اعمال همه گروه‌های منتظر در دیتابیس و ارسال نوتیفیکیشن‌هایی که نوبت ارسالشان رسیده است"""
+        groups, self._pending = self._pending, {}
+        if groups:
+            try:
+                saved = await asyncio.to_thread(self._persist, groups)
+            except Exception:
+                # گروه‌ها برمی‌گردند تا در نوبت بعد دوباره نوشته شوند
+                logger.exception("failed to apply %s coalesced notification groups", len(groups))
+                self.failures += 1
+                for key, group in groups.items():
+                    current = self._pending.get(key)
+                    if current is None:
+                        self._pending[key] = group
+                    else:
+                        current.count += group.count
+                        current.first_at = group.first_at
+            else:
+                self.flushes += 1
+                for key, payload in saved:
+                    previous = self._deferred.get(key)
+                    if previous is not None and payload.get("replaces_id") == previous["id"]:
+                        # نسخه قبلی هیچ‌وقت فرستاده نشده؛ کلاینت هنوز ردیفی را دارد که آن نسخه جایگزینش می‌کرد
+                        payload = {**payload, "replaces_id": previous.get("replaces_id")}
+                        if payload["replaces_id"] is None:
+                            del payload["replaces_id"]
+                    self._deferred[key] = payload
+
+        ready = []
+        for key, payload in list(self._deferred.items()):
+            if force_push or self._recently_pushed.get(key) is None:
+                ready.append((key[0], payload))
+                del self._deferred[key]
+                self._recently_pushed.set(key, True)
+        if ready:
+            try:
+                await manager.send_many(ready)
+                self.pushes += len(ready)
+            except Exception:
+                # نوتیفیکیشن‌ها ذخیره شده‌اند و از API یا بازپخش اتصال دوباره خوانده می‌شوند
+                logger.exception("coalesced notification push failed for %s recipients", len(ready))
+
+    # --- داخل Thread (Session همزمان) ---
+    def _persist(self, groups: Dict[Key, _Group]) -> List[Tuple[Key, dict]]:
+        db = SessionLocal()
+        try:
+            user = models.User
+            digest_users = set(db.execute(
+                select(user.id).where(user.id.in_({key[0] for key in groups}), user.notification_digest == True)
+            ).scalars().all())
+            digest = {key: group for key, group in groups.items() if key[0] in digest_users}
+            immediate = {key: group for key, group in groups.items() if key[0] not in digest_users}
+
+            if digest:
+                self._record_digest(db, digest)
+
+            saved: List[Tuple[Key, dict]] = []
+            fresh: Dict[Key, _Group] = {}
+            existing = self._find_unread(db, immediate.keys()) if immediate else {}
+            for key, group in immediate.items():
+                payload = self._merge(db, existing[key], key, group) if key in existing else None
+                if payload is None:
+                    fresh[key] = group
+                else:
+                    saved.append((key, payload))
+            if fresh:
+                saved.extend(self._insert(db, fresh))
+                add_unread(db, [key[0] for key in fresh])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        invalidate_unread_counts({key[0] for key in fresh})
+        self.inserted += len(fresh)
+        self.merged += len(immediate) - len(fresh)
+        self.digested += len(digest)
+        return saved
+
+    @staticmethod
+    def _find_unread(db: Session, keys: Iterable[Key]) -> Dict[Key, int]:
+        """جدیدترین نوتیفیکیشن نخوانده داخل پنجره ادغام برای هر کلید (روی ایندکس user_id, is_read)"""
+        keys = set(keys)
+        notification = models.Notification
+        since = datetime.datetime.utcnow() - datetime.timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW_SECONDS)
+        rows = db.execute(
+            select(notification.id, notification.user_id, notification.type, notification.link_id)
+            .where(
+                notification.user_id.in_({key[0] for key in keys}),
+                notification.is_read == False,
+                notification.type.in_({key[1] for key in keys}),
+                notification.link_id.in_({key[2] for key in keys}),
+                notification.created_at >= since,
+            )
+        ).all()
+        found: Dict[Key, int] = {}
+        for notification_id, user_id, notif_type, link_id in rows:
+            key = (user_id, notif_type, link_id)
+            if key in keys and notification_id > found.get(key, 0):
+                found[key] = notification_id
+        return found
+
+    @staticmethod
+    def _merge(db: Session, notification_id: int, key: Key, group: _Group) -> Optional[dict]:
+        """
+        جایگزینی نوتیفیکیشن موجود با یک ردیف تازه که رویدادهای جدید را هم شمرده است. DELETE ... RETURNING شمارنده
+        فعلی را برمی‌دارد، پس از دو Worker همزمان فقط یکی ردیف را ادغام می‌کند و دیگری ردیف تازه می‌سازد (بدون
+        گم شدن رویداد). اگر کاربر در این فاصله آن را خوانده باشد None برمی‌گردد.
+        """
+        notification = models.Notification
+        old = db.execute(
+            delete(notification)
+            .where(notification.id == notification_id, notification.is_read == False)
+            .returning(notification.event_count)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if old is None:
+            return None
+        merged = _Group((old.event_count or 1) + group.count, group.subject, datetime.datetime.utcnow())
+        payload = NotificationCoalescer._insert(db, {key: merged})[0][1]
+        payload["replaces_id"] = notification_id
+        return payload
+
+    @staticmethod
+    def _insert(db: Session, groups: Dict[Key, _Group]) -> List[Tuple[Key, dict]]:
+        notification = models.Notification
+        rows = db.execute(
+            insert(notification).returning(
+                notification.id, notification.user_id, notification.type, notification.title,
+                notification.content, notification.link_id, notification.event_count, notification.created_at
+            ),
+            [
+                {"user_id": user_id, "type": notif_type, "link_id": link_id, "is_read": False,
+                 "title": TEMPLATES[notif_type].title,
+                 "content": TEMPLATES[notif_type].render(group.count, group.subject),
+                 "event_count": group.count, "created_at": group.first_at}
+                for (user_id, notif_type, link_id), group in groups.items()
+            ]
+        ).all()
+        return [((row.user_id, row.type, row.link_id), notification_payload(models.Notification(**row._mapping)))
+                for row in rows]
+
+    @staticmethod
+    def _record_digest(db: Session, groups: Dict[Key, _Group]):
+        dialect = db.get_bind().dialect.name
+        if dialect not in _INSERT:
+            raise RuntimeError(f"Notification digests are not supported on {dialect}")
+        item = models.NotificationDigestItem
+        statement = _INSERT[dialect](item)
+        now = datetime.datetime.utcnow()
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=["user_id", "type", "link_id"],
+                set_={
+                    "event_count": item.event_count + statement.excluded.event_count,
+                    "subject": statement.excluded.subject,
+                    "last_at": statement.excluded.last_at,
+                }
+            ),
+            [
+                {"user_id": user_id, "type": notif_type, "link_id": link_id, "subject": group.subject,
+                 "event_count": group.count, "first_at": group.first_at, "last_at": now}
+                for (user_id, notif_type, link_id), group in groups.items()
+            ]
+        )
+
+
+def send_digests(db: Session, chunk_size: Optional[int] = None) -> int:
+    """
+    تبدیل رویدادهای جمع‌شده هر کاربر به یک نوتیفیکیشن خلاصه (تسک روزانه Celery)؛ تعداد خلاصه‌های ساخته‌شده را برمی‌گرداند.
+    ردیف‌ها با DELETE ... RETURNING برداشته می‌شوند، پس رویدادی که همزمان ثبت شود به خلاصه بعدی می‌رسد و دوبار شمرده نمی‌شود.
+    خلاصه‌ها بیرون از پردازه API ساخته می‌شوند و ارسال آنی ندارند؛ کاربر آن‌ها را در فید، Badge و بازپخش اتصال می‌بیند.
+    """
+    chunk_size = chunk_size or settings.NOTIFICATION_DIGEST_CHUNK_SIZE
+    item = models.NotificationDigestItem
+    sent = 0
+    after = 0
+    while True:
+        user_ids = db.execute(
+            select(item.user_id).where(item.user_id > after).group_by(item.user_id)
+            .order_by(item.user_id).limit(chunk_size)
+        ).scalars().all()
+        if not user_ids:
+            return sent
+        after = user_ids[-1]
+
+        rows = db.execute(
+            delete(item).where(item.user_id.in_(user_ids))
+            .returning(item.user_id, item.type, item.subject, item.event_count)
+            .execution_options(synchronize_session=False)
+        ).all()
+        lines: Dict[int, List[Tuple[int, str]]] = {}
+        for user_id, notif_type, subject, count in rows:
+            lines.setdefault(user_id, []).append((count, TEMPLATES[notif_type].render(count, subject or "")))
+
+        notifications = []
+        for user_id, entries in lines.items():
+            entries.sort(key=lambda entry: entry[0], reverse=True)
+            content = [text for _, text in entries[:_DIGEST_MAX_LINES]]
+            if len(entries) > _DIGEST_MAX_LINES:
+                content.append(f"و {len(entries) - _DIGEST_MAX_LINES} مورد دیگر.")
+            notifications.append({
+                "user_id": user_id, "type": models.NotificationType.SYSTEM_MESSAGE, "title": _DIGEST_TITLE,
+                "content": "\n".join(content), "link_id": None, "is_read": False,
+                "event_count": sum(count for count, _ in entries), "created_at": datetime.datetime.utcnow(),
+            })
+        if notifications:
+            db.execute(insert(models.Notification), notifications)
+            add_unread(db, lines.keys())
+        db.commit()
+        invalidate_unread_counts(lines.keys())
+        sent += len(notifications)
+
+
+coalescer = NotificationCoalescer()
@@ -1,8 +1,62 @@
 # app/services/notification_service.py
-from ..models import Notification, NotificationType
-from app.managers.notifications_manager import manager
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from .. import database
+from ..cache import TTLCache
+from ..config import settings
+from ..models import Notification, NotificationType, User
+from ..pagination import decode_time_cursor, encode_cursor
+from app.managers.notifications_manager import manager
+
+# شمارنده نخوانده‌ها به ازای user_id؛ با هر تغییر در همین پردازه باطل می‌شود و در بقیه Workerها حداکثر
+# به اندازه NOTIFICATION_COUNT_CACHE_TTL قدیمی می‌ماند
+_unread_cache = TTLCache(ttl=settings.NOTIFICATION_COUNT_CACHE_TTL, maxsize=100_000)
+
+
+def notification_payload(notif: Notification) -> dict:
+    """قالب پیامی که از طریق وب‌سوکت برای کلاینت فرستاده می‌شود"""
+    return {
+        "id": notif.id,
+        "title": notif.title,
+        "content": notif.content,
+        "type": notif.type.value,
+        "link_id": notif.link_id,
+        "event_count": notif.event_count or 1,
+        "created_at": str(notif.created_at)
+    }
+
+
+async def missed_notifications(user_id: int, last_seen_id: int) -> List[dict]:
+    """
+    نوتیفیکیشن‌های بعد از last_seen_id برای بازپخش هنگام اتصال دوباره (یک اسکن بازه‌ای روی ایندکس user_id, id).
+    اگر بیشتر از WS_REPLAY_LIMIT مورد جا مانده باشد فقط جدیدترین‌ها برمی‌گردند و قبلشان یک پیام
+    REPLAY_TRUNCATED می‌آید تا کلاینت قدیمی‌ترها را از API بخواند.
+    """
+    limit = settings.WS_REPLAY_LIMIT
+    async with database.AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Notification)
+            .where(Notification.user_id == user_id, Notification.id > last_seen_id)
+            .order_by(Notification.id.desc())
+            .limit(limit + 1)
+        )).scalars().all()
+
+    payloads = [notification_payload(notif) for notif in reversed(rows[:limit])]
+    if len(rows) > limit:
+        payloads.insert(0, {"type": "REPLAY_TRUNCATED", "before_id": payloads[0]["id"]})
+    return payloads
+
+
+async def push_notification(notif: Notification):
+    # ارسال آنی در صورت آنلاین بودن کاربر
+    await manager.send_personal_message(notification_payload(notif), notif.user_id)
+
+
 async def create_notification(
     db: Session,
     user_id: int,
@@ -20,15 +74,99 @@ async def create_notification(
         link_id=link_id
     )
     db.add(new_notif)
+    add_unread(db, [user_id])
     db.commit()
     db.refresh(new_notif)
+    invalidate_unread_counts([user_id])
 
     # ۲. ارسال آنی در صورت آنلاین بودن کاربر
-    await manager.send_personal_message({
-        "id": new_notif.id,
-        "title": title,
-        "content": content,
-        "type": notif_type.value,
-        "link_id": link_id,
-        "created_at": str(new_notif.created_at)
-    }, user_id)
\ No newline at end of file
+    await push_notification(new_notif)
+    return new_notif
+
+
+def add_unread(db: Session, user_ids: Iterable[int]):
+    """
+    افزایش شمارنده نخوانده‌ها برای نوتیفیکیشن‌های تازه، در همان تراکنش درج (commit بر عهده فراخواننده است).
+    هر شناسه به تعداد تکرارش اضافه می‌شود؛ کاربران با تعداد یکسان در یک UPDATE ... WHERE id IN جمع می‌شوند.
+    """
+    by_count = defaultdict(list)
+    for user_id, count in Counter(user_ids).items():
+        by_count[count].append(user_id)
+    for count, ids in by_count.items():
+        db.execute(
+            update(User)
+            .where(User.id.in_(ids))
+            .values(unread_notifications=User.unread_notifications + count)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def invalidate_unread_counts(user_ids: Iterable[int]):
+    """بعد از commit هر تغییر شمارنده صدا زده می‌شود"""
+    for user_id in user_ids:
+        _unread_cache.pop(user_id)
+
+
+async def get_unread_count(db: AsyncSession, user_id: int) -> int:
+    """تعداد نخوانده‌ها از کش یا با خواندن یک ستون از ردیف کاربر (بدون شمردن جدول نوتیفیکیشن‌ها)"""
+    count = _unread_cache.get(user_id)
+    if count is None:
+        count = (await db.execute(
+            select(User.unread_notifications).where(User.id == user_id)
+        )).scalar_one_or_none() or 0
+        _unread_cache.set(user_id, count)
+    return count
+
+
+async def get_feed(db: AsyncSession, user_id: int, unread_only: bool, cursor: Optional[str], limit: int) -> dict:
+    """فید نوتیفیکیشن‌ها با صفحه‌بندی Keyset روی (created_at, id) و ایندکس (user_id, created_at)"""
+    query = select(Notification).where(Notification.user_id == user_id)
+    if unread_only:
+        query = query.where(Notification.is_read == False)
+    if cursor:
+        last_created_at, last_id = decode_time_cursor(cursor)
+        query = query.where(or_(
+            Notification.created_at < last_created_at,
+            and_(Notification.created_at == last_created_at, Notification.id < last_id)
+        ))
+
+    rows = (await db.execute(
+        query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1)
+    )).scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+async def mark_all_read(db: AsyncSession, user_id: int):
+    # اول ردیف کاربر قفل می‌شود: درج همزمانی که شمارنده را افزایش داده تا commit خودش صبر می‌کند
+    # و UPDATE بعدی (با Snapshot تازه) نوتیفیکیشن آن را هم خوانده می‌کند؛ شمارنده و ردیف‌ها هم‌خوان می‌مانند
+    await db.execute(update(User).where(User.id == user_id).values(unread_notifications=0))
+    await db.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.is_read == False)
+        .values(is_read=True)
+    )
+    await db.commit()
+    invalidate_unread_counts([user_id])
+
+
+async def mark_read(db: AsyncSession, user_id: int, notification_id: int) -> bool:
+    """خواندن یک نوتیفیکیشن؛ شمارنده فقط اگر ردیف واقعاً از نخوانده به خوانده تغییر کند کم می‌شود"""
+    result = await db.execute(
+        update(Notification)
+        .where(Notification.id == notification_id, Notification.user_id == user_id, Notification.is_read == False)
+        .values(is_read=True)
+    )
+    if result.rowcount:
+        await db.execute(
+            update(User)
+            .where(User.id == user_id, User.unread_notifications > 0)
+            .values(unread_notifications=User.unread_notifications - 1)
+        )
+    await db.commit()
+    invalidate_unread_counts([user_id])
+    return bool(result.rowcount)
@@ -0,0 +1,75 @@
+# app/services/profiles.py
+# پروفایل عمومی کاربران: آمار با یک کوئری تجمیعی، لیست قول‌ها با صفحه‌بندی Keyset
+# و یک کش کوتاه‌مدت که با هر تغییر در قول‌های کاربر باطل می‌شود
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..cache import TTLCache
+from ..config import settings
+from ..pagination import decode_time_cursor, encode_cursor
+
+_profile_cache = TTLCache(ttl=settings.PROFILE_CACHE_TTL, maxsize=2048)
+
+
+def invalidate_user_profile(user_ids: Iterable[int]):
+    """بعد از ساخت/ویرایش/حذف/تکمیل/شکست قول‌های کاربر یا تغییر پروفایلش صدا زده می‌شود"""
+    user_ids = set(user_ids)
+    if user_ids:
+        _profile_cache.discard_where(lambda key, value: value["id"] in user_ids)
+
+
+def get_public_profile(db: Session, username: str, cursor: Optional[str], limit: int) -> dict:
+    cache_key = (username, cursor, limit)
+    cached = _profile_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # ۱. پیدا کردن کاربر بر اساس یوزرنیم
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="کاربر مورد نظر پیدا نشد")
+
+    # ۲. آمار کلی با یک GROUP BY روی ایندکس (user_id, ...)
+    counts = dict(
+        db.query(models.Promise.status, func.count(models.Promise.id))
+        .filter(models.Promise.user_id == user.id)
+        .group_by(models.Promise.status).all()
+    )
+
+    # ۳. یک صفحه از قول‌های کاربر (جدیدترین‌ها اول)
+    query = db.query(models.Promise).filter(models.Promise.user_id == user.id)
+    if cursor:
+        last_created_at, last_id = decode_time_cursor(cursor)
+        query = query.filter(or_(
+            models.Promise.created_at < last_created_at,
+            and_(models.Promise.created_at == last_created_at, models.Promise.id < last_id)
+        ))
+    rows = query.order_by(models.Promise.created_at.desc(), models.Promise.id.desc()) \
+        .limit(limit + 1).all()
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].id)
+
+    profile = {
+        "id": user.id,
+        "username": user.username,
+        "display_name": user.display_name,
+        "bio": user.bio,
+        "coins": user.coins,
+        "reputation": user.reputation,
+        "promises": [schemas.PromiseResponse.model_validate(p) for p in page],
+        "next_cursor": next_cursor,
+        "stats": {
+            "total_promises": sum(counts.values()),
+            "completed": counts.get(models.PromiseStatus.COMPLETED, 0),
+            "failed": counts.get(models.PromiseStatus.FAILED, 0)
+        }
+    }
+    _profile_cache.set(cache_key, profile)
+    return profile
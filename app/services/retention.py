@@ -0,0 +1,204 @@
+# app/services/retention.py
+# نگهداری جدول notifications: انتقال نوتیفیکیشن‌های خوانده‌شده قدیمی به آرشیو
+#
+# دو سیاست به ترتیب اجرا می‌شوند (هر دو فقط روی is_read = true؛ نخوانده‌ها و شمارنده Badge دست نمی‌خورند):
+#   - سن: خوانده‌شده‌های قدیمی‌تر از NOTIFICATION_RETENTION_DAYS
+#   - تعداد: برای کاربرانی که بیش از NOTIFICATION_KEEP_PER_USER نوتیفیکیشن دارند، خوانده‌شده‌های قدیمی‌تر از N تای آخر
+#
+# انتقال در دسته‌های NOTIFICATION_ARCHIVE_CHUNK_SIZE تایی و هر دسته در تراکنش کوتاه خودش انجام می‌شود
+# (خواندن ردیف‌ها، نوشتن در آرشیو، DELETE با کلید اصلی)، پس هیچ قفل طولانی روی جدول نمی‌ماند.
+# آرشیو یا جدول notifications_archive است یا یک فایل NDJSON فشرده (gzip) که قبل از DELETE هر دسته
+# روی دیسک نوشته (fsync) می‌شود؛ قطع شدن کار وسط دسته در بدترین حالت ردیف تکراری در آرشیو می‌گذارد، نه ردیف گم‌شده.
+#
+# اجرا: python -m app.services.retention  (و تسک Celery worker.compact_notifications)
+import datetime
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+
+_COLUMNS = ("id", "user_id", "type", "title", "content", "link_id", "is_read", "created_at", "event_count")
+
+
+@dataclass
+class RetentionReport:
+    aged: int = 0  # منتقل‌شده به خاطر سن
+    overflow: int = 0  # منتقل‌شده به خاطر سقف تعداد هر کاربر
+    bytes_reclaimed: int = 0  # حجم تقریبی داده‌های حذف‌شده از جدول اصلی (JSON هر ردیف)
+    archive_bytes: int = 0  # حجم فایل فشرده (فقط در حالت file)
+    archive_path: Optional[str] = None
+    chunk_seconds: List[float] = field(default_factory=list)
+
+    @property
+    def moved(self) -> int:
+        return self.aged + self.overflow
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.chunk_seconds)
+
+
+class _Archive:
+    """مقصد آرشیو؛ write قبل از DELETE هر دسته و در همان تراکنش صدا زده می‌شود"""
+
+    def __init__(self, backend: str, directory: str):
+        if backend not in ("table", "file"):
+            raise ValueError(f"unknown notification archive backend: {backend}")
+        self.backend = backend
+        self.path: Optional[str] = None
+        self._file = None
+        if backend == "file":
+            os.makedirs(directory, exist_ok=True)
+            stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+            self.path = os.path.join(directory, f"notifications-{stamp}.ndjson.gz")
+
+    def write(self, db: Session, rows: List[dict], lines: List[bytes]):
+        if self.backend == "table":
+            now = datetime.datetime.utcnow()
+            db.execute(insert(models.NotificationArchive), [{**row, "archived_at": now} for row in rows])
+            return
+        if self._file is None:
+            self._file = gzip.open(self.path, "ab")
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> int:
+        if self._file is not None:
+            self._file.close()
+        return os.path.getsize(self.path) if self.path and os.path.exists(self.path) else 0
+
+
+def _move_chunk(db: Session, archive: _Archive, ids: List[int]) -> Tuple[int, int]:
+    """انتقال یک دسته به آرشیو و حذف از جدول اصلی در یک تراکنش؛ (تعداد ردیف، حجم تقریبی داده) را برمی‌گرداند"""
+    notification = models.Notification
+    rows = [
+        dict(zip(_COLUMNS, values)) for values in db.execute(
+            select(*(getattr(notification, column) for column in _COLUMNS))
+            .where(notification.id.in_(ids), notification.is_read == True)
+        ).all()
+    ]
+    if not rows:
+        db.rollback()
+        return 0, 0
+    lines = [
+        (json.dumps({**row, "type": row["type"].value if row["type"] else None,
+                     "created_at": row["created_at"].isoformat() if row["created_at"] else None},
+                    ensure_ascii=False) + "\n").encode()
+        for row in rows
+    ]
+    archive.write(db, rows, lines)
+    db.execute(
+        delete(notification)
+        .where(notification.id.in_([row["id"] for row in rows]))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return len(rows), sum(len(line) for line in lines)
+
+
+def _aged_chunks(db: Session, cutoff: datetime.datetime, chunk_size: int) -> Iterator[List[int]]:
+    notification = models.Notification
+    after = 0
+    while True:
+        ids = db.execute(
+            select(notification.id)
+            .where(notification.id > after, notification.is_read == True, notification.created_at < cutoff)
+            .order_by(notification.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            return
+        yield ids
+        after = ids[-1]
+
+
+def _overflow_chunks(db: Session, keep: int, chunk_size: int) -> Iterator[List[int]]:
+    """خوانده‌شده‌های قدیمی‌تر از keep تای آخر هر کاربر؛ شناسه‌های چند کاربر در یک دسته جمع می‌شوند"""
+    notification = models.Notification
+    heavy_users = db.execute(
+        select(notification.user_id)
+        .group_by(notification.user_id)
+        .having(func.count(notification.id) > keep)
+    ).scalars().all()
+
+    pending: List[int] = []
+    for user_id in heavy_users:
+        # شناسه keep اُمین نوتیفیکیشن جدید کاربر روی ایندکس (user_id, id)؛ قدیمی‌ترها نامزد انتقال‌اند
+        boundary = db.execute(
+            select(notification.id).where(notification.user_id == user_id)
+            .order_by(notification.id.desc()).offset(keep - 1).limit(1)
+        ).scalar_one_or_none()
+        if boundary is None:
+            continue
+        after = 0
+        while True:
+            ids = db.execute(
+                select(notification.id)
+                .where(notification.user_id == user_id, notification.is_read == True,
+                       notification.id > after, notification.id < boundary)
+                .order_by(notification.id)
+                .limit(chunk_size)
+            ).scalars().all()
+            if not ids:
+                break
+            after = ids[-1]
+            pending.extend(ids)
+            while len(pending) >= chunk_size:
+                yield pending[:chunk_size]
+                pending = pending[chunk_size:]
+    if pending:
+        yield pending
+
+
+def compact_notifications(
+        db: Session,
+        now: Optional[datetime.datetime] = None,
+        retention_days: Optional[int] = None,
+        keep_per_user: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        backend: Optional[str] = None,
+) -> RetentionReport:
+    now = now or datetime.datetime.utcnow()
+    retention_days = retention_days if retention_days is not None else settings.NOTIFICATION_RETENTION_DAYS
+    keep_per_user = keep_per_user if keep_per_user is not None else settings.NOTIFICATION_KEEP_PER_USER
+    chunk_size = chunk_size or settings.NOTIFICATION_ARCHIVE_CHUNK_SIZE
+    archive = _Archive(backend or settings.NOTIFICATION_ARCHIVE_BACKEND, settings.NOTIFICATION_ARCHIVE_DIR)
+    report = RetentionReport(archive_path=archive.path)
+
+    try:
+        passes = [("aged", _aged_chunks(db, now - datetime.timedelta(days=retention_days), chunk_size))]
+        if keep_per_user > 0:
+            passes.append(("overflow", _overflow_chunks(db, keep_per_user, chunk_size)))
+        for policy, chunks in passes:
+            started = time.perf_counter()
+            for ids in chunks:
+                moved, reclaimed = _move_chunk(db, archive, ids)
+                setattr(report, policy, getattr(report, policy) + moved)
+                report.bytes_reclaimed += reclaimed
+                report.chunk_seconds.append(time.perf_counter() - started)
+                started = time.perf_counter()
+    finally:
+        report.archive_bytes = archive.close()
+    return report
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        result = compact_notifications(session)
+        print(f"Archived {result.moved} notifications ({result.aged} aged, {result.overflow} over the per-user cap), "
+              f"~{result.bytes_reclaimed} bytes reclaimed in {result.total_seconds:.2f}s"
+              + (f", archive {result.archive_path} ({result.archive_bytes} bytes)" if result.archive_path else ""))
+    finally:
+        session.close()
@@ -0,0 +1,137 @@
+# app/services/trending.py
+# موتور ترندینگ: هر اقتباس یا تایید، امتیاز قول اصلی را به صورت افزایشی بالا می‌برد
+#
+# به جای اینکه امتیاز همه قول‌ها را مدام کاهش دهیم (Decay)، وزن رویدادهای جدید را
+# بزرگ‌تر می‌کنیم: weight * 2^((t - EPOCH) / half_life). ترتیب امتیازها دقیقاً همان ترتیب
+# امتیاز کاهش‌یافته در لحظه حال است، پس هیچ ردیفی نیاز به بازنویسی دوره‌ای ندارد.
+# برای جلوگیری از سرریز، مقدار لگاریتمی ذخیره می‌شود.
+# ثبت رویداد یک UPSERT اتمیک است (جمع لگاریتمی داخل خود SQL)، پس اولین رویدادهای همزمان یک قول
+# روی کلید اصلی trending_scores با هم تداخل ندارند. SQLite باید توابع ریاضی (ln/exp، نسخه 3.35+) را داشته باشد.
+import math
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased
+
+from .. import models, schemas
+from ..cache import TTLCache
+from ..config import settings
+
+EPOCH = datetime(2024, 1, 1)
+
+# dialect -> (insert، بزرگ‌ترین، کوچک‌ترین) برای UPSERT امتیاز
+_UPSERT = {
+    "sqlite": (sqlite_insert, func.max, func.min),
+    "postgresql": (postgresql_insert, func.greatest, func.least),
+}
+
+_response_cache = TTLCache(ttl=settings.TRENDING_CACHE_TTL, maxsize=64)
+
+
+def _log_weight(weight: float, at: datetime) -> float:
+    hours = (at - EPOCH).total_seconds() / 3600
+    return math.log(weight) + hours / settings.TRENDING_HALF_LIFE_HOURS * math.log(2)
+
+
+def _log_add(a: float, b: float) -> float:
+    """log(e^a + e^b) بدون سرریز"""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def root_promise_id(promise: models.Promise) -> int:
+    return promise.parent_id or promise.id
+
+
+def record_event(db: Session, promise_id: int, weight: float, at: Optional[datetime] = None):
+    """
+    ثبت یک رویداد (اقتباس/تایید) برای قول اصلی. commit بر عهده فراخواننده است
+    تا امتیاز در همان تراکنش رویداد ذخیره شود.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in _UPSERT:
+        raise RuntimeError(f"Trending scores are not supported on {dialect}")
+    insert, greatest, least = _UPSERT[dialect]
+
+    now = at or datetime.utcnow()
+    statement = insert(models.TrendingScore).values(
+        promise_id=promise_id, score=_log_weight(weight, now), updated_at=now
+    )
+    # همان _log_add داخل SQL: high + ln(1 + exp(low - high))
+    current, added = models.TrendingScore.score, statement.excluded.score
+    high, low = greatest(current, added), least(current, added)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["promise_id"],
+        set_={"score": high + func.ln(1 + func.exp(low - high)), "updated_at": statement.excluded.updated_at}
+    ))
+
+
+def record_adoption(db: Session, original: models.Promise):
+    record_event(db, root_promise_id(original), settings.TRENDING_ADOPTION_WEIGHT)
+
+
+def get_trending(db: Session, limit: int) -> List[schemas.TrendingPromiseResponse]:
+    """
+    بالاترین امتیازها از روی ایندکس score خوانده می‌شوند (هزینه O(limit)).
+    نتیجه برای چند ثانیه کش می‌شود تا درخواست‌های پشت سر هم به دیتابیس نرسند.
+    """
+    cached = _response_cache.get(limit)
+    if cached is not None:
+        return cached
+
+    promises = db.query(models.Promise) \
+        .join(models.TrendingScore, models.TrendingScore.promise_id == models.Promise.id) \
+        .order_by(models.TrendingScore.score.desc()) \
+        .limit(limit).all()
+
+    result = [schemas.TrendingPromiseResponse.model_validate(p) for p in promises]
+    _response_cache.set(limit, result)
+    return result
+
+
+def rebuild_trending_scores(db: Session) -> int:
+    """
+    بازسازی کامل امتیازها از روی داده‌های موجود (برای اولین راه‌اندازی یا اصلاح).
+    اقتباس‌ها با زمان ساختشان وزن می‌گیرند؛ تاییدها زمان ندارند و با زمان حال حساب می‌شوند.
+    """
+    now = datetime.utcnow()
+    scores = {}
+
+    def add(promise_id, weight, at):
+        contribution = _log_weight(weight, at)
+        current = scores.get(promise_id)
+        scores[promise_id] = contribution if current is None else _log_add(current, contribution)
+
+    parent = aliased(models.Promise)
+    adoptions = db.query(func.coalesce(parent.parent_id, parent.id), models.Promise.created_at) \
+        .join(parent, parent.id == models.Promise.parent_id)
+    for root_id, created_at in adoptions.yield_per(1000):
+        add(root_id, settings.TRENDING_ADOPTION_WEIGHT, created_at or now)
+
+    vouches = db.query(
+        func.coalesce(models.Promise.parent_id, models.Promise.id),
+        models.Promise.vouch_count
+    ).filter(models.Promise.vouch_count > 0)
+    for promise_id, count in vouches.yield_per(1000):
+        add(promise_id, settings.TRENDING_VOUCH_WEIGHT * count, now)
+
+    db.query(models.TrendingScore).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.TrendingScore, [
+        {"promise_id": promise_id, "score": score} for promise_id, score in scores.items()
+    ])
+    db.commit()
+    _response_cache.clear()
+    return len(scores)
+
+
+if __name__ == "__main__":
+    from ..database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"Rebuilt trending scores for {rebuild_trending_scores(session)} promises")
+    finally:
+        session.close()
@@ -0,0 +1,95 @@
+# app/services/vouching.py
+# ثبت رای تایید (Vouch) بدون Race Condition
+#
+# - تکراری بودن رای با Unique Constraint روی (promise_id, validator_id) کنترل می‌شود، نه با SELECT قبلی
+# - شمارنده با UPDATE ... SET vouch_count = vouch_count + 1 RETURNING افزایش پیدا می‌کند
+# - تکمیل قول با یک UPDATE شرطی (WHERE status = PENDING_APPROVAL) انجام می‌شود؛ فقط درخواستی
+#   که این UPDATE برایش یک ردیف تغییر می‌دهد پاداش را ثبت می‌کند، پس پاداش دقیقاً یک بار داده می‌شود
+# - امتیاز ترند در همان تراکنش با UPSERT اتمیک (trending.record_event) ثبت می‌شود تا اولین رای‌های همزمان
+#   روی کلید trending_scores تداخل نکنند
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from . import trending
+
+
+@dataclass
+class VouchResult:
+    vouch_count: int
+    completed: bool  # آیا همین رای باعث تایید نهایی قول شد
+    owner_id: int
+    title: str  # عنوان قول برای متن نوتیفیکیشن تایید
+
+
+def cast_vouch(db: Session, promise_id: int, voter_id: int) -> VouchResult:
+    promise = db.query(models.Promise.user_id, models.Promise.parent_id, models.Promise.title) \
+        .filter(models.Promise.id == promise_id).first()
+
+    if not promise:
+        raise HTTPException(status_code=404, detail="قول پیدا نشد")
+
+    if promise.user_id == voter_id:
+        raise HTTPException(status_code=400, detail="نمی‌تونی به قول خودت رای بدی!")
+
+    # ۱. ثبت رای؛ رای تکراری توسط دیتابیس رد می‌شود
+    db.add(models.Validation(promise_id=promise_id, validator_id=voter_id))
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="قبلاً به این قول رای دادی")
+
+    # ۲. افزایش اتمیک شمارنده و خواندن مقدار جدید در همان رفت و برگشت
+    vouch_count = db.execute(
+        update(models.Promise)
+        .where(models.Promise.id == promise_id)
+        .values(vouch_count=models.Promise.vouch_count + 1)
+        .returning(models.Promise.vouch_count)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+    # ۳. انتقال شرطی وضعیت؛ در رقابت چند رای همزمان فقط یکی برنده می‌شود
+    completed = False
+    if vouch_count >= settings.VOUCH_THRESHOLD:
+        completed = db.execute(
+            update(models.Promise)
+            .where(
+                models.Promise.id == promise_id,
+                models.Promise.status == models.PromiseStatus.PENDING_APPROVAL,
+                models.Promise.vouch_count >= settings.VOUCH_THRESHOLD
+            )
+            .values(status=models.PromiseStatus.COMPLETED)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    if completed:
+        # پاداش به صاحب قول (بدون خواندن ردیف کاربر)
+        db.execute(
+            update(models.User)
+            .where(models.User.id == promise.user_id)
+            .values(
+                reputation=models.User.reputation + settings.REPUTATION_REWARD,
+                coins=models.User.coins + settings.COIN_REWARD,
+                total_completed=models.User.total_completed + 1,
+                unread_notifications=models.User.unread_notifications + 1  # نوتیفیکیشن پایین
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.add(models.Notification(
+            user_id=promise.user_id,
+            type=models.NotificationType.PROMISE_COMPLETED,
+            title="قول تایید شد",
+            content=f"تبریک! قول '{promise.title}' تایید نهایی شد و جایزه گرفتی.",
+            link_id=promise_id
+        ))
+
+    trending.record_event(db, promise.parent_id or promise_id, settings.TRENDING_VOUCH_WEIGHT)
+    db.commit()
+
+    return VouchResult(vouch_count=vouch_count, completed=completed, owner_id=promise.user_id, title=promise.title)
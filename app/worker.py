@@ -1,8 +1,10 @@
 from celery import Celery
 from celery.schedules import crontab
-from database import SessionLocal
-import models
-from datetime import datetime
+from app.config import settings
+from app.database import SessionLocal
+from app.services.expiry import expire_overdue_promises
+from app.services.notification_coalescer import send_digests
+from app.services.retention import compact_notifications
 
 celery_app = Celery(
     "worker",
@@ -11,26 +13,16 @@ celery_app = Celery(
 )
 
 
-@celery_app.task
+# نام تسک ثابت نگه داشته شده تا زمان‌بندی beat پایین با اجرای `celery -A app.worker` هم کار کند
+@celery_app.task(name="worker.monitor_promises")
 def monitor_promises():
     # ایجاد یک Session تازه برای این تسک
     db = SessionLocal()
     try:
-        now = datetime.utcnow()
-        # پیدا کردن قول‌های منقضی شده
-        expired_promises = db.query(models.Promise).filter(
-            models.Promise.deadline < now,
-            models.Promise.status == models.PromiseStatus.PENDING
-        ).all()
-
-        for promise in expired_promises:
-            promise.status = models.PromiseStatus.FAILED
-            # جریمه کاربر
-            if promise.owner:
-                promise.owner.reputation -= 5
-                promise.owner.total_failed += 1
-
-        db.commit()
+        report = expire_overdue_promises(db)
+        if report.processed:
+            print(f"Expired {report.processed} promises in {len(report.chunk_seconds)} chunks "
+                  f"({report.total_seconds:.2f}s, slowest chunk {max(report.chunk_seconds):.3f}s)")
     except Exception as e:
         print(f"Error in Celery Task: {e}")
         db.rollback()
@@ -38,10 +30,50 @@ def monitor_promises():
         db.close()  # بسیار حیاتی برای جلوگیری از کراش دیتابیس
 
 
-# تنظیم زمان‌بندی هر ۱ دقیقه
+@celery_app.task(name="worker.compact_notifications")
+def compact_notifications_task():
+    # انتقال نوتیفیکیشن‌های خوانده‌شده قدیمی به آرشیو (تنظیمات NOTIFICATION_RETENTION_* / ARCHIVE_*)
+    db = SessionLocal()
+    try:
+        report = compact_notifications(db)
+        if report.moved:
+            print(f"Archived {report.moved} notifications ({report.aged} aged, {report.overflow} over cap), "
+                  f"~{report.bytes_reclaimed} bytes reclaimed in {report.total_seconds:.2f}s")
+    except Exception as e:
+        print(f"Error in Celery Task: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+@celery_app.task(name="worker.send_notification_digests")
+def send_notification_digests():
+    # خلاصه روزانه تاییدها و اقتباس‌ها برای کاربرانی که حالت خلاصه را فعال کرده‌اند
+    db = SessionLocal()
+    try:
+        sent = send_digests(db)
+        if sent:
+            print(f"Sent {sent} notification digests")
+    except Exception as e:
+        print(f"Error in Celery Task: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+# ددلاین‌ها به صورت لحظه‌ای توسط زمان‌بند داخل API (services/deadline_scheduler.py) اجرا می‌شوند؛
+# این اسکن فقط پشتیبان است تا اگر API مدتی خاموش بود، قول‌های عقب‌افتاده جا نمانند
 celery_app.conf.beat_schedule = {
-    "check-deadlines-every-minute": {
+    "check-deadlines-backstop": {
         "task": "worker.monitor_promises",
-        "schedule": 60.0,
+        "schedule": float(settings.EXPIRY_BACKSTOP_SECONDS),
+    },
+    "compact-notifications": {
+        "task": "worker.compact_notifications",
+        "schedule": float(settings.NOTIFICATION_RETENTION_INTERVAL_SECONDS),
+    },
+    "send-notification-digests": {
+        "task": "worker.send_notification_digests",
+        "schedule": crontab(hour=settings.NOTIFICATION_DIGEST_HOUR, minute=0),
     },
 }
\ No newline at end of file
@@ -0,0 +1,282 @@
+# benchmarks/api_load.py
+# بنچمارک بار روی خود اپلیکیشن (app.main.app) با داده مصنوعی
+#
+# اجرا (از ریشه پروژه):
+#   python -m benchmarks.api_load --concurrency 20 --requests 500 --out bench_results.json
+#   python -m benchmarks.api_load --baseline bench_baseline.json --fail-on-regression
+#   python -m benchmarks.api_load --only feed,leaderboard --users 5000 --promises 100000
+#
+# برای هر endpoint زمان پاسخ (p50/p95/p99)، توان عملیاتی و تعداد کوئری SQL به ازای هر درخواست گزارش می‌شود.
+# endpointها یکی‌یکی اجرا می‌شوند تا شمارش کوئری‌ها (با listener روی هر دو Engine) به همان endpoint تعلق بگیرد.
+# دیتابیس همیشه یک فایل SQLite تازه است مگر --db-url داده شود؛ آدرس قبل از import شدن app تنظیم می‌شود
+# چون Engineها هنگام import ساخته می‌شوند.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.seed import DatasetSize
+
+# یک درخواست: (متد، مسیر، شناسه کاربری که توکنش فرستاده می‌شود یا None)
+RequestSpec = Tuple[str, str, Optional[int]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[random.Random, dict], RequestSpec]
+
+
+def _random_user(rng, ctx):
+    return rng.randint(1, ctx["users"])
+
+
+def _chat_history(rng, ctx):
+    conversation_id, user_id = rng.choice(ctx["conversations"])
+    return "GET", f"/messages/history/{conversation_id}", user_id
+
+
+def _inbox(rng, ctx):
+    _, user_id = rng.choice(ctx["conversations"])
+    return "GET", "/messages/inbox", user_id
+
+
+def _message_search(rng, ctx):
+    # متن پیام‌های مصنوعی شماره پیام را دارد؛ جستجوی پیشوندی روی یک عدد چند نتیجه محدود دارد
+    _, user_id = rng.choice(ctx["conversations"])
+    return "GET", f"/messages/search?query=message+{rng.randint(1, ctx['messages'])}", user_id
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("feed", lambda rng, ctx: ("GET", "/promises/?limit=20", None)),
+    Scenario("feed_deep_page", lambda rng, ctx: ("GET", f"/promises/?limit=20&cursor={ctx['deep_cursor']}", None)),
+    Scenario("trending", lambda rng, ctx: ("GET", "/promises/trending?limit=10", None)),
+    Scenario("promise_detail", lambda rng, ctx: ("GET", f"/promises/{rng.randint(1, ctx['promises'])}", None)),
+    Scenario("leaderboard", lambda rng, ctx: ("GET", "/users/leaderboard?limit=50", None)),
+    Scenario("leaderboard_me", lambda rng, ctx: ("GET", "/users/leaderboard/me?radius=5", _random_user(rng, ctx))),
+    Scenario("profile", lambda rng, ctx: ("GET", f"/users/profile/user_{_random_user(rng, ctx)}", None)),
+    Scenario("me", lambda rng, ctx: ("GET", "/users/me", _random_user(rng, ctx))),
+    Scenario("notifications", lambda rng, ctx: ("GET", "/notifications/", _random_user(rng, ctx))),
+    Scenario("unread_count", lambda rng, ctx: ("GET", "/notifications/unread-count", _random_user(rng, ctx))),
+    Scenario("inbox", _inbox),
+    Scenario("chat_history", _chat_history),
+    Scenario("message_search", _message_search),
+    Scenario("store_items", lambda rng, ctx: ("GET", "/store/items?category=avatar", None)),
+    Scenario("store_search", lambda rng, ctx: ("GET", "/store/items?search=item%201", None)),
+]
+
+
+class QueryCounter:
+    """همه کوئری‌های هر دو Engine (sync و async) را می‌شمارد"""
+
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def drive(client: httpx.AsyncClient, scenario: Scenario, ctx: dict, tokens: Dict[int, str],
+                concurrency: int, requests: int, rng: random.Random) -> Tuple[List[float], int, float]:
+    specs = [scenario.build(rng, ctx) for _ in range(requests)]
+    latencies: List[float] = []
+    errors = 0
+    queue = asyncio.Queue()
+    for spec in specs:
+        queue.put_nowait(spec)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            method, path, user_id = queue.get_nowait()
+            headers = {"Authorization": f"Bearer {tokens[user_id]}"} if user_id else {}
+            started = time.perf_counter()
+            response = await client.request(method, path, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_scenarios(app, counter: QueryCounter, ctx: dict, tokens: Dict[int, str], scenarios: List[Scenario],
+                        concurrency: int, requests: int, warmup: int, seed: int) -> Dict[str, dict]:
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for scenario in scenarios:
+            rng = random.Random(f"{seed}:{scenario.name}")
+            await drive(client, scenario, ctx, tokens, min(concurrency, warmup), warmup, rng)
+
+            queries_before = counter.count
+            latencies, errors, elapsed = await drive(client, scenario, ctx, tokens, concurrency, requests, rng)
+            queries = counter.count - queries_before
+
+            latencies.sort()
+            results[scenario.name] = {
+                "requests": requests,
+                "errors": errors,
+                "requests_per_second": round(requests / elapsed, 1),
+                "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+                "queries_per_request": round(queries / requests, 2),
+            }
+            print(f"{scenario.name:<16} {results[scenario.name]}", file=sys.stderr)
+    return results
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> Dict[str, dict]:
+    """مقایسه با baseline؛ افزایش p95 بیش از threshold درصد یا هر افزایش در تعداد کوئری رگرسیون است"""
+    report = {}
+    for name, result in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        p95_change = (result["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+        rps_change = (result["requests_per_second"] - base["requests_per_second"]) / base["requests_per_second"] * 100 \
+            if base["requests_per_second"] else 0.0
+        queries_change = result["queries_per_request"] - base["queries_per_request"]
+        report[name] = {
+            "p95_change_pct": round(p95_change, 1),
+            "rps_change_pct": round(rps_change, 1),
+            "queries_per_request_change": round(queries_change, 2),
+            "regression": p95_change > threshold or queries_change > 0,
+        }
+    return report
+
+
+def prepare(size: DatasetSize, seed: int):
+    """seed کردن دیتابیس تازه و ساخت context لازم برای سناریوها (بعد از تنظیم DATABASE_URL)"""
+    from app import auth_utils, models
+    from app.database import SessionLocal, engine
+    from app.pagination import encode_cursor
+    from app.services.chat import rebuild_participants
+    from app.services.counters import rebuild_engagement_counters, rebuild_unread_notifications
+    from app.services.message_search import drop_schema, ensure_schema, rebuild_index
+    from app.services.trending import rebuild_trending_scores
+    from benchmarks.seed import seed_dataset
+
+    drop_schema(engine)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    ensure_schema(engine)
+
+    db = SessionLocal()
+    try:
+        seed_dataset(db, size, random.Random(seed))
+        rebuild_engagement_counters(db)
+        rebuild_unread_notifications(db)
+        rebuild_trending_scores(db)
+        rebuild_participants(db)
+        rebuild_index(db)
+
+        conversations = [
+            (conversation_id, user_id)
+            for conversation_id, user_id in db.query(models.Conversation.id, models.Conversation.user1_id)
+        ]
+        # کرسر وسط فید برای اندازه‌گیری صفحه‌های عمیق
+        middle = db.query(models.Promise).order_by(models.Promise.created_at.desc(), models.Promise.id.desc()) \
+            .offset(size.promises // 2).first()
+        deep_cursor = encode_cursor(middle.created_at, middle.id) if middle else ""
+    finally:
+        db.close()
+
+    tokens = {user_id: auth_utils.create_access_token({"sub": str(user_id)})
+              for user_id in range(1, size.users + 1)}
+    ctx = {"users": size.users, "promises": size.promises, "messages": size.messages,
+           "conversations": conversations, "deep_cursor": deep_cursor}
+    return ctx, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process API load test with synthetic data")
+    parser.add_argument("--db-url", default=None, help="sync URL; defaults to a fresh temporary SQLite file")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=300, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", default=None, help="comma separated scenario names")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="write results JSON to this file")
+    parser.add_argument("--baseline", default=None, help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed p95 slowdown in percent")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    for field in fields(DatasetSize):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, default=field.default)
+    args = parser.parse_args()
+
+    db_url = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_api.db")
+    os.environ["DATABASE_URL"] = db_url
+    # زمان‌بند ددلاین در این بنچمارک لازم نیست (ASGITransport رویداد lifespan را اجرا نمی‌کند)
+    os.environ.setdefault("DEADLINE_SCHEDULER_ENABLED", "false")
+
+    size = DatasetSize(**{field.name: getattr(args, field.name) for field in fields(DatasetSize)})
+    scenarios = SCENARIOS
+    if args.only:
+        wanted = set(args.only.split(","))
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in wanted]
+
+    started = time.perf_counter()
+    ctx, tokens = prepare(size, args.seed)
+    seed_seconds = time.perf_counter() - started
+
+    from app.database import async_engine, engine
+    from app.main import app
+
+    counter = QueryCounter([engine, async_engine.sync_engine])
+    endpoints = asyncio.run(run_scenarios(
+        app, counter, ctx, tokens, scenarios, args.concurrency, args.requests, args.warmup, args.seed
+    ))
+
+    results = {
+        "meta": {
+            "db": engine.dialect.name,
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "requests_per_endpoint": args.requests,
+            "dataset": asdict(size),
+            "seed_seconds": round(seed_seconds, 2),
+        },
+        "endpoints": endpoints,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results["comparison"] = compare(endpoints, baseline.get("endpoints", {}), args.threshold)
+        regressions = [name for name, row in results["comparison"].items() if row["regression"]]
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    print(output)
+
+    if regressions and args.fail_on_regression:
+        print(f"regressions: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/broadcast_roundtrip.py
+# بررسی RedisBroadcast و مسیریابی ConnectionManager بین دو پردازه روی سرور ردیس ساختگی (benchmarks/fake_redis.py)
+# یا یک ردیس واقعی، به همراه زمان رفت‌وبرگشت PUBLISH تا تحویل به سوکت.
+#
+# اجرا (از ریشه پروژه):
+#   python -m benchmarks.broadcast_roundtrip
+#   python -m benchmarks.broadcast_roundtrip --redis-url redis://localhost:6379/0 --messages 5000
+#
+# دو ConnectionManager (مثل دو Worker) هر کدام با RedisBroadcast خودش ساخته می‌شوند و بررسی می‌شود که:
+#   پیام کاربر فقط به Workerی می‌رسد که سوکت او را دارد، کاربر آفلاین هیچ Subscriberی ندارد،
+#   بعد از قطع سوکت Subscription برداشته می‌شود و کانال‌های مشترک (add_handler) به همه Workerها می‌رسند.
+# در صورت شکست هر بررسی با کد خروج ۱ تمام می‌شود.
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from app.managers.broadcast import RedisBroadcast, user_channel
+from app.managers.notifications_manager import ConnectionManager
+from benchmarks.fake_redis import FakeRedisServer
+
+SHARED_CHANNEL = "bench:shared"
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.received = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+    async def send_json(self, message: dict):
+        message = dict(message, received_at=time.perf_counter())
+        self.received.append(message)
+
+
+async def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+async def run(redis_url: str, messages: int) -> dict:
+    server = None
+    if redis_url is None:
+        server = FakeRedisServer()
+        redis_url = await server.start()
+
+    shared = {"a": [], "b": []}
+    workers = {}
+    for name in ("a", "b"):
+        worker = ConnectionManager(RedisBroadcast(redis_url))
+
+        async def on_shared(message, name=name):
+            shared[name].append(message)
+
+        worker.add_handler(SHARED_CHANNEL, on_shared)
+        await worker.start()
+        workers[name] = worker
+    a, b = workers["a"], workers["b"]
+    checks = {}
+    try:
+        socket_1, socket_2 = FakeWebSocket(), FakeWebSocket()
+        await a.connect(1, socket_1)
+        await b.connect(2, socket_2)
+
+        # کاربر ۱ روی a و کاربر ۲ روی b؛ کاربر ۳ هیچ سوکتی ندارد
+        await b.send_personal_message({"type": "TEST", "n": 1}, 1)
+        await a.send_many([(2, {"type": "TEST", "n": 2}), (3, {"type": "TEST", "n": 3})])
+        checks["cross_worker_delivery"] = await wait_for(lambda: socket_1.received and socket_2.received)
+        await asyncio.sleep(0.05)
+        checks["delivered_once"] = [m["n"] for m in socket_1.received] == [1] and \
+            [m["n"] for m in socket_2.received] == [2]
+        if server is not None:
+            checks["offline_user_not_subscribed"] = server.subscribers(user_channel(3)) == 0
+
+        await a.publish(SHARED_CHANNEL, {"n": 4})
+        checks["shared_channel_reaches_all"] = await wait_for(lambda: shared["a"] and shared["b"])
+
+        # زمان رفت‌وبرگشت: انتشار از b تا رسیدن به سوکت روی a
+        socket_1.received.clear()
+        sent_at = {}
+        for n in range(messages):
+            sent_at[n] = time.perf_counter()
+            await b.send_personal_message({"type": "TEST", "n": n}, 1)
+        checks["all_messages_delivered"] = await wait_for(lambda: len(socket_1.received) >= messages, timeout=30)
+        latencies = sorted(m["received_at"] - sent_at[m["n"]] for m in socket_1.received)
+        checks["order_preserved"] = [m["n"] for m in socket_1.received] == list(range(messages))
+
+        await a.disconnect(1, socket_1)
+        if server is not None:
+            checks["unsubscribed_after_disconnect"] = await wait_for(
+                lambda: server.subscribers(user_channel(1)) == 0)
+        before = len(socket_1.received)
+        await b.send_personal_message({"type": "TEST", "n": -1}, 1)
+        await asyncio.sleep(0.05)
+        checks["no_delivery_after_disconnect"] = len(socket_1.received) == before
+    finally:
+        for worker in workers.values():
+            await worker.stop()
+        if server is not None:
+            await server.stop()
+
+    return {
+        "redis": "fake" if server is not None else redis_url,
+        "messages": messages,
+        "p50_ms": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+        "p99_ms": round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 3) if latencies else None,
+        "checks": checks,
+        "ok": all(checks.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis broadcast round-trip check")
+    parser.add_argument("--redis-url", default=None, help="real Redis server; defaults to an in-process fake server")
+    parser.add_argument("--messages", type=int, default=1000)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.redis_url, args.messages))
+    print(json.dumps(result, indent=2))
+    if not result["ok"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
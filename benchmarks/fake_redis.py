@@ -0,0 +1,142 @@
+# benchmarks/fake_redis.py
+# یک سرور کوچک سازگار با پروتکل ردیس (RESP2 و RESP3) فقط با دستورهای Pub/Sub، برای آزمودن RedisBroadcast
+# (app/managers/broadcast.py) بدون نصب ردیس واقعی.
+#
+# پشتیبانی: HELLO / SUBSCRIBE / UNSUBSCRIBE / PUBLISH / PING / SELECT / CLIENT (همیشه OK). داده‌ای ذخیره نمی‌شود.
+# کلاینت‌هایی که با HELLO 3 به RESP3 می‌روند (پیش‌فرض redis-py 8) پیام‌های Pub/Sub را به شکل Push (>) می‌گیرند.
+#
+# اجرای جداگانه (از ریشه پروژه) و وصل کردن اپلیکیشن به آن:
+#   python -m benchmarks.fake_redis --port 6390
+#   BROADCAST_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn app.main:app
+import argparse
+import asyncio
+from typing import Dict, List, Optional, Set
+
+
+def _bulk(value: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(*items: bytes) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+def _push(protocol: int, *items: bytes) -> bytes:
+    """فریم Pub/Sub: در RESP3 از نوع Push و در RESP2 یک آرایه معمولی"""
+    return (b">%d\r\n" % len(items) + b"".join(items)) if protocol == 3 else _array(*items)
+
+
+def _integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+class FakeRedisServer:
+    def __init__(self):
+        self._channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self._protocols: Dict[asyncio.StreamWriter, int] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.published = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """شروع گوش دادن؛ آدرس redis:// سرور را برمی‌گرداند (port=0 یعنی یک پورت آزاد)"""
+        self._server = await asyncio.start_server(self._serve, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def subscribers(self, channel: str) -> int:
+        return len(self._channels.get(channel.encode(), ()))
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # دستور Inline (مثلاً از telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed: Set[bytes] = set()
+        self._protocols[writer] = 2
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                if not command:
+                    continue
+                name, args = command[0].upper(), command[1:]
+                protocol = self._protocols[writer]
+                if name == b"HELLO":
+                    protocol = self._protocols[writer] = int(args[0]) if args else protocol
+                    fields = (_bulk(b"server"), _bulk(b"redis"), _bulk(b"version"), _bulk(b"7.0.0"),
+                              _bulk(b"proto"), _integer(protocol))
+                    writer.write((b"%%%d\r\n" % (len(fields) // 2) + b"".join(fields)) if protocol == 3
+                                 else _array(*fields))
+                elif name == b"SUBSCRIBE":
+                    for channel in args:
+                        self._channels.setdefault(channel, set()).add(writer)
+                        subscribed.add(channel)
+                        writer.write(_push(protocol, _bulk(b"subscribe"), _bulk(channel), _integer(len(subscribed))))
+                elif name == b"UNSUBSCRIBE":
+                    for channel in args or sorted(subscribed):
+                        self._unsubscribe(writer, channel)
+                        subscribed.discard(channel)
+                        writer.write(_push(protocol, _bulk(b"unsubscribe"), _bulk(channel), _integer(len(subscribed))))
+                elif name == b"PUBLISH":
+                    channel, data = args
+                    receivers = list(self._channels.get(channel, ()))
+                    for receiver in receivers:
+                        receiver.write(_push(self._protocols.get(receiver, 2),
+                                             _bulk(b"message"), _bulk(channel), _bulk(data)))
+                    self.published += 1
+                    writer.write(_integer(len(receivers)))
+                elif name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name in (b"SELECT", b"CLIENT"):
+                    writer.write(b"+OK\r\n")
+                else:
+                    writer.write(b"-ERR unknown command '%s'\r\n" % name)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self._unsubscribe(writer, channel)
+            self._protocols.pop(writer, None)
+            writer.close()
+
+    def _unsubscribe(self, writer: asyncio.StreamWriter, channel: bytes):
+        writers = self._channels.get(channel)
+        if writers is not None:
+            writers.discard(writer)
+            if not writers:
+                del self._channels[channel]
+
+
+async def serve_forever(host: str, port: int):
+    server = FakeRedisServer()
+    print(f"fake redis listening on {await server.start(host, port)}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal Redis-protocol pub/sub server for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(serve_forever(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
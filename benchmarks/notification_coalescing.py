@@ -0,0 +1,103 @@
+# benchmarks/notification_coalescing.py
+# حجم نوشتن و ارسال نوتیفیکیشن‌های تایید روی قول‌های پرطرفدار با ادغام (services/notification_coalescer.py):
+# N رویداد تایید با توزیع Zipf روی چند قول پخش می‌شوند و تعداد ردیف‌ها، UPDATEها و ارسال‌های وب‌سوکت با حالت
+# بدون ادغام (یک INSERT و یک ارسال برای هر رویداد) مقایسه می‌شود.
+#
+# اجرا (از ریشه پروژه):
+#   python -m benchmarks.notification_coalescing --events 50000 --promises 200 --seconds 10
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.seed import DatasetSize
+
+
+async def run(events: int, promises: int, users: int, seconds: float, seed: int) -> dict:
+    from app import models
+    from app.database import SessionLocal, engine
+    from app.managers.notifications_manager import manager
+    from app.services.notification_coalescer import coalescer
+    from benchmarks.seed import seed_dataset
+
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        seed_dataset(db, DatasetSize(users=users, promises=0, validations=0, conversations=0, messages=0,
+                                     store_items=0, notifications=0), random.Random(seed))
+    finally:
+        db.close()
+
+    rng = random.Random(seed)
+    owners = {promise_id: rng.randint(1, users) for promise_id in range(1, promises + 1)}
+    weights = [1 / rank for rank in range(1, promises + 1)]
+    targets = rng.choices(range(1, promises + 1), weights=weights, k=events)
+
+    pushed = 0
+    send_many = manager.send_many
+
+    async def counting_send_many(messages):
+        nonlocal pushed
+        messages = list(messages)
+        pushed += len(messages)
+        await send_many(messages)
+
+    manager.send_many = counting_send_many
+    await manager.start()
+    await coalescer.start()
+    try:
+        started = time.perf_counter()
+        # رویدادها در طول seconds ثانیه و در بسته‌های ۱۰ میلی‌ثانیه‌ای پخش می‌شوند
+        ticks = max(int(seconds * 100), 1)
+        per_tick = max(events // ticks, 1)
+        for offset in range(0, events, per_tick):
+            for promise_id in targets[offset:offset + per_tick]:
+                coalescer.add(owners[promise_id], models.NotificationType.VOUCH_RECEIVED, promise_id, f"promise {promise_id}")
+            await asyncio.sleep(0.01)
+        await coalescer.stop()
+        elapsed = time.perf_counter() - started
+    finally:
+        await coalescer.stop()
+        await manager.stop()
+        manager.send_many = send_many
+
+    stats = coalescer.stats()
+    db = SessionLocal()
+    try:
+        rows = db.query(models.Notification).count()
+    finally:
+        db.close()
+    return {
+        "db": engine.dialect.name,
+        "events": events,
+        "promises": promises,
+        "seconds": round(elapsed, 2),
+        "notification_rows": rows,
+        "row_writes": stats["inserted"] + stats["merged"],
+        "flushes": stats["flushes"],
+        "pushes": pushed,
+        "write_reduction": round(events / max(stats["inserted"] + stats["merged"], 1), 1),
+        "push_reduction": round(events / max(pushed, 1), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification coalescing write/push volume benchmark")
+    parser.add_argument("--db-url", default=None, help="sync URL; defaults to a fresh temporary SQLite file")
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--promises", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10.0, help="how long the events are spread over")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_coalesce.db")
+    print(json.dumps(asyncio.run(run(args.events, args.promises, args.users, args.seconds, args.seed)), indent=2))
+
+
+if __name__ == "__main__":
+    main()